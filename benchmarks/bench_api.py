@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API 基准：测量各接口延迟随环境数量的变化
+- 每个规模启动一个独立的 uvicorn 服务，conda 替换为 fake_conda.py（离线、可复现）
+- 测量：GET /envs、GET /tasks/{id}、GET /logs、创建/克隆/删除的提交延迟、导出延迟
+- 结果写入 JSON 基线；--compare 与旧基线对比，超过容差时以非 0 退出
+- 用法：
+    python benchmarks/bench_api.py --sizes 10 100 1000 5000 --output bench_baseline.json
+    python benchmarks/bench_api.py --compare bench_baseline.json --tolerance 0.2
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import fake_conda  # noqa: E402
+
+
+# ========================
+# HTTP 工具
+# ========================
+def request(base_url: str, method: str, path: str, body: dict = None):
+    """发送请求，返回 (状态码, 解析后的 JSON, 耗时毫秒)"""
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(base_url + path, data=data, method=method,
+                                 headers={"Content-Type": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=600) as resp:
+            payload = resp.read()
+            status = resp.status
+    except urllib.error.HTTPError as e:
+        payload = e.read()
+        status = e.code
+    elapsed = (time.perf_counter() - start) * 1000
+    try:
+        return status, json.loads(payload or b"null"), elapsed
+    except ValueError:
+        return status, None, elapsed
+
+
+def wait_task(base_url: str, task_id: str, timeout: float = 120):
+    """等待后台任务结束（不计入测量）"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        _, data, _ = request(base_url, "GET", f"/tasks/{task_id}")
+        if data and data.get("status") in ("completed", "failed"):
+            return data
+        time.sleep(0.05)
+    raise Exception(f"任务 {task_id} 超时未完成")
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "n": len(samples),
+        "min_ms": round(ordered[0], 2),
+        "p50_ms": round(statistics.median(ordered), 2),
+        "mean_ms": round(statistics.fmean(ordered), 2),
+        "max_ms": round(ordered[-1], 2),
+    }
+
+
+# ========================
+# 服务生命周期
+# ========================
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(root: str, latency: str):
+    port = free_port()
+    env = dict(os.environ, **fake_conda.fake_conda_env(root), FAKE_CONDA_LATENCY=latency)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main_api:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            request(base_url, "GET", "/logs")
+            return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise Exception("服务启动超时")
+
+
+# ========================
+# 基准
+# ========================
+def bench_size(size: int, repeat: int, latency: str) -> dict:
+    with tempfile.TemporaryDirectory(prefix="bench_conda_") as root:
+        os.environ["FAKE_CONDA_ROOT"] = root
+        fake_conda.populate(size)
+        process, base_url = start_server(root, latency)
+        try:
+            samples = {}
+
+            def measure(name, method, path, body=None, expect=200):
+                status, data, elapsed = request(base_url, method, path, body)
+                if status != expect:
+                    raise Exception(f"{name} 返回 {status}: {data}")
+                samples.setdefault(name, []).append(elapsed)
+                return data
+
+            request(base_url, "GET", "/envs")  # 预热
+            task_id = None
+            for i in range(repeat):
+                measure("GET /envs", "GET", "/envs")
+                measure("GET /logs", "GET", "/logs")
+
+                data = measure("POST /envs", "POST", "/envs", {"name": f"bench_new_{i}", "python_version": "3.11"})
+                wait_task(base_url, data["task_id"])
+                task_id = data["task_id"]
+
+                data = measure("POST /envs/clone", "POST", "/envs/clone",
+                               {"source_env": "env_00000", "new_env": f"bench_clone_{i}"})
+                wait_task(base_url, data["task_id"])
+
+                data = measure("DELETE /envs/{name}", "DELETE", f"/envs/bench_clone_{i}")
+                wait_task(base_url, data["task_id"])
+
+                measure("POST /envs/export", "POST", "/envs/export", {
+                    "env_name": "env_00000",
+                    "output_file": os.path.join(root, "export.yml"),
+                    "output_md": os.path.join(root, "export.md"),
+                })
+
+            for _ in range(repeat * 10):
+                measure("GET /tasks/{id}", "GET", f"/tasks/{task_id}")
+
+            return {name: summarize(values) for name, values in samples.items()}
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def compare(current: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> bool:
+    """按 p50 对比，返回是否全部在容差内（绝对变化小于 min_delta_ms 的视为噪声）"""
+    ok = True
+    print(f"{'规模':>6}  {'接口':<22} {'基线 p50':>10} {'当前 p50':>10} {'变化':>8}")
+    for size, endpoints in current["results"].items():
+        for name, stats in endpoints.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if not old:
+                print(f"{size:>6}  {name:<22} {'-':>10} {stats['p50_ms']:>10.2f} {'新增':>8}")
+                continue
+            change = (stats["p50_ms"] - old["p50_ms"]) / max(old["p50_ms"], 0.01)
+            regressed = change > tolerance and stats["p50_ms"] - old["p50_ms"] > min_delta_ms
+            ok = ok and not regressed
+            mark = " ❌" if regressed else ""
+            print(f"{size:>6}  {name:<22} {old['p50_ms']:>10.2f} {stats['p50_ms']:>10.2f} {change:>+8.0%}{mark}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API 基准（基于 fake_conda）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--latency", default="list=0,info=0,create=0,clone=0,remove=0,export=0",
+                        help="传给 FAKE_CONDA_LATENCY，默认全部为 0，只测服务自身开销")
+    parser.add_argument("--output", "-o", help="结果写入的 JSON 文件")
+    parser.add_argument("--compare", "-c", help="与之对比的基线 JSON 文件")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的 p50 退化比例")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="小于该绝对变化的退化视为噪声")
+    args = parser.parse_args()
+
+    current = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "repeat": args.repeat,
+            "latency": args.latency,
+        },
+        "results": {},
+    }
+    for size in args.sizes:
+        print(f"⏳ 正在测量 {size} 个环境...", flush=True)
+        current["results"][str(size)] = bench_size(size, args.repeat, args.latency)
+        for name, stats in current["results"][str(size)].items():
+            print(f"   {name:<22} p50={stats['p50_ms']:.2f} ms  max={stats['max_ms']:.2f} ms")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(current, f, ensure_ascii=False, indent=2)
+        print(f"✅ 结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        sys.exit(0 if compare(current, baseline, args.tolerance, args.min_delta_ms) else 1)
+
+
+if __name__ == "__main__":
+    main()
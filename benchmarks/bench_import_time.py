@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+启动耗时基准：守护命令行导出模式的启动延迟
+- 对比裸解释器启动，测量各入口的额外启动耗时（取中位数）
+- 检查命令行模式没有导入 FastAPI / pydantic / Starlette
+- 超过阈值时以非 0 退出，可直接放进 CI
+- 用法：python benchmarks/bench_import_time.py --runs 10 --max-overhead-ms 150
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 命令行模式下不允许出现的 Web 组件
+WEB_MODULES = ("fastapi", "pydantic", "starlette", "uvicorn")
+
+# 名称 → 命令行参数；"-e x --help" 会走导出分流后由 argparse 直接退出，不会调用 conda
+TARGETS = {
+    "conda_export_env --help": ["conda_export_env.py", "--help"],
+    "main_api -e x --help": ["main_api.py", "-e", "x", "--help"],
+}
+
+
+def time_command(args, runs: int) -> float:
+    """多次运行命令，返回耗时中位数（毫秒）"""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, cwd=REPO_DIR, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.DEVNULL, check=True)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def imported_web_modules(args) -> list:
+    """通过 -X importtime 找出命令实际导入的 Web 组件"""
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=REPO_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    found = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        module = line.rsplit("|", 1)[1].strip()
+        if module.split(".")[0] in WEB_MODULES:
+            found.add(module.split(".")[0])
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动耗时基准")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-overhead-ms", type=float, default=150.0,
+                        help="相对裸解释器允许的最大额外启动耗时")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    bare = time_command(["-c", "pass"], args.runs)
+    results = {"python_startup_ms": round(bare, 1), "targets": {}}
+    failed = False
+    for name, cmd in TARGETS.items():
+        median_ms = time_command(cmd, args.runs)
+        overhead = median_ms - bare
+        web = imported_web_modules(cmd)
+        ok = overhead <= args.max_overhead_ms and not web
+        failed = failed or not ok
+        results["targets"][name] = {
+            "median_ms": round(median_ms, 1),
+            "overhead_ms": round(overhead, 1),
+            "web_modules": web,
+            "ok": ok,
+        }
+
+    if args.json:
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+    else:
+        print(f"裸解释器启动: {bare:.1f} ms")
+        for name, r in results["targets"].items():
+            mark = "✅" if r["ok"] else "❌"
+            web = f"，导入了 Web 组件: {', '.join(r['web_modules'])}" if r["web_modules"] else ""
+            print(f"{mark} {name}: {r['median_ms']:.1f} ms（额外 {r['overhead_ms']:.1f} ms）{web}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+并发压测：模拟大量运维人员与 CI 同时访问服务
+- 异步虚拟用户按配置的比例发送 list / create / clone / delete / export / poll 请求
+- 输出每个接口的吞吐、错误数与 p50/p95/p99 延迟
+- 事件循环延迟：压测端自身循环延迟（确认压测端不是瓶颈），
+  以及服务端探针（定期请求开销极小的 /tasks/{id}，其延迟反映服务端事件循环的排队情况）
+- 只依赖标准库；服务需已启动（建议配合 fake_conda.py）
+- 用法：
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --users 50 --duration 60 \
+        --mix list=50,poll=30,create=5,clone=5,delete=5,export=5
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from urllib.parse import urlsplit
+
+DEFAULT_MIX = "list=50,poll=30,create=5,clone=5,delete=5,export=5"
+
+
+# ========================
+# 最小 HTTP/1.1 客户端（keep-alive）
+# ========================
+class HttpConnection:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, body: dict = None):
+        """发送请求，返回 (状态码, JSON)；连接断开时自动重连一次"""
+        for attempt in range(2):
+            try:
+                if self.writer is None:
+                    self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+                return await self._request(method, path, body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                self.close()
+                if attempt:
+                    raise
+
+    async def _request(self, method: str, path: str, body: dict = None):
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n")
+        self.writer.write(head.encode("latin-1") + payload)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b"\r\n")
+            if line == b"\r\n":
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            headers[key.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding") == "chunked":
+            data = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).strip(), 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                data += chunk[:-2]
+        else:
+            data = await self.reader.readexactly(int(headers.get("content-length", "0")))
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        try:
+            return status, json.loads(data) if data else None
+        except ValueError:
+            return status, None
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+# ========================
+# 统计
+# ========================
+def percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}  # {接口: [毫秒]}
+        self.errors = {}     # {接口: 次数}
+
+    def record(self, endpoint: str, elapsed_ms: float, ok: bool):
+        self.latencies.setdefault(endpoint, []).append(elapsed_ms)
+        if not ok:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        result = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            ordered = sorted(values)
+            result[endpoint] = {
+                "count": len(values),
+                "errors": self.errors.get(endpoint, 0),
+                "rps": round(len(values) / duration, 2),
+                "p50_ms": round(percentile(ordered, 50), 2),
+                "p95_ms": round(percentile(ordered, 95), 2),
+                "p99_ms": round(percentile(ordered, 99), 2),
+                "max_ms": round(ordered[-1], 2),
+            }
+        return result
+
+
+# ========================
+# 虚拟用户
+# ========================
+class LoadTest:
+    def __init__(self, url: str, mix: dict, users: int, duration: float, export_dir: str):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.mix = mix
+        self.users = users
+        self.duration = duration
+        self.export_dir = export_dir
+        self.stats = Stats()
+        self.env_names = []   # 最近一次 /envs 返回的环境名
+        self.created = []     # 本次压测创建的环境，供 delete 使用
+        self.task_ids = []    # 已提交任务，供 poll 使用
+        self.loop_lag = []    # 压测端事件循环延迟（毫秒）
+        self.server_probe = []  # 服务端探针延迟（毫秒）
+        self.deadline = 0.0
+
+    async def call(self, conn: HttpConnection, endpoint: str, method: str, path: str, body: dict = None):
+        start = time.perf_counter()
+        try:
+            status, data = await conn.request(method, path, body)
+            ok = status < 400
+        except Exception:
+            status, data, ok = 0, None, False
+        self.stats.record(endpoint, (time.perf_counter() - start) * 1000, ok)
+        return status, data
+
+    async def do_list(self, conn, uid, seq):
+        status, data = await self.call(conn, "GET /envs", "GET", "/envs")
+        if status == 200 and isinstance(data, list):
+            self.env_names = [env["name"] for env in data if "name" in env]
+
+    async def do_poll(self, conn, uid, seq):
+        task_id = random.choice(self.task_ids) if self.task_ids else "unknown"
+        await self.call(conn, "GET /tasks/{id}", "GET", f"/tasks/{task_id}")
+
+    async def do_create(self, conn, uid, seq):
+        name = f"load_{uid}_{seq}"
+        status, data = await self.call(conn, "POST /envs", "POST", "/envs", {"name": name, "python_version": "3.12"})
+        if status == 200:
+            self.task_ids.append(data["task_id"])
+            self.created.append(name)
+
+    async def do_clone(self, conn, uid, seq):
+        if not self.env_names:
+            return await self.do_list(conn, uid, seq)
+        name = f"load_{uid}_{seq}_clone"
+        status, data = await self.call(conn, "POST /envs/clone", "POST", "/envs/clone",
+                                       {"source_env": random.choice(self.env_names), "new_env": name})
+        if status == 200:
+            self.task_ids.append(data["task_id"])
+            self.created.append(name)
+
+    async def do_delete(self, conn, uid, seq):
+        if not self.created:
+            return await self.do_list(conn, uid, seq)
+        name = self.created.pop(random.randrange(len(self.created)))
+        status, data = await self.call(conn, "DELETE /envs/{name}", "DELETE", f"/envs/{name}")
+        if status == 200:
+            self.task_ids.append(data["task_id"])
+
+    async def do_export(self, conn, uid, seq):
+        if not self.env_names:
+            return await self.do_list(conn, uid, seq)
+        await self.call(conn, "POST /envs/export", "POST", "/envs/export", {
+            "env_name": random.choice(self.env_names),
+            "output_file": os.path.join(self.export_dir, f"{uid}.yml"),
+            "output_md": os.path.join(self.export_dir, f"{uid}.md"),
+        })
+
+    async def user(self, uid: int):
+        conn = HttpConnection(self.host, self.port)
+        ops = list(self.mix)
+        weights = [self.mix[op] for op in ops]
+        seq = 0
+        try:
+            while time.perf_counter() < self.deadline:
+                seq += 1
+                op = random.choices(ops, weights)[0]
+                await getattr(self, f"do_{op}")(conn, uid, seq)
+        finally:
+            conn.close()
+
+    async def monitor_loop_lag(self, interval: float = 0.1):
+        while time.perf_counter() < self.deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.loop_lag.append(max(0.0, (time.perf_counter() - start - interval) * 1000))
+
+    async def probe_server(self, interval: float = 0.5):
+        conn = HttpConnection(self.host, self.port)
+        try:
+            while time.perf_counter() < self.deadline:
+                start = time.perf_counter()
+                try:
+                    await conn.request("GET", "/tasks/__probe__")
+                    self.server_probe.append((time.perf_counter() - start) * 1000)
+                except Exception:
+                    pass
+                await asyncio.sleep(interval)
+        finally:
+            conn.close()
+
+    async def run(self) -> dict:
+        self.deadline = time.perf_counter() + self.duration
+        start = time.perf_counter()
+        await asyncio.gather(
+            self.monitor_loop_lag(),
+            self.probe_server(),
+            *(self.user(uid) for uid in range(self.users)),
+        )
+        elapsed = time.perf_counter() - start
+        endpoints = self.stats.summary(elapsed)
+        total = sum(e["count"] for e in endpoints.values())
+        return {
+            "users": self.users,
+            "duration_s": round(elapsed, 2),
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 2),
+            "endpoints": endpoints,
+            "client_loop_lag_ms": lag_summary(self.loop_lag),
+            "server_probe_ms": lag_summary(self.server_probe),
+        }
+
+
+def lag_summary(values: list) -> dict:
+    ordered = sorted(values)
+    return {
+        "p50": round(percentile(ordered, 50), 2),
+        "p95": round(percentile(ordered, 95), 2),
+        "p99": round(percentile(ordered, 99), 2),
+        "max": round(ordered[-1], 2) if ordered else 0.0,
+    }
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for item in value.split(","):
+        op, _, weight = item.partition("=")
+        if op.strip() not in ("list", "poll", "create", "clone", "delete", "export"):
+            raise SystemExit(f"未知的请求类型: {op}")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def print_report(report: dict):
+    print(f"\n用户数 {report['users']}，持续 {report['duration_s']} s，"
+          f"共 {report['requests']} 个请求，吞吐 {report['throughput_rps']} req/s\n")
+    print(f"{'接口':<22} {'次数':>7} {'错误':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for endpoint, s in report["endpoints"].items():
+        print(f"{endpoint:<22} {s['count']:>7} {s['errors']:>6} {s['rps']:>8} "
+              f"{s['p50_ms']:>9} {s['p95_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    for title, key in (("压测端事件循环延迟", "client_loop_lag_ms"), ("服务端探针延迟", "server_probe_ms")):
+        lag = report[key]
+        print(f"\n{title}（ms）: p50={lag['p50']} p95={lag['p95']} p99={lag['p99']} max={lag['max']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="并发压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="请求比例，如 list=50,poll=30,create=5")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    with tempfile.TemporaryDirectory(prefix="load_export_") as export_dir:
+        test = LoadTest(args.url, parse_mix(args.mix), args.users, args.duration, export_dir)
+        report = asyncio.run(test.run())
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Conda 后端：统一封装“列出环境 / 查询元数据 / 执行命令”
+- SubprocessCondaBackend：每次调用都启动 conda 子进程（任何 Python 环境都可用）
+- InProcessCondaBackend：服务运行在 conda base 环境时，直接调用 conda.base.context /
+  conda.core.envs_manager / PrefixData，省去解释器与 conda 的启动开销；
+  会修改环境的命令（create/remove 等）仍走子进程
+- 两种后端执行命令时都可以交给常驻工作进程池（见 conda_worker_pool.py）
+- get_conda_backend() 自动选择：conda 可导入时用进程内后端，
+  可用环境变量 CONDA_BACKEND=auto|inprocess|subprocess 强制指定
+"""
+
+import os
+import json
+import threading
+import subprocess
+import importlib.util
+from typing import List, Optional
+from conda_metrics import CondaCommandTimer
+from conda_runner import INACTIVITY_TIMEOUT, CondaTimeout, run_streaming
+
+
+class SubprocessCondaBackend:
+    """通过 conda 子进程完成所有操作"""
+
+    name = "subprocess"
+
+    def __init__(self, conda_exe: str, pool=None):
+        self.conda_exe = conda_exe
+        # 可选的常驻 conda 工作进程池（conda_worker_pool.CondaWorkerPool），省去每次启动 conda 的开销
+        self.pool = pool
+
+    def run(self, args: List[str], timeout: Optional[float] = None) -> str:
+        """
+        统一执行 conda 命令
+        子进程按连续无输出时长判断超时（见 conda_runner），timeout 为可选的总时长上限；
+        工作进程池只在命令结束时返回结果，以 timeout（默认 CONDA_INACTIVITY_TIMEOUT）为上限
+        """
+        try:
+            with CondaCommandTimer(args):
+                if self.pool is not None:
+                    result = self.pool.run(args, timeout=timeout or INACTIVITY_TIMEOUT)
+                else:
+                    result = run_streaming([self.conda_exe] + args, max_runtime=timeout, keep_output=True)
+                if result.returncode != 0:
+                    raise subprocess.CalledProcessError(result.returncode, args, result.stdout, result.stderr)
+            return result.stdout
+        except subprocess.TimeoutExpired:
+            raise Exception(f"命令执行超时（超过 {timeout or INACTIVITY_TIMEOUT:g} 秒）")
+        except CondaTimeout as e:
+            raise Exception(str(e))
+        except subprocess.CalledProcessError as e:
+            stderr = e.stderr.strip() if e.stderr else ""
+            stdout = e.stdout.strip() if e.stdout else ""
+            raise Exception(f"Conda 命令失败: {stderr or stdout}")
+        except FileNotFoundError:
+            raise Exception("未找到 conda 命令，请确保 Anaconda 已正确安装并加入 PATH")
+
+    def run_json(self, args: List[str]) -> dict:
+        """执行带 --json 的 conda 命令并解析输出（兼容 BOM 与尾部杂质）"""
+        output = self.run(args).strip()
+        if output.startswith('\ufeff'):
+            output = output[1:]
+        if '}' in output:
+            last_brace = output.rfind('}')
+            output = output[:last_brace + 1]
+        return json.loads(output)
+
+    def list_env_paths(self) -> List[str]:
+        """所有环境前缀（含 base），与 `conda env list --json` 的 envs 一致"""
+        return self.run_json(["env", "list", "--json"]).get("envs", [])
+
+    def get_python_version(self, prefix: str) -> str:
+        """获取环境的 Python 版本"""
+        python_exe = os.path.join(prefix, "python.exe") if os.name == 'nt' else os.path.join(prefix, "bin", "python")
+        if not os.path.exists(python_exe):
+            return "无 Python"
+        try:
+            result = subprocess.run([python_exe, "--version"], capture_output=True, text=True, timeout=5)
+            if result.returncode == 0 and result.stdout.startswith("Python "):
+                return result.stdout.strip()[7:].split()[0]
+        except Exception:
+            pass
+        return "未知"
+
+    def get_info(self) -> dict:
+        """conda 基本配置：root_prefix / envs_dirs / pkgs_dirs / platform / solver"""
+        info = self.run_json(["info", "--json"])
+        solver = info.get("solver")
+        return {
+            "root_prefix": info.get("root_prefix"),
+            "envs_dirs": info.get("envs_dirs", []),
+            "pkgs_dirs": info.get("pkgs_dirs", []),
+            "platform": info.get("platform"),
+            # 较新的 conda 为 {"name": "libmamba", ...}，旧版本没有该字段
+            "solver": (solver.get("name") if isinstance(solver, dict) else solver) or "classic",
+        }
+
+
+class InProcessCondaBackend(SubprocessCondaBackend):
+    """在当前进程内调用 conda 的 Python API 完成只读查询"""
+
+    name = "inprocess"
+
+    def __init__(self, conda_exe: str, pool=None):
+        super().__init__(conda_exe, pool)
+        # 按 .condarc 与环境变量初始化 context（envs_dirs / pkgs_dirs 等），与 conda 命令行看到的配置一致
+        from conda.base.context import reset_context
+        reset_context()
+        # conda 的 context / PrefixData 缓存是进程级全局状态，查询需串行
+        self._lock = threading.Lock()
+        # {prefix: (conda-meta 的 mtime, PrefixData)}，conda-meta 变化时才重新加载
+        self._prefix_cache = {}
+
+    def _prefix_data(self, prefix: str):
+        from conda.core.prefix_data import PrefixData
+        meta_dir = os.path.join(prefix, "conda-meta")
+        mtime = os.stat(meta_dir).st_mtime_ns
+        cached = self._prefix_cache.get(prefix)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        pd = PrefixData(prefix)
+        pd.reload()
+        self._prefix_cache[prefix] = (mtime, pd)
+        return pd
+
+    def list_env_paths(self) -> List[str]:
+        from conda.core.envs_manager import list_all_known_prefixes
+        with self._lock:
+            return list(list_all_known_prefixes())
+
+    def get_python_version(self, prefix: str) -> str:
+        try:
+            with self._lock:
+                record = self._prefix_data(prefix).get("python", None)
+        except FileNotFoundError:
+            # 没有 conda-meta 的目录不是 conda 管理的前缀，退回探测解释器
+            return super().get_python_version(prefix)
+        return record.version if record else "无 Python"
+
+    def get_info(self) -> dict:
+        from conda.base.context import context
+        with self._lock:
+            return {
+                "root_prefix": context.root_prefix,
+                "envs_dirs": list(context.envs_dirs),
+                "pkgs_dirs": list(context.pkgs_dirs),
+                "platform": context.subdir,
+                "solver": str(getattr(context, "solver", "") or "classic"),
+            }
+
+
+def conda_importable() -> bool:
+    """当前解释器能否导入 conda（即是否运行在 conda base 环境中）"""
+    return importlib.util.find_spec("conda") is not None
+
+
+def get_conda_backend(conda_exe: str, pool=None) -> SubprocessCondaBackend:
+    """按 CONDA_BACKEND 环境变量与 conda 可用性选择后端"""
+    choice = os.environ.get("CONDA_BACKEND", "auto").lower()
+    if choice == "subprocess":
+        return SubprocessCondaBackend(conda_exe, pool)
+    if choice == "inprocess" or (choice == "auto" and conda_importable()):
+        return InProcessCondaBackend(conda_exe, pool)
+    return SubprocessCondaBackend(conda_exe, pool)
@@ -1,10 +1,10 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import subprocess
 import sys
 import os
 import re
 from pathlib import Path
+from conda_runner import run_streaming
 
 
 def remove_ansi_escape(text: str) -> str:
@@ -56,11 +56,15 @@ class CondaCloneApp:
         # 备用：依赖 PATH
         return "conda"
 
-    def run_conda_cmd(self, args):
-        """安全执行 conda 命令"""
+    def run_conda_cmd(self, args, on_line=None):
+        """
+        安全执行 conda 命令（长时间无输出才视为超时，见 conda_runner）；
+        给出 on_line 时实时回调输出，不再保留完整输出，失败时 err 为末尾若干行
+        """
         try:
-            cmd = [self.conda_exe] + args
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=500)
+            result = run_streaming([self.conda_exe] + args, on_line, keep_output=on_line is None)
+            if on_line is not None:
+                return result.returncode, "", result.error_detail() if result.returncode != 0 else ""
             return result.returncode, result.stdout, result.stderr
         except Exception as e:
             return -1, "", str(e)
@@ -120,9 +124,14 @@ class CondaCloneApp:
         self.root.update_idletasks()
 
         # 执行克隆命令
+        def on_line(line):
+            self.log_text.insert(tk.END, remove_ansi_escape(line) + "\n")
+            self.log_text.see(tk.END)
+            self.root.update_idletasks()
+
         code, out, err = self.run_conda_cmd([
             "create", "--name", new_env, "--clone", old_env, "--yes"
-        ])
+        ], on_line)
 
         if code == 0:
             self.log_text.insert(tk.END, "✅ 克隆成功！\n")
@@ -132,8 +141,6 @@ class CondaCloneApp:
             self.log_text.insert(tk.END, "❌ 克隆失败！\n")
             if err.strip():
                 self.log_text.insert(tk.END, f"错误: {err}\n")
-            if out.strip():
-                self.log_text.insert(tk.END, f"输出: {out}\n")
             messagebox.showerror("失败", "克隆失败，请查看下方日志。")
 
         self.clone_btn.config(state="normal")
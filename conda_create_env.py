@@ -13,6 +13,7 @@ import subprocess
 import threading
 import json
 import os
+from conda_runner import CondaTimeout, run_streaming
 
 
 class CondaEnvCreator:
@@ -80,27 +81,17 @@ class CondaEnvCreator:
         self.log_text.see(tk.END)
         self.log_text.config(state='disabled')
 
-    def run_conda_cmd(self, args):
+    def run_conda_cmd(self, args, on_line=None):
+        """执行 conda 命令；给出 on_line 时实时逐行回调输出（只保留末尾若干行），否则返回完整 stdout"""
         try:
-            result = subprocess.run(
-                ["conda"] + args,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='replace',
-                check=True,
-                timeout=60
-            )
-            return result.stdout
-        except subprocess.TimeoutExpired:
-            raise Exception("命令执行超时（超过 60 秒）")
-        except subprocess.CalledProcessError as e:
-            stderr = e.stderr.strip() if e.stderr else ""
-            stdout = e.stdout.strip() if e.stdout else ""
-            msg = f"Conda 命令失败:\nSTDERR: {stderr}\nSTDOUT: {stdout}"
-            raise Exception(msg)
+            result = run_streaming(["conda"] + args, on_line, keep_output=on_line is None)
+        except CondaTimeout as e:
+            raise Exception(f"命令执行超时：{e}")
         except FileNotFoundError:
             raise Exception("未找到 conda 命令，请确保 Anaconda 已正确安装并加入 PATH")
+        if result.returncode != 0:
+            raise Exception(f"Conda 命令失败:\n{result.error_detail()}")
+        return result.stdout
 
     def load_existing_envs(self):
         """启动后台线程加载环境列表"""
@@ -216,7 +207,8 @@ class CondaEnvCreator:
 
     def _create_env_in_background(self, env_name, python_version):
         try:
-            self.run_conda_cmd(["create", "--name", env_name, f"python={python_version}","--yes"])
+            self.run_conda_cmd(["create", "--name", env_name, f"python={python_version}", "--yes"],
+                               on_line=lambda line: self.root.after(0, self.log, line))
             self.root.after(0, lambda: self.log(f"✅ 环境 '{env_name}' 创建成功！"))
             self.root.after(0, self.load_existing_envs)  # 刷新列表
         except Exception as e:
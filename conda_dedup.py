@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+跨环境的相同文件去重
+- 扫描各环境目录，按 (设备, 大小, 权限, 属主) 分组；同组中有多个不同 inode 的文件才计算哈希
+  （线程池并行计算，hashlib 在读入大块数据时释放 GIL），哈希相同即为重复
+- 每组保留链接数最多的 inode（通常已与 pkgs 缓存共享），其余文件替换为指向它的硬链接，
+  或 reflink（写时复制，Linux 上需文件系统支持 FICLONE，如 btrfs / xfs）
+- 替换是原子的：先在同一目录下生成临时链接再 os.replace；替换前再次确认文件的大小与修改时间未变
+- dry_run 只报告可回收的字节数，不修改任何文件；被扫描范围之外的路径（如 pkgs 缓存）硬链接着的 inode
+  即使被替换也不会释放空间，不计入可回收字节数
+- 不处理符号链接、conda-meta（会被原地追加）以及小于 min_size 的文件
+"""
+
+import os
+import stat
+import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+DEDUP_HASH_WORKERS = int(os.environ.get("DEDUP_HASH_WORKERS", str(min(32, (os.cpu_count() or 1) * 2))))
+DEDUP_MIN_SIZE = int(os.environ.get("DEDUP_MIN_SIZE", "4096"))
+SKIPPED_DIRS = ("conda-meta",)
+# linux/fs.h：FICLONE = _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+# 报告中列出的最大重复组数
+TOP_GROUPS = 20
+
+
+def _hash_file(path: str) -> Optional[str]:
+    digest = hashlib.blake2b(digest_size=32)
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def scan_files(prefixes: Dict[str, str], min_size: int) -> Dict[tuple, Dict[tuple, Dict]]:
+    """
+    扫描 {环境名: 目录}，返回 {(设备, 大小, 权限, uid, gid): {(设备, inode): {"paths": [(环境名, 路径)], "nlink", "mtime"}}}
+    同一 inode 的多个路径（已是硬链接）只算一份
+    """
+    groups: Dict[tuple, Dict[tuple, Dict]] = {}
+    for env, prefix in prefixes.items():
+        for root, dirs, files in os.walk(prefix):
+            if root == prefix:
+                dirs[:] = [d for d in dirs if d not in SKIPPED_DIRS]
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.lstat(path)
+                except OSError:
+                    continue
+                if not stat.S_ISREG(st.st_mode) or st.st_size < min_size:
+                    continue
+                key = (st.st_dev, st.st_size, st.st_mode, st.st_uid, st.st_gid)
+                inode = groups.setdefault(key, {}).setdefault(
+                    (st.st_dev, st.st_ino), {"paths": [], "nlink": st.st_nlink, "mtime": st.st_mtime_ns})
+                inode["paths"].append((env, path))
+    return groups
+
+
+def find_duplicates(prefixes: Dict[str, str], min_size: int = DEDUP_MIN_SIZE, workers: int = DEDUP_HASH_WORKERS,
+                    progress_cb: Optional[Callable[[int, str], None]] = None) -> Dict:
+    """
+    查找跨环境（及环境内）的重复文件，返回
+    {"files", "bytes", "hashed", "groups": [{"size", "keep": inode, "duplicates": [inode...]}], ...}
+    其中 inode 为 scan_files() 的条目；progress_cb(百分比, 阶段描述) 报告哈希进度
+    """
+    if progress_cb:
+        progress_cb(0, "正在扫描文件...")
+    groups = scan_files(prefixes, min_size)
+    files = sum(len(inode["paths"]) for inodes in groups.values() for inode in inodes.values())
+    total_bytes = sum(key[1] * len(inodes) for key, inodes in groups.items())
+
+    # 同一分组中只有一个 inode 的文件不可能有重复，不必计算哈希
+    candidates = [(key, ino, inode) for key, inodes in groups.items() if len(inodes) > 1
+                  for ino, inode in inodes.items()]
+    digests: Dict[tuple, Optional[str]] = {}
+    if candidates:
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="dedup-hash") as pool:
+            futures = [(ino, pool.submit(_hash_file, inode["paths"][0][1])) for _, ino, inode in candidates]
+            for done, (ino, future) in enumerate(futures, 1):
+                digests[ino] = future.result()
+                if progress_cb and done % 200 == 0:
+                    progress_cb(int(done * 100 / len(futures)), f"正在计算哈希: {done}/{len(futures)}")
+
+    by_digest: Dict[tuple, List[Dict]] = {}
+    for key, ino, inode in candidates:
+        if digests.get(ino):
+            by_digest.setdefault((key, digests[ino]), []).append(dict(inode, ino=ino))
+    result_groups = []
+    for (key, digest), inodes in by_digest.items():
+        if len(inodes) < 2:
+            continue
+        inodes.sort(key=lambda inode: inode["nlink"], reverse=True)
+        result_groups.append({"size": key[1], "digest": digest, "keep": inodes[0], "duplicates": inodes[1:]})
+    result_groups.sort(key=lambda group: group["size"] * len(group["duplicates"]), reverse=True)
+    return {"files": files, "bytes": total_bytes, "hashed": len(candidates), "groups": result_groups}
+
+
+def _frees_space(inode: Dict) -> bool:
+    """inode 的所有链接都在扫描范围内时，替换掉它们才能释放空间"""
+    return inode["nlink"] <= len(inode["paths"])
+
+
+def _reflink(source: str, target: str):
+    if fcntl is None:
+        raise OSError("当前平台不支持 reflink")
+    with open(source, "rb") as src, open(target, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+def replace_with_link(keep: str, path: str, size: int, mtime: int, mode: str = "hardlink"):
+    """把 path 原子地替换为 keep 的硬链接 / reflink；path 自扫描以来有变化时抛出 OSError"""
+    st = os.lstat(path)
+    if st.st_size != size or st.st_mtime_ns != mtime:
+        raise OSError("文件在扫描后被修改")
+    tmp = os.path.join(os.path.dirname(path), f".dedup-{uuid.uuid4().hex[:8]}")
+    try:
+        if mode == "reflink":
+            _reflink(keep, tmp)
+            os.chmod(tmp, st.st_mode & 0o7777)
+            if hasattr(os, "chown") and (st.st_uid, st.st_gid) != (os.getuid(), os.getgid()):
+                os.chown(tmp, st.st_uid, st.st_gid)
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        else:
+            os.link(keep, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def deduplicate(prefixes: Dict[str, str], dry_run: bool = True, mode: str = "hardlink",
+                min_size: int = DEDUP_MIN_SIZE, workers: int = DEDUP_HASH_WORKERS,
+                progress_cb: Optional[Callable[[int, str], None]] = None) -> Dict:
+    """
+    去重并返回报告：扫描的文件数 / 字节数、重复组数与文件数、可回收（dry_run）或已回收的字节数、
+    按环境统计的可回收字节数、最大的若干重复组，以及替换失败的文件
+    """
+    if mode not in ("hardlink", "reflink"):
+        raise ValueError(f"不支持的去重方式: {mode}")
+    found = find_duplicates(prefixes, min_size, workers,
+                            (lambda pct, stage: progress_cb(pct * 8 // 10, stage)) if progress_cb else None)
+    groups = found["groups"]
+    by_env: Dict[str, int] = {}
+    reclaimable = duplicate_files = 0
+    for group in groups:
+        for inode in group["duplicates"]:
+            duplicate_files += len(inode["paths"])
+            if _frees_space(inode):
+                reclaimable += group["size"]
+                env = inode["paths"][0][0]
+                by_env[env] = by_env.get(env, 0) + group["size"]
+
+    reclaimed, errors = 0, []
+    if not dry_run:
+        for done, group in enumerate(groups, 1):
+            keep = group["keep"]["paths"][0][1]
+            try:
+                st = os.lstat(keep)
+                if st.st_size != group["size"] or st.st_mtime_ns != group["keep"]["mtime"]:
+                    raise OSError("保留的文件在扫描后被修改，跳过该组")
+            except OSError as e:
+                errors.append({"path": keep, "error": str(e)})
+                continue
+            for inode in group["duplicates"]:
+                replaced = 0
+                for _, path in inode["paths"]:
+                    try:
+                        replace_with_link(keep, path, group["size"], inode["mtime"], mode)
+                        replaced += 1
+                    except OSError as e:
+                        errors.append({"path": path, "error": str(e)})
+                # inode 的所有路径都换掉后，其数据块才真正释放（reflink 的数据块由文件系统共享）
+                if replaced == len(inode["paths"]) and _frees_space(inode):
+                    reclaimed += group["size"]
+            if progress_cb and done % 100 == 0:
+                progress_cb(80 + done * 20 // len(groups), f"正在替换重复文件: {done}/{len(groups)}")
+
+    return {
+        "dry_run": dry_run,
+        "mode": mode,
+        "envs": sorted(prefixes),
+        "files_scanned": found["files"],
+        "bytes_scanned": found["bytes"],
+        "files_hashed": found["hashed"],
+        "duplicate_groups": len(groups),
+        "duplicate_files": duplicate_files,
+        "reclaimable_bytes": reclaimable,
+        "reclaimed_bytes": reclaimed,
+        "reclaimable_by_env": dict(sorted(by_env.items(), key=lambda item: item[1], reverse=True)),
+        "top_groups": [
+            {"size": group["size"], "copies": 1 + len(group["duplicates"]),
+             "keep": group["keep"]["paths"][0][1],
+             "duplicates": [inode["paths"][0][1] for inode in group["duplicates"]]}
+            for group in groups[:TOP_GROUPS]
+        ],
+        "errors": errors[:100],
+        "error_count": len(errors),
+    }
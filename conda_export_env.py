@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conda 环境导出工具（命令行版）
+- 导出环境为 YAML（去重 channels、移除 prefix）
+- 生成使用指南 MD 文件
+- 只依赖标准库与 PyYAML，启动时不会导入任何 Web 组件
+- 用法：python conda_export_env.py --env 环境名 --output 输出.yml
+"""
+
+import os
+import re
+import sys
+import subprocess
+from pathlib import Path
+
+
+# ========================
+# 通用工具函数
+# ========================
+def remove_ansi(text: str) -> str:
+    """移除 ANSI 转义序列（如 \x1b[32m）"""
+    ansi_escape = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]')
+    return ansi_escape.sub('', text)
+
+
+def normalize_channel(channel: str) -> str:
+    """标准化conda channel路径"""
+    return channel.rstrip('/')
+
+
+def deduplicate_channels(channels):
+    """去重conda channels（保留顺序）"""
+    seen = set()
+    unique = []
+    for ch in channels:
+        norm = normalize_channel(ch)
+        if norm not in seen:
+            seen.add(norm)
+            unique.append(ch)
+    return unique
+
+
+def parse_env_yaml(content):
+    """
+    解析 environment.yml（export_conda_env 导出的格式），返回
+    {"name", "channels", "dependencies": conda spec 列表, "pip": pip 依赖行列表}；prefix 等其余字段忽略
+    格式不对时抛出 ValueError
+    """
+    import yaml
+    try:
+        env_data = yaml.safe_load(remove_ansi(content))
+    except yaml.YAMLError as e:
+        raise ValueError(f"YAML解析失败: {e}")
+    if not isinstance(env_data, dict):
+        raise ValueError("YAML 顶层必须是映射（name / channels / dependencies）")
+
+    conda_specs, pip_specs = [], []
+    for dep in env_data.get("dependencies") or []:
+        if isinstance(dep, dict) and "pip" in dep:
+            pip_specs.extend(str(item) for item in dep["pip"] or [])
+        elif isinstance(dep, (str, int, float)):
+            conda_specs.append(str(dep))
+        else:
+            raise ValueError(f"无法识别的依赖项: {dep!r}")
+    return {
+        "name": str(env_data["name"]) if env_data.get("name") else None,
+        "channels": deduplicate_channels([str(ch) for ch in env_data.get("channels") or []]),
+        "dependencies": conda_specs,
+        "pip": pip_specs,
+    }
+
+
+# 自动定位 conda 路径（环境变量 CONDA_EXE 优先，便于切换到 fake_conda.py 等替身）
+def get_conda_exe_path():
+    conda_exe_env = os.environ.get("CONDA_EXE")
+    if conda_exe_env and os.path.exists(conda_exe_env):
+        return conda_exe_env
+    python_exe = Path(sys.executable)
+    # Windows
+    if sys.platform == "win32":
+        if "envs" not in str(python_exe.parent):
+            conda_exe = python_exe.parent / "Scripts" / "conda.exe"
+        else:
+            conda_root = python_exe.parent.parent.parent
+            conda_exe = conda_root / "Scripts" / "conda.exe"
+        if conda_exe.exists():
+            return str(conda_exe)
+    # macOS/Linux
+    else:
+        if "envs" not in str(python_exe.parent):
+            conda_exe = python_exe.parent / "bin" / "conda"
+        else:
+            conda_root = python_exe.parent.parent.parent
+            conda_exe = conda_root / "bin" / "conda"
+        if conda_exe.exists():
+            return str(conda_exe)
+    return "conda"
+
+
+# ========================
+# 导出功能
+# ========================
+def generate_md_file(output_md="使用yml之前先看.md"):
+    """生成导出环境的使用指南MD文件"""
+    md_content = """# Conda环境YAML使用指南    
+## 注意：使用生成的yml文件创建的环境，可以写一个测试代码来验证环境是否安装正确
+## 使用方法
+1. 确保已安装Anaconda/Miniconda
+2. 执行创建命令：`conda env create -f {yml_file}`（替换{yml_file}为实际文件名）
+3. 激活环境：`conda activate {env_name}`（替换{env_name}为环境名）    
+
+
+## 常见创建失败原因
+
+| 原因 | 典型表现 | 解决方法 |
+|------|----------|----------|
+| 包版本冲突 | UnsatisfiableError | 降低/升级冲突包版本，或更换Python版本 |
+| Python版本不兼容 | requires a different python version | 调整YAML中的python版本，或选择兼容的包版本 |
+| 特殊包源错误 | No matching distribution | 确保PyTorch/Paddle等包使用官方源 |
+| 网络问题 | 卡在Solving environment | 切换国内镜像源（如清华源） |
+| YAML语法错误 | Invalid YAML | 检查缩进、格式是否正确 |
+| 平台不兼容 | No matching distribution | 确认包支持当前操作系统/架构（如ARM/M1） |
+"""
+    with open(output_md, 'w', encoding='utf-8') as f:
+        f.write(md_content)
+    return output_md
+
+
+def export_conda_env(env_name=None, output_file="environment.yml", output_md="env_guide.md"):
+    """
+    核心导出函数（供外部调用）
+    :param env_name: 要导出的环境名，None则导出当前环境
+    :param output_file: YAML输出文件名
+    :param output_md: MD指南输出文件名
+    :return: 字典格式的执行结果
+    """
+    try:
+        # 获取conda执行路径
+        conda_exe = get_conda_exe_path()
+        cmd = [conda_exe, "env", "export", "--no-builds"]
+        if env_name:
+            cmd.extend(["--name", env_name])
+
+        result = subprocess.run(
+            cmd,
+            capture_output=True,
+            text=True,
+            check=True,
+            encoding='utf-8',
+            errors='replace'
+        )
+
+        # 清理ANSI转义序列
+        clean_stdout = remove_ansi(result.stdout)
+
+        # 解析YAML（按需导入，--help 等场景无需加载）
+        import yaml
+        try:
+            env_data = yaml.safe_load(clean_stdout)
+        except yaml.YAMLError as e:
+            debug_file = "debug_raw_output.txt"
+            with open(debug_file, "w", encoding="utf-8") as f:
+                f.write(result.stdout)
+            return {
+                "status": "failed",
+                "msg": f"YAML解析失败（已保存调试文件）: {str(e)}",
+                "debug_file": debug_file
+            }
+
+        # 处理channels去重、移除prefix
+        if env_data and 'channels' in env_data:
+            env_data['channels'] = deduplicate_channels(env_data['channels'])
+        if env_data:
+            env_data.pop('prefix', None)
+
+        # 生成MD指南
+        generate_md_file(output_md)
+
+        # 写入YAML文件
+        with open(output_file, 'w', encoding='utf-8') as f:
+            yaml.dump(
+                env_data,
+                f,
+                default_flow_style=False,
+                indent=2,
+                sort_keys=False,
+                allow_unicode=True
+            )
+
+        return {
+            "status": "success",
+            "msg": f"环境导出成功：{output_file} | 指南文件：{output_md}",
+            "yml_file": output_file,
+            "md_file": output_md
+        }
+
+    except subprocess.CalledProcessError as e:
+        # 捕获conda命令执行失败
+        return {
+            "status": "failed",
+            "msg": f"Conda命令执行失败: {e.stderr.strip()}",
+            "return_code": e.returncode
+        }
+    except Exception as e:
+        # 捕获其他异常
+        return {
+            "status": "failed",
+            "msg": f"未知错误: {str(e)}"
+        }
+
+
+# ========================
+# 命令行入口
+# ========================
+def cli_export(argv=None):
+    """命令行导出环境（兼容原脚本的参数）"""
+    import argparse
+    parser = argparse.ArgumentParser(description="导出 Conda 环境为 YAML")
+    parser.add_argument("--env", "-e")
+    parser.add_argument("--output", "-o", default="environment.yml")
+    parser.add_argument("--md-output", "-m", default="使用yml之前先看.md")
+    args = parser.parse_args(argv)
+
+    result = export_conda_env(
+        env_name=args.env,
+        output_file=args.output,
+        output_md=args.md_output
+    )
+
+    print(result["msg"])
+    if result["status"] == "failed":
+        sys.exit(1)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    cli_export()
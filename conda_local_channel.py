@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+由本地包缓存生成的 file:// channel
+- 扫描 conda 的 pkgs 缓存目录以及投放目录（LOCAL_CHANNEL_DROP，默认 <channel>/incoming）中的
+  .conda / .tar.bz2 包，硬链接（跨设备时复制）到 channel 目录的 <subdir>/ 下，并生成 repodata.json
+- 增量更新：按 (大小, 修改时间) 判断包文件是否变化，只为新增 / 变化的包读取 info/index.json 并计算校验和；
+  来源中已删除的包同时从 channel 中移除；repodata.json 内容变化时才原子地重写
+- 包的元数据优先取缓存中已解压目录的 info/index.json，否则从包文件中读取
+  （.conda 格式需要可选依赖 zstandard）
+- channel 目录：环境变量 LOCAL_CHANNEL_DIR（默认 ~/.conda_env_manager/local_channel）
+- 多个 worker 同时刷新时用文件锁串行（仅 POSIX），其余平台依赖进程内锁
+"""
+
+import io
+import os
+import json
+import time
+import shutil
+import tarfile
+import hashlib
+import zipfile
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+PACKAGE_SUFFIXES = (".conda", ".tar.bz2")
+STATE_FILE = "index_state.json"
+
+
+def default_channel_dir() -> str:
+    return os.environ.get("LOCAL_CHANNEL_DIR") or os.path.join(
+        os.path.expanduser("~"), ".conda_env_manager", "local_channel")
+
+
+def _package_stem(fn: str) -> str:
+    for suffix in PACKAGE_SUFFIXES:
+        if fn.endswith(suffix):
+            return fn[:-len(suffix)]
+    return fn
+
+
+def _file_digests(path: str) -> Dict[str, str]:
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            md5.update(chunk)
+            sha256.update(chunk)
+    return {"md5": md5.hexdigest(), "sha256": sha256.hexdigest()}
+
+
+def _index_from_tar(fileobj, mode: str) -> Optional[Dict]:
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:
+        for member in tar:
+            if member.name in ("info/index.json", "./info/index.json"):
+                return json.load(tar.extractfile(member))
+    return None
+
+
+def read_index_json(path: str) -> Optional[Dict]:
+    """读取包的 info/index.json：优先取同目录下已解压的包目录，否则从包文件中读取"""
+    extracted = os.path.join(os.path.dirname(path), _package_stem(os.path.basename(path)), "info", "index.json")
+    if os.path.isfile(extracted):
+        with open(extracted, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if path.endswith(".tar.bz2"):
+        with open(path, "rb") as f:
+            return _index_from_tar(f, "r:bz2")
+    # .conda：zip 中的 info-<包名>.tar.zst
+    with zipfile.ZipFile(path) as archive:
+        name = next((n for n in archive.namelist() if n.startswith("info-") and n.endswith(".tar.zst")), None)
+        if name is None:
+            return None
+        try:
+            import zstandard
+        except ImportError:
+            raise Exception("读取 .conda 包需要 zstandard，请运行：pip install zstandard")
+        data = zstandard.ZstdDecompressor().decompress(archive.read(name), max_output_size=64 * 1024 * 1024)
+        return _index_from_tar(io.BytesIO(data), "r:")
+
+
+class LocalChannel:
+    """本地 file:// channel（线程安全）"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or default_channel_dir()
+        self.drop_dir = os.environ.get("LOCAL_CHANNEL_DROP") or os.path.join(self.directory, "incoming")
+        os.makedirs(self.drop_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # 无法索引的包：{路径: (大小, 修改时间)}，文件不变时不再重复读取与报告
+        self._failed: Dict[str, tuple] = {}
+        self.last_refresh = None
+
+    @property
+    def url(self) -> str:
+        return Path(self.directory).resolve().as_uri()
+
+    def ready(self) -> bool:
+        """已生成过 repodata.json，可以作为 channel 使用"""
+        return os.path.isfile(os.path.join(self.directory, "noarch", "repodata.json"))
+
+    def status(self) -> Dict:
+        state = self._load_state()
+        return {
+            "url": self.url,
+            "ready": self.ready(),
+            "packages": len(state),
+            "drop_dir": self.drop_dir,
+            "last_refresh": self.last_refresh,
+        }
+
+    # ---------- 增量索引 ----------
+    def refresh(self, pkgs_dirs: List[str], platform: str) -> Dict:
+        """
+        扫描 pkgs 缓存与投放目录，增量更新 channel；返回 {"packages", "added", "removed", "failed"}
+        （failed 只列出本次新发现的无法索引的包）
+        同名包以先出现的来源为准（pkgs_dirs 按 conda 配置的顺序，投放目录最后）
+        """
+        with self._lock, self._file_lock():
+            state = self._load_state()
+            found = {}
+            for source in list(pkgs_dirs) + [self.drop_dir]:
+                try:
+                    names = sorted(os.listdir(source))
+                except OSError:
+                    continue
+                for fn in names:
+                    path = os.path.join(source, fn)
+                    if fn.endswith(PACKAGE_SUFFIXES) and fn not in found and os.path.isfile(path):
+                        found[fn] = path
+
+            added, failed = 0, []
+            new_state = {}
+            for fn, path in found.items():
+                st = os.stat(path)
+                previous = state.get(fn)
+                if previous and previous["source"] == path and previous["size"] == st.st_size \
+                        and previous["mtime"] == st.st_mtime_ns:
+                    new_state[fn] = previous
+                    continue
+                if self._failed.get(path) == (st.st_size, st.st_mtime_ns):
+                    continue
+                try:
+                    index = read_index_json(path)
+                    if not index:
+                        raise Exception("包中没有 info/index.json")
+                except Exception as e:
+                    self._failed[path] = (st.st_size, st.st_mtime_ns)
+                    failed.append({"fn": fn, "error": str(e)})
+                    continue
+                subdir = index.get("subdir") or ("noarch" if index.get("noarch") else platform)
+                entry = dict(index, size=st.st_size, **_file_digests(path))
+                entry.pop("fn", None)
+                self._link(path, subdir, fn)
+                new_state[fn] = {"source": path, "size": st.st_size, "mtime": st.st_mtime_ns,
+                                 "subdir": subdir, "entry": entry}
+                added += 1
+
+            removed = [fn for fn in state if fn not in new_state]
+            for fn in removed:
+                try:
+                    os.remove(os.path.join(self.directory, state[fn]["subdir"], fn))
+                except OSError:
+                    pass
+            self._write_repodata(new_state, {platform, "noarch"})
+            self._save_state(new_state)
+            self.last_refresh = round(time.time(), 3)
+            return {"packages": len(new_state), "added": added, "removed": len(removed), "failed": failed}
+
+    def _link(self, source: str, subdir: str, fn: str):
+        target_dir = os.path.join(self.directory, subdir)
+        os.makedirs(target_dir, exist_ok=True)
+        target = os.path.join(target_dir, fn)
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copy2(source, target)
+
+    def _write_repodata(self, state: Dict, subdirs: set):
+        repodata = {subdir: {"info": {"subdir": subdir}, "packages": {}, "packages.conda": {},
+                             "removed": [], "repodata_version": 1}
+                    for subdir in subdirs | {item["subdir"] for item in state.values()}}
+        for fn, item in sorted(state.items()):
+            key = "packages.conda" if fn.endswith(".conda") else "packages"
+            repodata[item["subdir"]][key][fn] = item["entry"]
+        for subdir, data in repodata.items():
+            path = os.path.join(self.directory, subdir, "repodata.json")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            content = json.dumps(data, indent=1, sort_keys=True)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    if f.read() == content:
+                        continue
+            except OSError:
+                pass
+            tmp = path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(content)
+            os.replace(tmp, path)
+
+    # ---------- 状态文件与锁 ----------
+    def _load_state(self) -> Dict:
+        try:
+            with open(os.path.join(self.directory, STATE_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict):
+        path = os.path.join(self.directory, STATE_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(path + ".tmp", path)
+
+    def _file_lock(self):
+        return _FileLock(os.path.join(self.directory, ".lock"))
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self.file = open(self.path, "a")
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        return False
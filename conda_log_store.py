@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+磁盘日志归档（只追加的分段存储）与索引检索
+- 每条日志以 JSON 行追加到当前分段 segment-<起始时间毫秒>-<进程号>.jsonl，超过 LOG_SEGMENT_BYTES 后封存并新建分段
+- 每个写入进程（uvicorn worker）只写自己的分段，多个 worker 共享同一归档目录互不干扰；
+  启动时把已退出进程遗留的未封存分段补建索引并封存
+- 每个分段维护轻量索引：task_id / env / level → 行偏移量；封存时写入同名 .idx.json
+- 分段的时间范围由文件名推出（本段起始时间 ~ 同一进程下一段的起始时间），按时间查询时直接跳过无关分段
+- 检索用 mmap 按偏移量读取单行，不整体加载文件；没有可用索引键时才顺序扫描分段
+- 已封存的分段保留 LOG_ARCHIVE_RETENTION 秒（默认 30 天），归档总大小不超过 LOG_ARCHIVE_MAX_BYTES
+  （默认 1 GiB，0 表示不限）；启动和每次封存时从最旧的分段开始连同索引一起删除，正在写入的分段不删
+- 归档目录：环境变量 LOG_ARCHIVE_DIR（默认 ~/.conda_env_manager/log_archive）
+"""
+
+import os
+import json
+import mmap
+import time
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# 单个分段的大小上限
+SEGMENT_BYTES = int(os.environ.get("LOG_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+# 已封存分段的保留时长（秒）与归档总大小上限（字节，0 表示不限）
+ARCHIVE_RETENTION = float(os.environ.get("LOG_ARCHIVE_RETENTION", str(30 * 24 * 3600)))
+ARCHIVE_MAX_BYTES = int(os.environ.get("LOG_ARCHIVE_MAX_BYTES", str(1024 * 1024 * 1024)))
+# 建立索引的字段
+INDEXED_FIELDS = ("task_id", "env", "level")
+
+
+def default_archive_dir() -> str:
+    return os.environ.get("LOG_ARCHIVE_DIR") or os.path.join(
+        os.path.expanduser("~"), ".conda_env_manager", "log_archive")
+
+
+def _new_index() -> Dict[str, Dict[str, List[int]]]:
+    return {field: {} for field in INDEXED_FIELDS}
+
+
+def _add_to_index(index: Dict, entry: Dict, offset: int):
+    for field in INDEXED_FIELDS:
+        value = entry.get(field)
+        if value is not None:
+            index[field].setdefault(str(value), []).append(offset)
+
+
+def _iter_lines(mm: mmap.mmap, size: int) -> Iterator[Tuple[int, bytes]]:
+    """按行遍历 mmap，返回 (偏移量, 行内容)"""
+    offset = 0
+    while offset < size:
+        end = mm.find(b"\n", offset, size)
+        if end == -1:
+            break  # 末尾未写完的半行
+        yield offset, mm[offset:end]
+        offset = end + 1
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    if os.name != "posix":
+        return True  # 无法可靠探测时按存活处理：该分段保持未封存，检索时现场扫描
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_line(mm: mmap.mmap, offset: int, size: int) -> Optional[bytes]:
+    end = mm.find(b"\n", offset, size)
+    return mm[offset:end] if end != -1 else None
+
+
+@lru_cache(maxsize=32)
+def _load_sealed_index(path: str) -> Dict:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class LogStore:
+    """只追加的日志分段存储（写入在日志后台线程中进行，检索可在任意线程并发进行）"""
+
+    def __init__(self, directory: Optional[str] = None, segment_bytes: int = SEGMENT_BYTES):
+        self.directory = directory or default_archive_dir()
+        self.segment_bytes = segment_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._file = None
+        self._active = None   # 当前分段路径
+        self._size = 0        # 当前分段已写入（且已索引）的字节数
+        self._index = _new_index()
+        self._open_active()
+
+    # ---------- 分段管理 ----------
+    def segments(self) -> List[Tuple[str, float, Optional[float]]]:
+        """按时间顺序返回 [(分段路径, 起始时间, 结束时间)]；结束时间未知（仍在写入）时为 None"""
+        parsed = []
+        for name in os.listdir(self.directory):
+            if name.startswith("segment-") and name.endswith(".jsonl"):
+                # 旧版文件名没有进程号部分
+                start, _, writer = name[8:-6].partition("-")
+                parsed.append((os.path.join(self.directory, name), int(start) / 1000, writer))
+        parsed.sort(key=lambda item: item[1])
+        next_start: Dict[str, float] = {}
+        result = []
+        for path, start, writer in reversed(parsed):
+            result.append((path, start, next_start.get(writer)))
+            next_start[writer] = start
+        result.reverse()
+        return result
+
+    def _open_active(self):
+        """封存已退出进程遗留的未封存分段（截掉异常退出留下的半行），然后为本进程新建分段"""
+        for path, _, end in self.segments():
+            writer = os.path.basename(path)[8:-6].partition("-")[2]
+            if end is not None or os.path.exists(self._index_path(path)):
+                continue
+            if writer and _pid_alive(int(writer)):
+                continue
+            index, size = self._scan_index(path)
+            with open(path, "r+b") as f:
+                f.truncate(size)
+            self._write_index(path, index)
+        self._start_segment(int(time.time() * 1000))
+        self._prune()
+
+    def _start_segment(self, start_ms: int):
+        self._active = os.path.join(self.directory, f"segment-{start_ms:013d}-{os.getpid()}.jsonl")
+        self._active_start = start_ms
+        self._index, self._size = _new_index(), 0
+        self._file = open(self._active, "ab")
+
+    def _seal(self):
+        """封存当前分段：写出索引，新建下一个分段"""
+        self._file.close()
+        self._write_index(self._active, self._index)
+        self._start_segment(max(int(time.time() * 1000), self._active_start + 1))
+        self._prune()
+
+    def _prune(self):
+        """按保留时长与总大小上限删除最旧的已封存分段及其索引（各进程的未封存分段不动）"""
+        segments = []
+        for path, _, end in self.segments():
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # 已被其他进程删除
+            # 已退出进程的最后一个分段没有后继分段，以最后写入时间作为结束时间
+            segments.append((path, end if end is not None else stat.st_mtime, stat.st_size))
+        total = sum(size for _, _, size in segments)
+        cutoff = time.time() - ARCHIVE_RETENTION
+        for path, end, size in segments:
+            expired = end < cutoff
+            oversized = ARCHIVE_MAX_BYTES and total > ARCHIVE_MAX_BYTES
+            if not (expired or oversized) or path == self._active \
+                    or not os.path.exists(self._index_path(path)):
+                continue
+            for victim in (path, self._index_path(path)):
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    def _write_index(self, segment: str, index: Dict):
+        tmp = self._index_path(segment) + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, self._index_path(segment))
+
+    @staticmethod
+    def _index_path(segment: str) -> str:
+        return segment[:-len(".jsonl")] + ".idx.json"
+
+    @staticmethod
+    def _scan_index(segment: str) -> Tuple[Dict, int]:
+        index, size = _new_index(), 0
+        with open(segment, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return index, 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for offset, line in _iter_lines(mm, len(mm)):
+                    try:
+                        _add_to_index(index, json.loads(line), offset)
+                    except ValueError:
+                        pass
+                    size = offset + len(line) + 1
+        return index, size
+
+    # ---------- 写入 ----------
+    def append(self, entry: Dict):
+        data = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            if self._size and self._size + len(data) > self.segment_bytes:
+                self._seal()
+            self._file.write(data)
+            self._file.flush()
+            _add_to_index(self._index, entry, self._size)
+            self._size += len(data)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    # ---------- 检索 ----------
+    def search(self, task_id: str = None, env: str = None, level: str = None, since: float = None,
+               until: float = None, text: str = None, limit: int = 500) -> List[Dict]:
+        """
+        按条件检索归档日志，返回最新的 limit 条（按时间倒序）
+        task_id / env / level 走索引；since / until 为时间戳（秒）；text 为消息子串
+        """
+        keys = {field: value for field, value in (("task_id", task_id), ("env", env), ("level", level)) if value}
+        results = []
+        # 多个进程的分段时间上相互交叠：从最新分段往前查，凑够 limit 条后
+        # 只再查看结束时间晚于已有第 limit 条的分段，最后统一按时间排序
+        for path, start, end in reversed(self.segments()):
+            if until is not None and start > until:
+                continue
+            if since is not None and end is not None and end < since:
+                continue
+            if len(results) >= limit and end is not None and end < results[limit - 1].get("ts", 0):
+                continue
+            for entry in reversed(self._search_segment(path, keys)):
+                ts = entry.get("ts", 0)
+                if since is not None and ts < since or until is not None and ts > until:
+                    continue
+                if text and text not in entry.get("msg", ""):
+                    continue
+                results.append(entry)
+            results.sort(key=lambda entry: entry.get("ts", 0), reverse=True)
+            del results[limit:]
+        return results
+
+    def _search_segment(self, path: str, keys: Dict[str, str]) -> List[Dict]:
+        """在单个分段中按索引键取出候选行（按写入顺序）"""
+        with self._lock:
+            if path == self._active:
+                index, size = self._index, self._size
+                offsets = self._candidate_offsets(index, keys)
+                offsets = list(offsets) if offsets is not None else None
+            else:
+                index, size = None, None
+        try:
+            if index is None:
+                index = _load_sealed_index(self._index_path(path)) if os.path.exists(self._index_path(path)) \
+                    else self._scan_index(path)[0]
+                offsets = self._candidate_offsets(index, keys)
+
+            if offsets is not None and not offsets:
+                return []
+            with open(path, "rb") as f:
+                file_size = os.fstat(f.fileno()).st_size
+                if file_size == 0:
+                    return []
+                size = min(size, file_size) if size is not None else file_size
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    if offsets is None:
+                        lines = [line for _, line in _iter_lines(mm, size)]
+                    else:
+                        lines = [_read_line(mm, offset, size) for offset in offsets]
+        except FileNotFoundError:
+            return []  # 检索期间分段已按保留策略删除
+        entries = []
+        for line in lines:
+            try:
+                entries.append(json.loads(line))
+            except (TypeError, ValueError):
+                pass
+        return entries
+
+    @staticmethod
+    def _candidate_offsets(index: Dict, keys: Dict[str, str]) -> Optional[List[int]]:
+        """多个索引键取交集；没有索引键时返回 None（需全段扫描）"""
+        if not keys:
+            return None
+        postings = [set(index.get(field, {}).get(value, ())) for field, value in keys.items()]
+        return sorted(set.intersection(*postings))
+
+
+class LogStoreHandler(logging.Handler):
+    """把日志记录写入 LogStore 的 handler（挂在 QueueListener 上，不阻塞调用方）"""
+
+    def __init__(self, store: LogStore, formatter):
+        super().__init__()
+        self.store = store
+        self.setFormatter(formatter)
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.store.append(self.formatter.to_dict(record))
+        except Exception:
+            self.handleError(record)
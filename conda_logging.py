@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+结构化、非阻塞日志
+- 调用方只把记录放入内存队列（QueueHandler），格式化与写入由后台线程（QueueListener）完成
+- 记录为 JSON，附带 task_id / env / operation / duration 等字段
+- 输出：控制台、最近日志缓冲区（供 /logs 使用）、可选的日志文件、磁盘日志归档（供 /logs/search 使用）
+- 日志文件按大小或时间轮转，旧文件 gzip 压缩
+- 环境变量：
+    LOG_LEVEL            日志级别（默认 INFO）
+    LOG_FORMAT           控制台格式 text / json（默认 text）
+    LOG_FILE             日志文件路径（默认不写文件）
+    LOG_MAX_BYTES        单个日志文件上限（默认 10 MB，0 表示不按大小轮转）
+    LOG_ROTATE_INTERVAL  按时间轮转的间隔秒数（默认 86400，0 表示不按时间轮转）
+    LOG_BACKUP_COUNT     保留的压缩日志数（默认 7）
+    LOG_ARCHIVE          是否写入磁盘日志归档（默认 1，0 表示关闭；目录与保留策略见 conda_log_store）
+    LOG_ARCHIVE_LEVEL    归档的日志级别（默认 DEBUG，包含 conda 命令的逐行输出）
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import queue
+import shutil
+import atexit
+import logging
+import logging.handlers
+from collections import deque
+from typing import List, Optional
+
+from conda_log_store import LogStore, LogStoreHandler
+
+LOGGER_NAME = "conda_env_manager"
+# 结构化字段：通过 logger.log(..., extra={...}) 传入
+FIELDS = ("task_id", "env", "operation", "duration")
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一个 JSON 对象"""
+
+    def to_dict(self, record: logging.LogRecord) -> dict:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return entry
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(self.to_dict(record), ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """与原先一致的 "[LEVEL] 消息" 格式"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return f"[{record.levelname}] {record.getMessage()}"
+
+
+class RecentLogsHandler(logging.Handler):
+    """
+    保留最近的若干条日志（文本格式），供 /logs 接口读取
+    给出 store（提供 append_log / recent_logs，见 conda_state_store）时写入共享状态，多个 worker 看到同一份日志
+    """
+
+    def __init__(self, capacity: int = 1000, store=None):
+        super().__init__()
+        self.records = deque(maxlen=capacity)
+        self.store = store
+        self.setFormatter(TextFormatter())
+
+    def emit(self, record: logging.LogRecord):
+        if self.store is not None:
+            self.store.append_log(self.format(record))
+        else:
+            self.records.append(self.format(record))
+
+    def recent(self, limit: int = 100) -> List[str]:
+        if self.store is not None:
+            return self.store.recent_logs(limit)
+        return list(self.records)[-limit:]
+
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class CompressingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """按大小或时间轮转（以先到者为准），轮转出的文件 gzip 压缩为 <文件>.N.gz"""
+
+    def __init__(self, filename: str, max_bytes: int = 0, interval: float = 0, backup_count: int = 7):
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        if self.rollover_at is not None:
+            self.rollover_at = time.time() + self.interval
+
+
+def setup_logging(level: Optional[str] = None, log_file: Optional[str] = None, recent_store=None):
+    """
+    配置日志管道，返回 (logger, 最近日志缓冲区, 磁盘日志归档或 None)
+    recent_store 为共享状态存储时，最近日志写入其中（多 worker 部署）
+    后台线程已启动，进程退出时自动刷新
+    """
+    level = logging.getLevelName((level or os.environ.get("LOG_LEVEL", "INFO")).upper())
+    log_file = log_file or os.environ.get("LOG_FILE")
+
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(JsonFormatter() if os.environ.get("LOG_FORMAT") == "json" else TextFormatter())
+    recent = RecentLogsHandler(store=recent_store)
+    handlers = [console, recent]
+    if log_file:
+        file_handler = CompressingRotatingFileHandler(
+            log_file,
+            max_bytes=int(os.environ.get("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            interval=float(os.environ.get("LOG_ROTATE_INTERVAL", "86400")),
+            backup_count=int(os.environ.get("LOG_BACKUP_COUNT", "7")),
+        )
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+    for handler in handlers:
+        handler.setLevel(level)
+
+    store = None
+    logger_level = level
+    if os.environ.get("LOG_ARCHIVE", "1") != "0":
+        store = LogStore()
+        archive_handler = LogStoreHandler(store, JsonFormatter())
+        archive_handler.setLevel(os.environ.get("LOG_ARCHIVE_LEVEL", "DEBUG").upper())
+        handlers.append(archive_handler)
+        logger_level = min(level, archive_handler.level)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(logger_level)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    return logger, recent, store
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+Prometheus 文本格式的指标（不依赖 prometheus_client）
+- Counter / Gauge / Histogram，支持标签，线程安全
+- REGISTRY.render() 生成 /metrics 的响应内容
+- 本模块同时定义服务使用的全部指标，供各模块直接导入
+"""
+
+import math
+import time
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.register(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["buckets"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((k, {"buckets": list(v["buckets"]), "sum": v["sum"], "count": v["count"]})
+                           for k, v in self._values.items())
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["buckets"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ========================
+# 服务指标
+# ========================
+# 解依赖可能持续数分钟，桶要覆盖到 30 分钟
+CONDA_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+CONDA_COMMANDS = Counter("conda_commands_total", "执行的 conda 命令数（按动词）", ["verb"])
+CONDA_COMMAND_FAILURES = Counter("conda_command_failures_total", "失败的 conda 命令数（按动词）", ["verb"])
+CONDA_COMMAND_SECONDS = Histogram("conda_command_duration_seconds", "conda 命令耗时（按动词）", ["verb"],
+                                  buckets=CONDA_BUCKETS)
+CONDA_RUNNING = Gauge("conda_commands_running", "正在运行的 conda 命令数（按动词）", ["verb"])
+
+TASKS_QUEUED = Gauge("tasks_queued", "已提交、尚未开始执行的后台任务数")
+TASKS_RUNNING = Gauge("tasks_running", "正在执行的后台任务数（按操作）", ["operation"])
+TASK_OUTCOMES = Counter("task_outcomes_total", "已结束的后台任务数（按操作与结果）", ["operation", "status"])
+TASK_SECONDS = Histogram("task_duration_seconds", "后台任务耗时（按操作）", ["operation"], buckets=CONDA_BUCKETS)
+TASK_PHASE_SECONDS = Histogram("task_phase_duration_seconds", "后台任务各阶段耗时（按操作与阶段）",
+                               ["operation", "phase"], buckets=CONDA_BUCKETS)
+
+CREATE_RESOLUTION = Counter("create_resolution_total",
+                            "创建环境的依赖解析途径（offline：仅用本地包缓存；online：缓存不满足后联网）", ["path"])
+SOLVE_CACHE_REQUESTS = Counter("solve_cache_requests_total",
+                               "依赖解析结果缓存的访问次数（hit / miss / stale：命中但显式安装失败）", ["result"])
+PIP_WHEEL_CACHE = Counter("pip_wheel_cache_total",
+                          "pip 阶段的 wheel 缓存使用（hit：仅用缓存离线安装成功；miss：并行获取 wheel 后安装）", ["result"])
+
+INVENTORY_CACHE = Counter("inventory_cache_requests_total", "环境清单缓存访问次数（hit/miss）", ["result"])
+SINGLEFLIGHT_DEDUPLICATED = Counter("singleflight_deduplicated_total",
+                                    "与进行中的相同查询合并、未重复执行的调用数（按查询类型）", ["kind"])
+
+EVENT_LOOP_LAG = Gauge("event_loop_lag_seconds", "最近一次测得的事件循环延迟")
+EVENT_LOOP_LAG_SECONDS = Histogram("event_loop_lag_observed_seconds", "事件循环延迟分布",
+                                   buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+
+
+def conda_verb(args: Sequence[str]) -> str:
+    """把 conda 参数归类为 list / create / clone / remove / export / info / other"""
+    words = [a for a in args if not a.startswith("-")]
+    if not words:
+        return "other"
+    if words[0] == "env" and len(words) > 1:
+        return {"list": "list", "remove": "remove", "export": "export", "create": "create"}.get(words[1], "other")
+    if words[0] == "create":
+        return "clone" if "--clone" in args else "create"
+    if words[0] in ("list", "info", "remove", "install"):
+        return words[0]
+    return "other"
+
+
+class CondaCommandTimer:
+    """统计一次 conda 命令：with CondaCommandTimer(args) as t: ...；返回码非 0 时调用 t.failed()"""
+
+    def __init__(self, args: Sequence[str]):
+        self.verb = conda_verb(args)
+        self.ok = True
+        self.start = 0.0
+
+    def failed(self):
+        self.ok = False
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        CONDA_COMMANDS.inc(verb=self.verb)
+        CONDA_RUNNING.inc(verb=self.verb)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        CONDA_RUNNING.dec(verb=self.verb)
+        CONDA_COMMAND_SECONDS.observe(time.perf_counter() - self.start, verb=self.verb)
+        if exc_type is not None or not self.ok:
+            CONDA_COMMAND_FAILURES.inc(verb=self.verb)
+        return False
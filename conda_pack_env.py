@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Conda 环境打包/解包工具（可重定位归档）
+- pack：将环境前缀流式打包为 .tar.zst 归档（多线程 zstd 压缩）
+- unpack：将归档解压到新前缀（并行写出文件），并按 conda-meta 记录重写前缀占位符
+- 用法：
+    python conda_pack_env.py pack  --prefix /opt/conda/envs/demo --output demo.tar.zst
+    python conda_pack_env.py unpack demo.tar.zst --prefix /opt/conda/envs/demo_copy
+"""
+
+import io
+import os
+import re
+import sys
+import glob
+import json
+import stat
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# 归档中第一个成员：记录原始前缀与需要重写的文件
+MANIFEST_NAME = ".conda-pack-manifest.json"
+# 解压时允许同时驻留内存、等待写出的最大字节数
+MAX_PENDING_BYTES = 256 * 1024 * 1024
+
+
+def _import_zstd():
+    """按需导入 zstandard（可选依赖）"""
+    try:
+        import zstandard
+    except ImportError:
+        raise Exception("未安装 zstandard，请运行：pip install zstandard")
+    return zstandard
+
+
+def load_prefix_placeholders(prefix: str) -> Dict[str, str]:
+    """
+    从 conda-meta/*.json 读取包含前缀占位符的文件
+    :return: {相对路径: "text" | "binary"}
+    """
+    placeholders = {}
+    for meta_file in glob.glob(os.path.join(prefix, "conda-meta", "*.json")):
+        try:
+            with open(meta_file, "r", encoding="utf-8") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for item in (record.get("paths_data") or {}).get("paths", []):
+            if item.get("prefix_placeholder"):
+                placeholders[item["_path"]] = item.get("file_mode", "text")
+
+    # pip 安装的入口脚本不在 conda-meta 中，但 shebang 里同样写死了前缀
+    bin_dir = "Scripts" if sys.platform == "win32" else "bin"
+    prefix_bytes = prefix.encode("utf-8")
+    for entry in glob.glob(os.path.join(prefix, bin_dir, "*")):
+        rel = os.path.relpath(entry, prefix).replace("\\", "/")
+        if rel in placeholders or os.path.islink(entry) or not os.path.isfile(entry):
+            continue
+        try:
+            with open(entry, "rb") as f:
+                first_line = f.readline(4096)
+        except OSError:
+            continue
+        if first_line.startswith(b"#!") and prefix_bytes in first_line:
+            placeholders[rel] = "text"
+    return placeholders
+
+
+def replace_prefix(data: bytes, mode: str, old_prefix: str, new_prefix: str) -> bytes:
+    """替换文件内容中的前缀；二进制文件按 conda 的规则用 \\0 补齐长度"""
+    old = old_prefix.encode("utf-8")
+    new = new_prefix.encode("utf-8")
+    if mode != "binary":
+        return data.replace(old, new)
+    if len(new) > len(old):
+        raise ValueError(f"新前缀比原前缀长，无法重写二进制文件（{len(new)} > {len(old)}）")
+    padding = len(old) - len(new)
+    pattern = re.compile(re.escape(old) + b"([^\0]*?)\0")
+    return pattern.sub(lambda m: new + m.group(1) + b"\0" * (padding + 1), data)
+
+
+def _is_safe_member(name: str) -> bool:
+    """拒绝绝对路径与 .. 路径，防止解压越界"""
+    if os.path.isabs(name) or name.startswith(("/", "\\")):
+        return False
+    return ".." not in re.split(r"[\\/]", name)
+
+
+def _is_within(path: str, root: str) -> bool:
+    """path（解析符号链接后）是否位于 root 之内；root 须已是 realpath"""
+    path = os.path.realpath(path)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def pack_env(prefix: str, output_file: str, threads: int = -1, level: int = 3,
+             progress_cb: Optional[Callable[[int, str], None]] = None) -> dict:
+    """
+    将环境前缀打包为可重定位的 .tar.zst 归档
+    :param prefix: 环境前缀路径
+    :param output_file: 归档输出路径
+    :param threads: zstd 压缩线程数，-1 表示使用全部 CPU 核心
+    :param level: zstd 压缩级别
+    :param progress_cb: 进度回调 (百分比, 阶段描述)
+    :return: 字典格式的执行结果
+    """
+    try:
+        zstd = _import_zstd()
+        prefix = os.path.abspath(prefix)
+        if not os.path.isdir(os.path.join(prefix, "conda-meta")):
+            return {"status": "failed", "msg": f"不是有效的 conda 环境: {prefix}"}
+
+        # 1. 收集文件与总大小
+        entries = []
+        total_bytes = 0
+        for root, dirs, files in os.walk(prefix):
+            dirs.sort()
+            for name in dirs + sorted(files):
+                full = os.path.join(root, name)
+                entries.append(full)
+                st = os.lstat(full)
+                if stat.S_ISREG(st.st_mode):
+                    total_bytes += st.st_size
+
+        placeholders = load_prefix_placeholders(prefix)
+        manifest = json.dumps({
+            "prefix": prefix,
+            "platform": sys.platform,
+            "files": len(entries),
+            "placeholders": placeholders,
+        }, ensure_ascii=False).encode("utf-8")
+
+        # 2. 流式写入：tar → zstd（多线程）→ 文件
+        done_bytes = 0
+        last_pct = -1
+        cctx = zstd.ZstdCompressor(level=level, threads=threads)
+        with open(output_file, "wb") as fh, cctx.stream_writer(fh) as writer, \
+                tarfile.open(fileobj=writer, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+            info = tarfile.TarInfo(MANIFEST_NAME)
+            info.size = len(manifest)
+            tar.addfile(info, fileobj=io.BytesIO(manifest))
+
+            for full in entries:
+                arcname = os.path.relpath(full, prefix).replace("\\", "/")
+                info = tar.gettarinfo(full, arcname)
+                if info.islnk():
+                    # 硬链接按普通文件写入，保证解压端可并行、与顺序无关
+                    info.type = tarfile.REGTYPE
+                    info.linkname = ""
+                    info.size = os.stat(full).st_size
+                if info.isreg():
+                    with open(full, "rb") as f:
+                        tar.addfile(info, fileobj=f)
+                    done_bytes += info.size
+                else:
+                    tar.addfile(info)
+
+                pct = int(done_bytes * 100 / total_bytes) if total_bytes else 100
+                if progress_cb and pct != last_pct:
+                    last_pct = pct
+                    progress_cb(pct, f"正在打包: {arcname}")
+
+        size = os.path.getsize(output_file)
+        return {
+            "status": "success",
+            "msg": f"环境打包成功：{output_file}（{len(entries)} 个文件，{size / 1024 / 1024:.1f} MB）",
+            "archive": output_file,
+            "files": len(entries),
+            "bytes": size,
+        }
+    except Exception as e:
+        return {"status": "failed", "msg": f"打包失败: {str(e)}"}
+
+
+def unpack_env(archive: str, dest_prefix: str, threads: Optional[int] = None,
+               progress_cb: Optional[Callable[[int, str], None]] = None) -> dict:
+    """
+    将归档解压到新前缀，并重写前缀占位符
+    :param archive: pack_env 生成的 .tar.zst 归档
+    :param dest_prefix: 目标前缀（必须不存在或为空目录）
+    :param threads: 并行写出文件的线程数，None 表示按 CPU 核心数
+    :param progress_cb: 进度回调 (百分比, 阶段描述)
+    :return: 字典格式的执行结果
+    """
+    try:
+        zstd = _import_zstd()
+        dest_prefix = os.path.abspath(dest_prefix)
+        if os.path.exists(dest_prefix) and os.listdir(dest_prefix):
+            return {"status": "failed", "msg": f"目标路径已存在且非空: {dest_prefix}"}
+        os.makedirs(dest_prefix, exist_ok=True)
+        real_prefix = os.path.realpath(dest_prefix)
+
+        def checked_parent(target: str) -> str:
+            """创建并返回 target 的父目录；父目录经符号链接指向前缀之外时抛出异常"""
+            parent = os.path.dirname(target)
+            if not _is_within(parent, real_prefix):
+                raise Exception(f"归档路径经符号链接指向目标前缀之外: {target}")
+            os.makedirs(parent, exist_ok=True)
+            return parent
+
+        pending_slots = MAX_PENDING_BYTES // (1024 * 1024)
+        pending = threading.Semaphore(pending_slots)
+        warnings = []
+        manifest = None
+        futures = []
+        count = 0
+
+        def write_file(path: str, data: bytes, mode: int, placeholder: Optional[str], reserved: int):
+            try:
+                if placeholder:
+                    try:
+                        data = replace_prefix(data, placeholder, manifest["prefix"], dest_prefix)
+                    except ValueError as e:
+                        warnings.append(f"{path}: {e}")
+                with open(path, "wb") as f:
+                    f.write(data)
+                os.chmod(path, mode)
+            finally:
+                for _ in range(reserved):
+                    pending.release()
+
+        workers = threads or min(32, (os.cpu_count() or 1) * 2)
+        with open(archive, "rb") as fh, zstd.ZstdDecompressor().stream_reader(fh) as reader, \
+                tarfile.open(fileobj=reader, mode="r|") as tar, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            for member in tar:
+                if member.name == MANIFEST_NAME:
+                    manifest = json.loads(tar.extractfile(member).read().decode("utf-8"))
+                    continue
+                if manifest is None:
+                    raise Exception("归档缺少清单文件，不是 conda_pack_env 生成的归档")
+                if not _is_safe_member(member.name):
+                    raise Exception(f"归档包含非法路径: {member.name}")
+
+                target = os.path.join(dest_prefix, member.name)
+                if member.isdir():
+                    checked_parent(target)
+                    os.makedirs(target, exist_ok=True)
+                elif member.issym():
+                    parent = checked_parent(target)
+                    linkname = member.linkname
+                    # 指向原前缀内的绝对链接改为指向新前缀
+                    old_prefix = manifest["prefix"].rstrip("/\\")
+                    if linkname == old_prefix or linkname.startswith(old_prefix + "/"):
+                        linkname = dest_prefix + linkname[len(old_prefix):]
+                    if not _is_within(os.path.join(parent, linkname), real_prefix):
+                        raise Exception(f"归档包含指向目标前缀之外的符号链接: {member.name} -> {member.linkname}")
+                    os.symlink(linkname, target)
+                elif member.isreg():
+                    checked_parent(target)
+                    if os.path.islink(target) and not _is_within(target, real_prefix):
+                        raise Exception(f"归档路径经符号链接指向目标前缀之外: {member.name}")
+                    # tar 流只能顺序读取，读出后交给线程池并行写盘与重写前缀
+                    reserved = min(pending_slots, max(1, member.size // (1024 * 1024)))
+                    for _ in range(reserved):
+                        pending.acquire()
+                    data = tar.extractfile(member).read()
+                    futures.append(pool.submit(
+                        write_file, target, data, member.mode,
+                        manifest["placeholders"].get(member.name), reserved
+                    ))
+
+                count += 1
+                if progress_cb and manifest.get("files"):
+                    progress_cb(int(count * 100 / manifest["files"]), f"正在解压: {member.name}")
+
+            for future in futures:
+                future.result()
+
+        msg = f"环境解压成功：{dest_prefix}（{count} 个文件）"
+        if warnings:
+            msg += f"，{len(warnings)} 个文件前缀未能重写"
+        return {"status": "success", "msg": msg, "prefix": dest_prefix, "files": count, "warnings": warnings}
+    except Exception as e:
+        return {"status": "failed", "msg": f"解压失败: {str(e)}"}
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Conda 环境打包/解包工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_pack = sub.add_parser("pack", help="打包环境")
+    p_pack.add_argument("--prefix", "-p", required=True)
+    p_pack.add_argument("--output", "-o", required=True)
+    p_pack.add_argument("--threads", "-t", type=int, default=-1)
+    p_pack.add_argument("--level", "-l", type=int, default=3)
+
+    p_unpack = sub.add_parser("unpack", help="解压环境")
+    p_unpack.add_argument("archive")
+    p_unpack.add_argument("--prefix", "-p", required=True)
+    p_unpack.add_argument("--threads", "-t", type=int, default=None)
+
+    args = parser.parse_args()
+    if args.command == "pack":
+        result = pack_env(args.prefix, args.output, threads=args.threads, level=args.level)
+    else:
+        result = unpack_env(args.archive, args.prefix, threads=args.threads)
+
+    print(result["msg"])
+    sys.exit(1 if result["status"] == "failed" else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+pip 依赖安装阶段（从 YAML 创建环境时，在 conda 阶段之后单独执行）
+- 服务器端持久 wheel 缓存（PIP_WHEEL_DIR，默认 ~/.conda_env_manager/wheels），所有环境共用
+- 依赖全部固定版本（==、=== 或直接引用 name @ url）时，先只用缓存离线安装
+  （pip install --no-index --find-links <缓存>），缓存齐全时完全不访问网络；
+  有未固定版本的依赖时不走离线安装（否则总会装上缓存里的旧版本），直接进入下面的获取步骤
+- 缓存不全时把依赖分成最多 PIP_JOBS 份（默认 4），并行执行 pip wheel --no-deps 把列出的依赖下载 / 构建进缓存，
+  再对完整的依赖列表执行一次带依赖的 pip wheel（已缓存的经 --find-links 直接复用），补齐 YAML 中未列出的间接依赖；
+  缓存补齐后离线安装，下次相同的依赖即可命中；补齐失败时最终安装仍允许访问索引
+- 同一缓存目录的 wheel 获取逐个环境进行：后一个环境经 --find-links 直接复用前一个已获取的 wheel，
+  相同的 wheel 不会被并发重复下载 / 构建
+- pip 经 conda run 在目标环境中执行，与在激活的环境中安装一致；具体执行交给调用方的 run 回调，
+  以便统一记录阶段、支持取消与超时
+"""
+
+import os
+import re
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+PIP_JOBS = int(os.environ.get("PIP_JOBS", "4"))
+# 随每份依赖一起传给 pip wheel 的选项（索引地址等）；其余选项行（-e、-r 等）只在最终安装时使用
+INDEX_OPTIONS = ("-i", "--index-url", "--extra-index-url", "-f", "--find-links", "--trusted-host", "--pre")
+
+
+def default_wheel_dir() -> str:
+    return os.environ.get("PIP_WHEEL_DIR") or os.path.join(
+        os.path.expanduser("~"), ".conda_env_manager", "wheels")
+
+
+def split_requirements(lines: List[str]) -> Tuple[List[str], List[str]]:
+    """把 YAML pip: 部分拆成 (索引选项行, 普通依赖行)；其余选项行两边都不含"""
+    options, requirements = [], []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("-"):
+            if line.split("=", 1)[0].split()[0] in INDEX_OPTIONS:
+                options.append(line)
+        else:
+            requirements.append(line)
+    return options, requirements
+
+
+def is_pinned(requirement: str) -> bool:
+    """依赖是否固定到唯一版本：name==1.2.3（无通配符、无其他约束）、name===x 或 name @ url"""
+    requirement = requirement.split(";", 1)[0].strip()
+    if " @ " in requirement or "===" in requirement:
+        return True
+    return re.fullmatch(r"[A-Za-z0-9_.\-\[\], ]+==\s*[^,*<>!~=\s]+", requirement) is not None
+
+
+def pip_args(env_name: str, *args: str) -> List[str]:
+    """在环境中执行 python -m pip 的 conda 参数"""
+    return ["run", "--name", env_name, "--no-capture-output", "python", "-m", "pip"] + list(args)
+
+
+def _write_requirements(lines: List[str]) -> str:
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return f.name
+
+
+class PipStage:
+    """带持久 wheel 缓存的 pip 安装（线程安全，多个环境可同时使用）"""
+
+    def __init__(self, wheel_dir: Optional[str] = None, jobs: int = PIP_JOBS):
+        self.wheel_dir = wheel_dir or default_wheel_dir()
+        self.jobs = max(1, jobs)
+        self._fetch_lock = threading.Lock()
+        os.makedirs(self.wheel_dir, exist_ok=True)
+
+    def install(self, env_name: str, lines: List[str], run: Callable[[List[str], str], str],
+                on_fetch_error: Optional[Callable[[Exception], None]] = None, fatal: Tuple[type, ...] = ()) -> Dict:
+        """
+        安装 pip 依赖行；run(conda 参数, 阶段名) 执行命令，失败时抛出异常
+        阶段：pip-install（离线安装 / 最终安装）、pip-fetch（并行获取 wheel）
+        单份 wheel 获取失败不中断（交给 on_fetch_error），以最终安装的结果为准；fatal 中的异常（如任务取消）直接抛出
+        返回 {"cache": "hit"/"miss"/"unpinned"（有未固定版本的依赖，未尝试离线安装）, "requirements", "jobs",
+        "complete": 缓存是否已补齐, "fetch_time", "install_time", "wall_time"}（秒）
+        """
+        start = time.perf_counter()
+        options, requirements = split_requirements(lines)
+        # 有未固定版本的依赖时不尝试离线安装：缓存中的旧版本也能满足，却不一定是索引上的最新版本
+        pinned = all(is_pinned(requirement) for requirement in requirements)
+        timing = {"cache": "hit" if pinned else "unpinned", "requirements": len(requirements), "jobs": 0,
+                  "complete": True, "fetch_time": 0.0}
+        full = _write_requirements(lines)
+        try:
+            if pinned:
+                try:
+                    run(pip_args(env_name, "install", "--no-index", "--find-links", self.wheel_dir, "-r", full),
+                        "pip-install")
+                except fatal:
+                    raise
+                except Exception:
+                    timing["cache"] = "miss"
+            if timing["cache"] != "hit":
+                fetch_start = time.perf_counter()
+                with self._fetch_lock:
+                    timing["jobs"] = self._fetch(env_name, options, requirements, run, on_fetch_error, fatal)
+                    timing["complete"] = self._fetch_dependencies(env_name, full, run, on_fetch_error, fatal)
+                timing["fetch_time"] = round(time.perf_counter() - fetch_start, 3)
+                install_start = time.perf_counter()
+                # 获取步骤已按索引取得最新版本，缓存补齐后离线安装即可
+                no_index = ["--no-index"] if timing["complete"] else []
+                run(pip_args(env_name, "install", *no_index, "--find-links", self.wheel_dir, "-r", full),
+                    "pip-install")
+                timing["install_time"] = round(time.perf_counter() - install_start, 3)
+        finally:
+            os.remove(full)
+        timing["wall_time"] = round(time.perf_counter() - start, 3)
+        timing.setdefault("install_time", timing["wall_time"])
+        return timing
+
+    def _fetch(self, env_name: str, options: List[str], requirements: List[str],
+               run: Callable[[List[str], str], str], on_fetch_error, fatal: Tuple[type, ...]) -> int:
+        """按轮转把依赖分成若干份，并行 pip wheel --no-deps 到缓存目录；返回并行份数"""
+        chunks = [chunk for chunk in (requirements[i::self.jobs] for i in range(self.jobs)) if chunk]
+        if not chunks:
+            return 0
+
+        def fetch(chunk: List[str]):
+            path = _write_requirements(options + chunk)
+            try:
+                run(pip_args(env_name, "wheel", "--no-deps", "--find-links", self.wheel_dir,
+                             "--wheel-dir", self.wheel_dir, "-r", path), "pip-fetch")
+            except fatal:
+                raise
+            except Exception as e:
+                if on_fetch_error is None:
+                    raise
+                on_fetch_error(e)
+            finally:
+                os.remove(path)
+
+        with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix="pip-fetch") as pool:
+            for future in [pool.submit(fetch, chunk) for chunk in chunks]:
+                future.result()
+        return len(chunks)
+
+    def _fetch_dependencies(self, env_name: str, full: str, run: Callable[[List[str], str], str],
+                            on_fetch_error, fatal: Tuple[type, ...]) -> bool:
+        """带依赖地对完整列表执行一次 pip wheel，把间接依赖补进缓存；返回缓存是否已补齐"""
+        try:
+            run(pip_args(env_name, "wheel", "--find-links", self.wheel_dir, "--wheel-dir", self.wheel_dir,
+                         "-r", full), "pip-fetch")
+            return True
+        except fatal:
+            raise
+        except Exception as e:
+            if on_fetch_error is None:
+                raise
+            on_fetch_error(e)
+            return False
+
+    def status(self) -> Dict:
+        wheels = [fn for fn in os.listdir(self.wheel_dir) if fn.endswith(".whl")]
+        size = sum(os.path.getsize(os.path.join(self.wheel_dir, fn)) for fn in wheels)
+        return {"wheel_dir": self.wheel_dir, "wheels": len(wheels), "size": size, "jobs": self.jobs}
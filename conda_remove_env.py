@@ -11,10 +11,10 @@ Anaconda 虚拟环境管理器（GUI 版）
 
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import subprocess
 import sys
 import json
 import threading
+from conda_runner import CondaTimeout, run_streaming
 
 
 class CondaEnvManager:
@@ -78,25 +78,17 @@ class CondaEnvManager:
         self.log_text.see(tk.END)
         self.log_text.config(state='disabled')
 
-    def run_conda_cmd(self, args):
+    def run_conda_cmd(self, args, on_line=None):
+        """执行 conda 命令；给出 on_line 时实时逐行回调输出（只保留末尾若干行），否则返回完整 stdout"""
         try:
-            result = subprocess.run(
-                ["conda"] + args,
-                capture_output=True,
-                text=True,
-                encoding='utf-8',
-                errors='replace',  # 关键！替换非法字符
-                check=True,
-                timeout=30
-            )
-            return result.stdout
-        except subprocess.CalledProcessError as e:
-            stderr = e.stderr.strip() if e.stderr else ""
-            stdout = e.stdout.strip() if e.stdout else ""
-            msg = f"Conda 命令失败\nSTDOUT: {stdout}\nSTDERR: {stderr}"
-            raise Exception(msg)
+            result = run_streaming(["conda"] + args, on_line, keep_output=on_line is None)
+        except CondaTimeout as e:
+            raise Exception(f"命令执行超时：{e}")
         except FileNotFoundError:
             raise Exception("未找到 conda 命令")
+        if result.returncode != 0:
+            raise Exception(f"Conda 命令失败\n{result.error_detail()}")
+        return result.stdout
 
     def get_conda_envs(self):
         # 只使用 conda env list --json，更简洁可靠
@@ -196,7 +188,8 @@ class CondaEnvManager:
         for env in selected_envs:
             self.root.after(0, lambda e=env: self.log(f"正在删除 {e['name']} ..."))
             try:
-                self.run_conda_cmd(["env", "remove", "--name", env["name"], "--yes"])
+                self.run_conda_cmd(["env", "remove", "--name", env["name"], "--yes"],
+                                   on_line=lambda line: self.root.after(0, self.log, line))
                 self.root.after(0, lambda e=env: self.log(f"✅ {e['name']} 删除成功"))
             except Exception as e:
                 self.root.after(0, lambda e=env, err=str(e): self.log(f"❌ {e['name']} 删除失败: {err}", error=True))
@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+环境修订（conda-meta/history）与快速回滚
+- 解析 history 得到各修订的增删包，以及任一修订时环境中的包集合
+- 回滚按“当前已安装的包”与“目标修订的包”之差计算最小变更：先强制移除（conda remove --force，
+  不求解）多出 / 版本不同的包，再按显式包列表（@EXPLICIT，不求解）安装缺少的包；
+  显式列表的 URL 取自 pkgs 缓存中的 repodata_record.json 或缓存的包文件
+- 快照：把环境目录硬链接复制到快照目录（跨设备时复制），恢复时同样硬链接出一份再原子地换入，
+  与环境大小基本无关；conda-meta 下的文件（history 等会被原地追加）始终复制；
+  conda 以“删除后重建”的方式更新文件，因此与快照共享 inode 的文件不会被后续安装改写；
+  恢复后沿用换入前的 history 并追加一个修订，已有的修订号保持不变
+- 快照目录：环境变量 ENV_SNAPSHOT_DIR（默认 <envs_dir>/.snapshots，与环境在同一文件系统才能硬链接），
+  每个环境保留最近 ENV_SNAPSHOT_KEEP 个（默认 3）
+- 只涉及 conda 包；pip 安装的包不记录在 history 中
+"""
+
+import os
+import re
+import json
+import time
+import shutil
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+ENV_SNAPSHOT_KEEP = int(os.environ.get("ENV_SNAPSHOT_KEEP", "3"))
+PACKAGE_SUFFIXES = (".conda", ".tar.bz2")
+# 复制而不是硬链接的目录（会被原地修改）
+COPIED_DIRS = ("conda-meta",)
+
+HEADER = re.compile(r"^==>\s*(.+?)\s*<==\s*$")
+
+
+# ========================
+# history 解析
+# ========================
+def dist_name(dist: str) -> str:
+    """"name-version-build" 中的包名"""
+    return dist.rsplit("-", 2)[0]
+
+
+def parse_history(prefix: str) -> List[Dict]:
+    """
+    解析 conda-meta/history，返回修订列表（修订号从 0 开始）：
+    [{"rev", "date", "cmd", "added": [dist], "removed": [dist]}]，dist 为 "name-version-build"（不含 channel）
+    """
+    path = os.path.join(prefix, "conda-meta", "history")
+    revisions = []
+    try:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return revisions
+    for line in lines:
+        line = line.strip()
+        header = HEADER.match(line)
+        if header:
+            revisions.append({"rev": len(revisions), "date": header.group(1), "cmd": "", "added": [], "removed": []})
+        elif not revisions or not line:
+            continue
+        elif line.startswith("# cmd:"):
+            revisions[-1]["cmd"] = line[len("# cmd:"):].strip()
+        elif line[0] in "+-":
+            dist = line[1:].split("::", 1)[-1]
+            revisions[-1]["added" if line[0] == "+" else "removed"].append(dist)
+    return revisions
+
+
+def packages_at(revisions: List[Dict], rev: int) -> Dict[str, str]:
+    """修订 rev 时环境中的包：{name: dist}"""
+    dists = set()
+    for revision in revisions[:rev + 1]:
+        dists.difference_update(revision["removed"])
+        dists.update(revision["added"])
+    return {dist_name(dist): dist for dist in dists}
+
+
+def installed_packages(prefix: str) -> Dict[str, str]:
+    """当前已安装的包（conda-meta/*.json）：{name: dist}"""
+    meta_dir = os.path.join(prefix, "conda-meta")
+    packages = {}
+    for fn in os.listdir(meta_dir):
+        if fn.endswith(".json"):
+            stem = fn[:-len(".json")]
+            packages[dist_name(stem)] = stem
+    return packages
+
+
+def package_delta(current: Dict[str, str], target: Dict[str, str]) -> Tuple[List[str], List[str]]:
+    """最小变更：(需要移除的包名, 需要安装的 dist)；版本不同的包先移除再安装"""
+    remove = sorted(name for name, dist in current.items() if target.get(name) != dist)
+    install = sorted(dist for name, dist in target.items() if current.get(name) != dist)
+    return remove, install
+
+
+def explicit_urls(dists: List[str], pkgs_dirs: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    在 pkgs 缓存中查找 dist 的下载地址：优先 <dist>/info/repodata_record.json 中的 url（附 md5），
+    其次缓存中的包文件（file:// 地址）；返回 (显式列表行, 找不到的 dist)
+    """
+    lines, missing = [], []
+    for dist in dists:
+        line = None
+        for pkgs_dir in pkgs_dirs:
+            record = os.path.join(pkgs_dir, dist, "info", "repodata_record.json")
+            if os.path.isfile(record):
+                with open(record, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if data.get("url"):
+                    line = data["url"] + (f"#{data['md5']}" if data.get("md5") else "")
+                    break
+            archive = next((os.path.join(pkgs_dir, dist + s) for s in PACKAGE_SUFFIXES
+                            if os.path.isfile(os.path.join(pkgs_dir, dist + s))), None)
+            if archive:
+                line = Path(archive).resolve().as_uri()
+                break
+        if line:
+            lines.append(line)
+        else:
+            missing.append(dist)
+    return lines, missing
+
+
+def append_revision(prefix: str, removed: List[str], added: List[str], cmd: str):
+    """按 conda 的格式在 history 末尾追加一个修订"""
+    with open(os.path.join(prefix, "conda-meta", "history"), "a", encoding="utf-8") as f:
+        f.write(f"==> {time.strftime('%Y-%m-%d %H:%M:%S')} <==\n# cmd: {cmd}\n")
+        f.writelines(f"-{dist}\n" for dist in sorted(removed))
+        f.writelines(f"+{dist}\n" for dist in sorted(added))
+
+
+# ========================
+# 硬链接快照
+# ========================
+def link_tree(source: str, target: str) -> Dict[str, int]:
+    """
+    把 source 目录树复制到 target：普通文件硬链接（失败时复制），conda-meta 下的文件复制，符号链接原样重建
+    返回 {"linked", "copied"} 文件数
+    """
+    counts = {"linked": 0, "copied": 0}
+    for root, dirs, files in os.walk(source):
+        rel = os.path.relpath(root, source)
+        target_root = os.path.normpath(os.path.join(target, rel))
+        os.makedirs(target_root, exist_ok=True)
+        copy_only = rel.split(os.sep)[0] in COPIED_DIRS
+        for name in dirs + files:
+            src = os.path.join(root, name)
+            dst = os.path.join(target_root, name)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+                if name in dirs:
+                    dirs.remove(name)
+            elif name in files:
+                if not copy_only:
+                    try:
+                        os.link(src, dst)
+                        counts["linked"] += 1
+                        continue
+                    except OSError:
+                        pass
+                shutil.copy2(src, dst)
+                counts["copied"] += 1
+    return counts
+
+
+class SnapshotStore:
+    """环境快照：<root>/<环境名>/<快照 id>/ 为环境目录的硬链接副本，<快照 id>.json 为其元数据"""
+
+    def __init__(self, root: str, keep: int = ENV_SNAPSHOT_KEEP):
+        self.root = root
+        self.keep = keep
+
+    def _env_dir(self, env: str) -> str:
+        return os.path.join(self.root, env)
+
+    def list(self, env: str) -> List[Dict]:
+        """环境的快照（新的在前）"""
+        snapshots = []
+        try:
+            names = os.listdir(self._env_dir(env))
+        except OSError:
+            return snapshots
+        for fn in names:
+            if fn.endswith(".json"):
+                try:
+                    with open(os.path.join(self._env_dir(env), fn), "r", encoding="utf-8") as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+        return sorted(snapshots, key=lambda s: s["created_at"], reverse=True)
+
+    def create(self, env: str, prefix: str) -> Dict:
+        """为环境当前状态建立快照，并淘汰超出保留数量的旧快照"""
+        start = time.perf_counter()
+        snap_id = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+        target = os.path.join(self._env_dir(env), snap_id)
+        os.makedirs(self._env_dir(env), exist_ok=True)
+        counts = link_tree(prefix, target)
+        revisions = parse_history(prefix)
+        meta = {
+            "id": snap_id, "env": env, "revision": len(revisions) - 1,
+            "packages": installed_packages(prefix), "created_at": round(time.time(), 3),
+            "seconds": round(time.perf_counter() - start, 3), **counts,
+        }
+        with open(target + ".json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        for old in self.list(env)[self.keep:]:
+            self.delete(env, old["id"])
+        return meta
+
+    def find(self, env: str, packages: Dict[str, str]) -> Optional[Dict]:
+        """包集合与 packages 完全相同的最新快照"""
+        return next((s for s in self.list(env) if s["packages"] == packages), None)
+
+    def restore(self, env: str, snap_id: str, prefix: str) -> Dict:
+        """
+        用快照替换环境目录：先在环境目录旁（同一父目录，两次 rename 都不跨文件系统）硬链接出一份
+        （快照本身保留；快照目录在其他文件系统时复制），再两次 rename 换入，旧目录随后删除；
+        history 沿用换入前的内容并追加本次变化；返回 link_tree 的计数
+        """
+        source = os.path.join(self._env_dir(env), snap_id)
+        if not os.path.isdir(source):
+            raise FileNotFoundError(f"快照不存在: {snap_id}")
+        parent, base = os.path.split(os.path.normpath(prefix))
+        staging = os.path.join(parent, f".{base}.restore-{uuid.uuid4().hex[:8]}")
+        retired = os.path.join(parent, f".{base}.old-{uuid.uuid4().hex[:8]}")
+        try:
+            counts = link_tree(source, staging)
+            before = installed_packages(prefix)
+            after = installed_packages(staging)
+            shutil.copy2(os.path.join(prefix, "conda-meta", "history"),
+                         os.path.join(staging, "conda-meta", "history"))
+            append_revision(staging, [d for d in before.values() if d not in after.values()],
+                            [d for d in after.values() if d not in before.values()],
+                            f"restore snapshot {snap_id}")
+            os.rename(prefix, retired)
+            try:
+                os.rename(staging, prefix)
+            except OSError:
+                os.rename(retired, prefix)
+                raise
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        shutil.rmtree(retired, ignore_errors=True)
+        return counts
+
+    def delete(self, env: str, snap_id: str):
+        shutil.rmtree(os.path.join(self._env_dir(env), snap_id), ignore_errors=True)
+        try:
+            os.remove(os.path.join(self._env_dir(env), snap_id + ".json"))
+        except OSError:
+            pass
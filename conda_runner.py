@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+流式执行 conda 命令（API 服务、conda 后端与各 GUI 脚本共用）
+- 逐行读取 stdout / stderr 并实时交给回调，不必等命令结束
+- 超时按“连续无输出的时长”判断（CONDA_INACTIVITY_TIMEOUT，默认 600 秒），慢但仍在推进的
+  创建 / 删除不会被误判为失败；另可设总时长上限（CONDA_MAX_RUNTIME，默认 0 表示不限）
+- 默认只保留最后 TAIL_LINES 行输出（用于错误信息），输出再多也只占用固定内存；
+  需要完整输出（如 --json 查询）时传 keep_output=True
+- conda 运行在独立的进程组中，超时 / 取消时连同其子进程一起结束
+"""
+
+import os
+import queue
+import time
+import signal
+import threading
+import subprocess
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+INACTIVITY_TIMEOUT = float(os.environ.get("CONDA_INACTIVITY_TIMEOUT", "600"))
+MAX_RUNTIME = float(os.environ.get("CONDA_MAX_RUNTIME", "0"))
+# 保留的末尾输出行数
+TAIL_LINES = 200
+# 超时后发出 SIGTERM，等待这么久仍未退出则 SIGKILL
+KILL_GRACE = 5.0
+
+
+class CondaTimeout(Exception):
+    """命令超时（长时间无输出或超过总时长上限），其进程组已被结束"""
+
+
+class StreamResult:
+    """命令结果：returncode；stdout / stderr（仅 keep_output=True 时为完整输出）；
+    tail 为按到达顺序合并的最后若干行；cpu_time 为子进程 CPU 时间（秒，平台不支持时为 None）"""
+
+    def __init__(self, returncode: int, stdout: str, stderr: str, tail: List[str], cpu_time: Optional[float]):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.tail = tail
+        self.cpu_time = cpu_time
+
+    def error_detail(self, lines: int = 20) -> str:
+        """失败时用于提示的最后若干行非空输出"""
+        return "\n".join([line for line in self.tail if line.strip()][-lines:])
+
+
+def popen_group_kwargs() -> Dict:
+    """让子进程运行在独立的进程组中，结束时可以连同其子进程一起结束"""
+    if os.name == "nt":
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def kill_process_group(pid: int, force: bool = False) -> bool:
+    """结束以 pid 为组长的进程组；进程组已不存在时返回 False"""
+    try:
+        if os.name == "nt":
+            args = ["taskkill", "/T", "/PID", str(pid)] + (["/F"] if force else [])
+            return subprocess.run(args, capture_output=True).returncode == 0
+        os.killpg(pid, signal.SIGKILL if force else signal.SIGTERM)
+        return True
+    except (ProcessLookupError, PermissionError):
+        return False
+
+
+def wait_process(process: subprocess.Popen) -> Optional[float]:
+    """等待子进程结束，返回其 CPU 时间（用户态 + 内核态，秒）；平台不支持时返回 None"""
+    if hasattr(os, "wait4"):
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return round(rusage.ru_utime + rusage.ru_stime, 3)
+    process.wait()
+    return None
+
+
+def _pump(name: str, stream, lines: queue.Queue):
+    for line in stream:
+        lines.put((name, line.rstrip("\r\n")))
+    lines.put((name, None))
+
+
+def _terminate(process: subprocess.Popen):
+    kill_process_group(process.pid)
+    try:
+        process.wait(timeout=KILL_GRACE)
+    except subprocess.TimeoutExpired:
+        kill_process_group(process.pid, force=True)
+        process.wait()
+
+
+def run_streaming(cmd: List[str], on_line: Optional[Callable[[str], None]] = None,
+                  inactivity_timeout: Optional[float] = None, max_runtime: Optional[float] = None,
+                  keep_output: bool = False, on_start: Optional[Callable[[subprocess.Popen], None]] = None
+                  ) -> StreamResult:
+    """
+    执行命令并逐行回调 on_line(行)（stdout 与 stderr 都会回调，在调用线程中执行）
+    on_start(process) 在进程启动后立即调用（如登记进程号供取消使用）
+    超时抛出 CondaTimeout；回调抛出异常时先结束进程组再向上抛出
+    """
+    inactivity_timeout = INACTIVITY_TIMEOUT if inactivity_timeout is None else inactivity_timeout
+    max_runtime = MAX_RUNTIME if max_runtime is None else max_runtime
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        **popen_group_kwargs()
+    )
+    lines: queue.Queue = queue.Queue()
+    for name, stream in (("stdout", process.stdout), ("stderr", process.stderr)):
+        threading.Thread(target=_pump, args=(name, stream, lines), daemon=True).start()
+
+    tail = deque(maxlen=TAIL_LINES)
+    output = {"stdout": [], "stderr": []}
+    start = last_output = time.monotonic()
+    open_streams = 2
+    try:
+        if on_start:
+            on_start(process)
+        while open_streams:
+            now = time.monotonic()
+            wait = inactivity_timeout - (now - last_output) if inactivity_timeout else None
+            if max_runtime:
+                remaining = max_runtime - (now - start)
+                wait = remaining if wait is None else min(wait, remaining)
+            if wait is not None and wait <= 0:
+                _terminate(process)
+                if max_runtime and now - start >= max_runtime:
+                    raise CondaTimeout(f"命令执行超过 {max_runtime:g} 秒上限，已终止")
+                raise CondaTimeout(f"命令连续 {inactivity_timeout:g} 秒无输出，已终止")
+            try:
+                name, line = lines.get(timeout=wait)
+            except queue.Empty:
+                continue
+            if line is None:
+                open_streams -= 1
+                continue
+            last_output = time.monotonic()
+            tail.append(line)
+            if keep_output:
+                output[name].append(line)
+            if on_line:
+                on_line(line)
+    except BaseException:
+        if process.poll() is None:
+            _terminate(process)
+        raise
+    cpu_time = wait_process(process)
+    return StreamResult(process.returncode, "\n".join(output["stdout"]), "\n".join(output["stderr"]),
+                        list(tail), cpu_time)
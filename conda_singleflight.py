@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+单飞（single-flight）合并：同一时刻对同一个键的重复调用只真正执行一次，
+其余调用方等待并共享这一次的结果（或异常）
+- 用于环境清单刷新、Python 版本探测等昂贵且幂等的查询
+- 被合并掉的调用数计入 singleflight_deduplicated_total{kind}
+"""
+
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+from conda_metrics import SINGLEFLIGHT_DEDUPLICATED
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], kind: str = "other") -> Any:
+        """执行 fn()；若同键调用正在进行，则等待其完成并返回同一结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            SINGLEFLIGHT_DEDUPLICATED.inc(kind=kind)
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+依赖解析结果缓存
+- 以规范化后的 (specs, channels, platform, solver) 为键，保存解析得到的显式包列表（conda list --explicit）
+- 命中时直接用显式列表创建环境（conda create --file，不再调用求解器）；显式安装失败时由调用方作废该条目
+- 显式列表直接读取新环境的 conda-meta/*.json 生成（不经可能带有旧缓存的常驻 conda 进程），
+  且只在列表包含所有请求的包名时写入缓存
+- 淘汰：超过 SOLVE_CACHE_TTL 秒（默认 7 天）的条目失效；条目数超过 SOLVE_CACHE_MAX（默认 200）时
+  按最近使用时间淘汰最久未用的
+- 存储在 SQLite（WAL）中，多个 worker 共享：环境变量 SOLVE_CACHE_DB（默认 ~/.conda_env_manager/solve_cache.db，
+  ":memory:" 表示不落盘）
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import List, Optional, Sequence
+
+SOLVE_CACHE_TTL = float(os.environ.get("SOLVE_CACHE_TTL", str(7 * 24 * 3600)))
+SOLVE_CACHE_MAX = int(os.environ.get("SOLVE_CACHE_MAX", "200"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS solve_cache (
+    key TEXT PRIMARY KEY,
+    explicit TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS solve_cache_last_used ON solve_cache (last_used);
+"""
+
+
+def default_db_path() -> str:
+    return os.environ.get("SOLVE_CACHE_DB") or os.path.join(
+        os.path.expanduser("~"), ".conda_env_manager", "solve_cache.db")
+
+
+def normalize_spec(spec: str) -> str:
+    """规范化单个 spec：去掉多余空白，包名小写（"NumPy >= 1.26" → "numpy>=1.26"）"""
+    spec = re.sub(r"\s+", "", spec)
+    match = re.match(r"([A-Za-z0-9_.\-]+)(.*)", spec)
+    return match.group(1).lower() + match.group(2) if match else spec
+
+
+def solve_key(specs: Sequence[str], channels: Sequence[str], platform: str, solver: str) -> str:
+    """缓存键：spec 顺序无关（排序去重），channel 顺序影响解析结果故保留"""
+    payload = {
+        "specs": sorted(set(normalize_spec(s) for s in specs if s.strip())),
+        "channels": [c.rstrip("/") for c in channels],
+        "platform": platform or "",
+        "solver": solver or "",
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def spec_name(spec: str) -> str:
+    """spec 中的包名（"conda-forge::NumPy>=1.26" → "numpy"）"""
+    match = re.match(r"[A-Za-z0-9_.\-]+", spec.split("::")[-1].strip())
+    return match.group(0).lower() if match else ""
+
+
+def explicit_from_prefix(prefix: str, platform: str = "") -> str:
+    """按前缀的 conda-meta/*.json 生成显式包列表（与 conda list --explicit 相同的格式，附 md5）"""
+    lines = [f"# platform: {platform}", "@EXPLICIT"]
+    meta_dir = os.path.join(prefix, "conda-meta")
+    for fn in sorted(os.listdir(meta_dir)):
+        if not fn.endswith(".json"):
+            continue
+        with open(os.path.join(meta_dir, fn), "r", encoding="utf-8") as f:
+            record = json.load(f)
+        url = record.get("url") or "/".join((record["channel"].rstrip("/"), record["subdir"], record["fn"]))
+        lines.append(url + (f"#{record['md5']}" if record.get("md5") else ""))
+    return "\n".join(lines) + "\n"
+
+
+def missing_specs(explicit: str, specs: Sequence[str]) -> List[str]:
+    """显式列表中没有的请求包名"""
+    names = set()
+    for line in explicit.splitlines():
+        if line.strip() and not line.startswith(("#", "@")):
+            stem = line.split("#")[0].rstrip("/").rsplit("/", 1)[-1]
+            for suffix in (".conda", ".tar.bz2"):
+                if stem.endswith(suffix):
+                    stem = stem[:-len(suffix)]
+            names.add(stem.rsplit("-", 2)[0].lower())
+    return [spec for spec in specs if spec.strip() and spec_name(spec) not in names]
+
+
+class SolveCache:
+    """解析结果缓存（线程安全）"""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = SOLVE_CACHE_TTL, max_entries: int = SOLVE_CACHE_MAX):
+        path = path or default_db_path()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def get(self, key: str) -> Optional[str]:
+        """返回未过期的显式包列表并更新最近使用时间；没有时返回 None"""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT explicit FROM solve_cache WHERE key = ? AND created_at > ?",
+                                     (key, now - self.ttl)).fetchone()
+            if row:
+                self._conn.execute("UPDATE solve_cache SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        return row[0] if row else None
+
+    def put(self, key: str, explicit: str):
+        """保存显式包列表，并淘汰过期与超出容量的条目"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO solve_cache (key, explicit, created_at, last_used) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET explicit = excluded.explicit, created_at = excluded.created_at,"
+                " last_used = excluded.last_used",
+                (key, explicit, now, now),
+            )
+            self._conn.execute("DELETE FROM solve_cache WHERE created_at <= ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM solve_cache WHERE key IN "
+                "(SELECT key FROM solve_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def invalidate(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM solve_cache WHERE key = ?", (key,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, hits = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(hits), 0) FROM solve_cache").fetchone()
+        return {"entries": count, "hits": hits, "max_entries": self.max_entries, "ttl": self.ttl}
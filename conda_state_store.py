@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+服务共享状态存储（任务记录、进行中任务登记、幂等键、清单缓存、最近日志）
+- MemoryStateStore：进程内字典，单进程运行时开销最小
+- SqliteStateStore：SQLite（WAL 模式），同一主机上的多个 uvicorn worker 共享同一个数据库文件，
+  任一 worker 提交的任务都能被其他 worker 查询到
+- 选择：环境变量 STATE_STORE=memory / sqlite（默认 sqlite），数据库路径 STATE_DB
+  （默认 ~/.conda_env_manager/state.db）
+- SQLite 中每个 worker 每 STATE_HEARTBEAT 秒（默认 10）记录一次心跳，进行中任务的登记与任务记录都带有所属 worker；
+  超过 STATE_WORKER_TIMEOUT 秒（默认 60）没有心跳的 worker 视为已退出：其登记被释放、未结束的任务记为失败，
+  worker 崩溃或重启后环境不会一直处于“正有其他任务进行中”
+- 没有其他存活 worker 时启动（即服务重新启动）会清空缓存表：清单缓存等只在本次运行内有效
+- 已结束的任务记录保留 TASK_RETENTION 秒（默认 7 天），最多 TASK_KEEP 条（默认 1000）
+"""
+
+import os
+import copy
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS env_tasks (
+    env TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    task_id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    line TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    pid INTEGER NOT NULL,
+    heartbeat REAL NOT NULL
+);
+"""
+# 早期版本的数据库缺少的列
+MIGRATIONS = (
+    "ALTER TABLE tasks ADD COLUMN status TEXT",
+    "ALTER TABLE tasks ADD COLUMN worker TEXT",
+    "ALTER TABLE env_tasks ADD COLUMN worker TEXT",
+    "CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, updated_at)",
+)
+
+# 最近日志保留条数
+LOG_KEEP = 1000
+STATE_HEARTBEAT = float(os.environ.get("STATE_HEARTBEAT", "10"))
+STATE_WORKER_TIMEOUT = float(os.environ.get("STATE_WORKER_TIMEOUT", "60"))
+TASK_RETENTION = float(os.environ.get("TASK_RETENTION", str(7 * 24 * 3600)))
+TASK_KEEP = int(os.environ.get("TASK_KEEP", "1000"))
+# 未结束的任务状态（不参与淘汰；所属 worker 退出后记为失败）
+ACTIVE_STATUSES = ("queued", "running", "cancelling")
+INTERRUPTED_STAGE = "服务进程已退出，任务中断"
+
+
+class MemoryStateStore:
+    """进程内状态（仅适用于单个 worker）；任务记录存取时深拷贝，与 SQLite 的序列化语义一致"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks: Dict[str, Dict] = {}
+        self._env_tasks: Dict[str, Dict] = {}
+        self._idempotency: Dict[str, Dict] = {}
+        self._cache: Dict[str, tuple] = {}
+        self._counters: Dict[str, int] = {}
+        self._logs: List[str] = []
+
+    # ---------- 任务记录 ----------
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        return copy.deepcopy(self._tasks.get(task_id))
+
+    def put_task(self, task_id: str, record: Dict):
+        with self._lock:
+            if task_id not in self._tasks and len(self._tasks) >= TASK_KEEP + 100:
+                # 按登记顺序淘汰最早的已结束任务
+                finished = [tid for tid, r in self._tasks.items() if r.get("status") not in ACTIVE_STATUSES]
+                for tid in finished[:len(self._tasks) - TASK_KEEP + 1]:
+                    del self._tasks[tid]
+            self._tasks[task_id] = copy.deepcopy(record)
+
+    def list_tasks(self, statuses: Optional[Sequence[str]] = None) -> List[Dict]:
+        """任务记录；给出 statuses 时只返回这些状态的任务"""
+        return [copy.deepcopy(record) for record in list(self._tasks.values())
+                if statuses is None or record.get("status") in statuses]
+
+    # ---------- 进行中任务 / 幂等键 ----------
+    def claim(self, env: str, fingerprint: tuple, idempotency_key: Optional[str], task_id: Optional[str],
+              ttl: float) -> Optional[Dict]:
+        """
+        原子地查找或登记任务：
+        已有同一幂等键或同一环境的进行中任务时返回 {"task_id", "fingerprint", "source": "idempotency"/"env"}；
+        否则在给出 task_id 时登记该任务并返回 None（task_id 为 None 时只查找）
+        """
+        with self._lock:
+            now = time.time()
+            for key in [key for key, entry in self._idempotency.items() if entry["expires"] < now]:
+                del self._idempotency[key]
+            if idempotency_key and idempotency_key in self._idempotency:
+                entry = self._idempotency[idempotency_key]
+                return {"task_id": entry["task_id"], "fingerprint": entry["fingerprint"], "source": "idempotency"}
+            running = self._env_tasks.get(env)
+            if running:
+                if idempotency_key and running["fingerprint"] == fingerprint:
+                    self._idempotency[idempotency_key] = dict(running, expires=now + ttl)
+                return dict(running, source="env")
+            if task_id is not None:
+                self._env_tasks[env] = {"task_id": task_id, "fingerprint": fingerprint}
+                if idempotency_key:
+                    self._idempotency[idempotency_key] = {"task_id": task_id, "fingerprint": fingerprint,
+                                                          "expires": now + ttl}
+            return None
+
+    def release(self, env: str, task_id: str):
+        with self._lock:
+            if self._env_tasks.get(env, {}).get("task_id") == task_id:
+                del self._env_tasks[env]
+
+    # ---------- 缓存与计数器 ----------
+    def get_cache(self, name: str) -> Any:
+        value, expires = self._cache.get(name, (None, 0.0))
+        return value if time.time() < expires else None
+
+    def set_cache(self, name: str, value: Any, ttl: float):
+        self._cache[name] = (value, time.time() + ttl)
+
+    def get_counter(self, name: str) -> int:
+        return self._counters.get(name, 0)
+
+    def incr(self, name: str) -> int:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + 1
+            return self._counters[name]
+
+    # ---------- 最近日志 ----------
+    def append_log(self, line: str):
+        with self._lock:
+            self._logs.append(line)
+            if len(self._logs) > LOG_KEEP * 2:
+                del self._logs[:-LOG_KEEP]
+
+    def recent_logs(self, limit: int = 100) -> List[str]:
+        return self._logs[-limit:]
+
+
+class SqliteStateStore:
+    """SQLite（WAL）状态，多个 worker 进程共享；每个线程使用独立连接"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.environ.get("STATE_DB") or os.path.join(
+            os.path.expanduser("~"), ".conda_env_manager", "state.db")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.worker_id = uuid.uuid4().hex
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        for statement in MIGRATIONS:
+            try:
+                conn.execute(statement)
+            except sqlite3.OperationalError:  # 列已存在
+                pass
+        self._register()
+        threading.Thread(target=self._heartbeat_loop, name="state-heartbeat", daemon=True).start()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：自动提交，需要原子性的地方显式 BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------- worker 心跳 ----------
+    def _register(self):
+        """登记本 worker；没有其他存活 worker 时（服务重新启动）清空缓存表，并回收已退出 worker 的任务"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            alive = conn.execute("SELECT COUNT(*) FROM workers WHERE heartbeat > ?",
+                                 (now - STATE_WORKER_TIMEOUT,)).fetchone()[0]
+            if not alive:
+                conn.execute("DELETE FROM cache")
+            conn.execute("INSERT INTO workers VALUES (?, ?, ?)", (self.worker_id, os.getpid(), now))
+        finally:
+            conn.execute("COMMIT")
+        self.reap()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(STATE_HEARTBEAT)
+            try:
+                self._conn().execute(
+                    "INSERT INTO workers VALUES (?, ?, ?)"
+                    " ON CONFLICT (worker_id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                    (self.worker_id, os.getpid(), time.time()))
+                self.reap()
+            except sqlite3.Error:
+                pass
+
+    def reap(self):
+        """释放已退出 worker 的登记，把其未结束的任务记为失败，并淘汰过期的已结束任务"""
+        conn = self._conn()
+        now = time.time()
+        active = ",".join("?" * len(ACTIVE_STATUSES))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM workers WHERE heartbeat <= ?", (now - STATE_WORKER_TIMEOUT,))
+            live = "SELECT worker_id FROM workers"
+            conn.execute(f"DELETE FROM env_tasks WHERE worker IS NULL OR worker NOT IN ({live})")
+            rows = conn.execute(
+                f"SELECT task_id, record FROM tasks WHERE status IN ({active})"
+                f" AND (worker IS NULL OR worker NOT IN ({live}))", ACTIVE_STATUSES).fetchall()
+            for task_id, record in rows:
+                record = dict(json.loads(record), status="failed", stage=INTERRUPTED_STAGE)
+                conn.execute("UPDATE tasks SET record = ?, status = 'failed', updated_at = ? WHERE task_id = ?",
+                             (json.dumps(record, ensure_ascii=False), now, task_id))
+            conn.execute(f"DELETE FROM tasks WHERE status NOT IN ({active}) AND updated_at < ?",
+                         ACTIVE_STATUSES + (now - TASK_RETENTION,))
+            conn.execute(
+                f"DELETE FROM tasks WHERE task_id IN (SELECT task_id FROM tasks WHERE status NOT IN ({active})"
+                " ORDER BY updated_at DESC LIMIT -1 OFFSET ?)", ACTIVE_STATUSES + (TASK_KEEP,))
+        finally:
+            conn.execute("COMMIT")
+
+    # ---------- 任务记录 ----------
+    def get_task(self, task_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT record FROM tasks WHERE task_id = ?", (task_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_task(self, task_id: str, record: Dict):
+        self._conn().execute(
+            "INSERT INTO tasks (task_id, record, updated_at, status, worker) VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (task_id) DO UPDATE SET record = excluded.record, updated_at = excluded.updated_at,"
+            " status = excluded.status, worker = excluded.worker",
+            (task_id, json.dumps(record, ensure_ascii=False), time.time(), record.get("status"), self.worker_id),
+        )
+
+    def list_tasks(self, statuses: Optional[Sequence[str]] = None) -> List[Dict]:
+        """任务记录；给出 statuses 时只返回这些状态的任务"""
+        if statuses is None:
+            rows = self._conn().execute("SELECT record FROM tasks")
+        else:
+            rows = self._conn().execute(
+                f"SELECT record FROM tasks WHERE status IN ({','.join('?' * len(statuses))})", tuple(statuses))
+        return [json.loads(row[0]) for row in rows]
+
+    # ---------- 进行中任务 / 幂等键 ----------
+    def claim(self, env: str, fingerprint: tuple, idempotency_key: Optional[str], task_id: Optional[str],
+              ttl: float) -> Optional[Dict]:
+        """语义同 MemoryStateStore.claim，在一个写事务内完成，跨进程原子；已退出 worker 的登记视为不存在"""
+        conn = self._conn()
+        encoded = json.dumps(list(fingerprint), ensure_ascii=False)
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM idempotency WHERE expires < ?", (now,))
+            if idempotency_key:
+                row = conn.execute("SELECT task_id, fingerprint FROM idempotency WHERE key = ?",
+                                   (idempotency_key,)).fetchone()
+                if row:
+                    return {"task_id": row[0], "fingerprint": tuple(json.loads(row[1])), "source": "idempotency"}
+            conn.execute("DELETE FROM env_tasks WHERE env = ? AND (worker IS NULL OR worker NOT IN"
+                         " (SELECT worker_id FROM workers WHERE heartbeat > ?))", (env, now - STATE_WORKER_TIMEOUT))
+            row = conn.execute("SELECT task_id, fingerprint FROM env_tasks WHERE env = ?", (env,)).fetchone()
+            if row:
+                if idempotency_key and row[1] == encoded:
+                    conn.execute("INSERT INTO idempotency VALUES (?, ?, ?, ?)",
+                                 (idempotency_key, row[0], row[1], now + ttl))
+                return {"task_id": row[0], "fingerprint": tuple(json.loads(row[1])), "source": "env"}
+            if task_id is not None:
+                conn.execute("INSERT INTO env_tasks (env, task_id, fingerprint, worker) VALUES (?, ?, ?, ?)",
+                             (env, task_id, encoded, self.worker_id))
+                if idempotency_key:
+                    conn.execute("INSERT INTO idempotency VALUES (?, ?, ?, ?)",
+                                 (idempotency_key, task_id, encoded, now + ttl))
+            return None
+        finally:
+            conn.execute("COMMIT")
+
+    def release(self, env: str, task_id: str):
+        self._conn().execute("DELETE FROM env_tasks WHERE env = ? AND task_id = ?", (env, task_id))
+
+    # ---------- 缓存与计数器 ----------
+    def get_cache(self, name: str) -> Any:
+        row = self._conn().execute("SELECT value FROM cache WHERE name = ? AND expires > ?",
+                                   (name, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_cache(self, name: str, value: Any, ttl: float):
+        self._conn().execute(
+            "INSERT INTO cache VALUES (?, ?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = excluded.value, expires = excluded.expires",
+            (name, json.dumps(value, ensure_ascii=False), time.time() + ttl),
+        )
+
+    def get_counter(self, name: str) -> int:
+        row = self._conn().execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else 0
+
+    def incr(self, name: str) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("INSERT INTO counters VALUES (?, 1)"
+                         " ON CONFLICT (name) DO UPDATE SET value = value + 1", (name,))
+            return conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+        finally:
+            conn.execute("COMMIT")
+
+    # ---------- 最近日志 ----------
+    def append_log(self, line: str):
+        conn = self._conn()
+        cursor = conn.execute("INSERT INTO logs (line) VALUES (?)", (line,))
+        if cursor.lastrowid % LOG_KEEP == 0:
+            conn.execute("DELETE FROM logs WHERE id <= ?", (cursor.lastrowid - LOG_KEEP,))
+
+    def recent_logs(self, limit: int = 100) -> List[str]:
+        rows = self._conn().execute("SELECT line FROM logs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+
+def get_state_store():
+    """按环境变量 STATE_STORE 选择状态存储"""
+    if os.environ.get("STATE_STORE", "sqlite").lower() == "memory":
+        return MemoryStateStore()
+    return SqliteStateStore()
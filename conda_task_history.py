@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+任务耗时历史与剩余时间（ETA）预测
+- 已完成任务的耗时按操作类型、Python 版本、源环境大小、包数量持久化到 SQLite
+- 新任务开始时，从同类历史中找最相近的若干条，得到预计总耗时与各阶段耗时
+- 运行中按实际所处阶段与已耗时计算进度与剩余时间，历史越多预测越准
+- 数据库位置：环境变量 TASK_HISTORY_DB（默认 ~/.conda_env_manager/task_history.db，":memory:" 表示不落盘）
+"""
+
+import os
+import json
+import math
+import time
+import sqlite3
+import threading
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+# 每类操作参与预测的最近记录数，以及从中选取的最相近记录数
+HISTORY_WINDOW = 200
+NEAREST = 5
+# 每类操作最多保留的记录数
+HISTORY_KEEP = 1000
+# 运行中的任务进度最多显示到 99%，超出预计时间时剩余时间显示为 0
+MAX_RUNNING_PROGRESS = 99
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    operation TEXT NOT NULL,
+    python_version TEXT NOT NULL DEFAULT '',
+    source_size INTEGER NOT NULL DEFAULT 0,
+    package_count INTEGER NOT NULL DEFAULT 0,
+    duration REAL NOT NULL,
+    phases TEXT NOT NULL DEFAULT '{}',
+    finished_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS task_history_operation ON task_history (operation, id);
+"""
+
+
+def default_db_path() -> str:
+    return os.environ.get("TASK_HISTORY_DB") or os.path.join(
+        os.path.expanduser("~"), ".conda_env_manager", "task_history.db")
+
+
+def prefix_stats(prefix: str) -> Tuple[int, int]:
+    """返回环境目录的 (总字节数, 包数量)；不跟随符号链接"""
+    size = 0
+    for root, _, files in os.walk(prefix):
+        for name in files:
+            try:
+                size += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    try:
+        packages = sum(1 for name in os.listdir(os.path.join(prefix, "conda-meta")) if name.endswith(".json"))
+    except OSError:
+        packages = 0
+    return size, packages
+
+
+class TaskHistory:
+    """任务耗时历史（线程安全）"""
+
+    def __init__(self, path: Optional[str] = None):
+        path = path or default_db_path()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        if path != ":memory:":
+            # WAL：多个 worker 进程共享同一个历史库时读写互不阻塞
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def record(self, operation: str, features: Dict, duration: float, phase_durations: Dict[str, float]):
+        """保存一次成功完成的任务"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO task_history (operation, python_version, source_size, package_count,"
+                " duration, phases, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (operation, features.get("python_version", ""), int(features.get("source_size", 0)),
+                 int(features.get("package_count", 0)), duration, json.dumps(phase_durations), time.time()),
+            )
+            self._conn.execute(
+                "DELETE FROM task_history WHERE operation = ? AND id <= "
+                "(SELECT id FROM task_history WHERE operation = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+                (operation, operation, HISTORY_KEEP),
+            )
+
+    def _recent(self, operation: str) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT python_version, source_size, package_count, duration, phases FROM task_history"
+                " WHERE operation = ? ORDER BY id DESC LIMIT ?",
+                (operation, HISTORY_WINDOW),
+            ).fetchall()
+
+    def estimate(self, operation: str, features: Dict) -> Optional[Dict]:
+        """
+        根据历史预测耗时，返回 {"total": 秒, "phases": {阶段: 秒}, "samples": 参考记录数}；无历史时返回 None
+        只比较请求中给出的特征：Python 版本优先精确匹配，大小与包数量按对数距离取最相近的记录
+        """
+        rows = self._recent(operation)
+        version = features.get("python_version")
+        if version and any(row[0] == version for row in rows):
+            rows = [row for row in rows if row[0] == version]
+        if not rows:
+            return None
+
+        size = features.get("source_size", 0)
+        packages = features.get("package_count", 0)
+
+        def distance(row):
+            d = 0.0
+            if size:
+                d += abs(math.log1p(row[1]) - math.log1p(size))
+            if packages:
+                d += abs(math.log1p(row[2]) - math.log1p(packages))
+            return d
+
+        nearest = sorted(rows, key=distance)[:NEAREST]
+        total = statistics.median(row[3] for row in nearest)
+
+        # 各阶段占比取平均后按预计总耗时分配，保持阶段顺序
+        shares: Dict[str, float] = {}
+        for row in nearest:
+            phases = json.loads(row[4])
+            duration = sum(phases.values()) or row[3] or 1.0
+            for phase, seconds in phases.items():
+                shares[phase] = shares.get(phase, 0.0) + seconds / duration / len(nearest)
+        return {
+            "total": round(total, 3),
+            "phases": {phase: round(share * total, 3) for phase, share in shares.items()},
+            "samples": len(nearest),
+        }
+
+
+def estimate_progress(expected: Dict, phases: List[Dict], now: Optional[float] = None) -> Tuple[int, float]:
+    """
+    按预计的阶段耗时计算运行中任务的 (进度百分比, 剩余秒数)
+    已经过的阶段按预计耗时计入，当前阶段按实际已耗时计入（不超过其预计耗时）
+    """
+    now = now or time.time()
+    planned = expected["phases"]
+    total = sum(planned.values()) or expected["total"]
+    if not total or not phases:
+        return 0, expected["total"]
+
+    current = phases[-1]
+    passed = set(p["phase"] for p in phases[:-1])
+    done = sum(seconds for phase, seconds in planned.items() if phase in passed)
+    in_phase = now - current["at"]
+    budget = planned.get(current["phase"], 0.0)
+    done += min(in_phase, budget)
+
+    remaining = sum(seconds for phase, seconds in planned.items()
+                    if phase not in passed and phase != current["phase"])
+    remaining += max(budget - in_phase, 0.0)
+    progress = int(min(MAX_RUNNING_PROGRESS, done / (done + remaining) * 100)) if done + remaining else 0
+    return progress, round(remaining, 1)
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+常驻 conda 工作进程池
+- 每个工作进程用 conda 自己的 Python 启动，只导入一次 conda
+- 通过管道通信，每行一个 JSON：
+    请求 {"id": 1, "args": ["env", "list", "--json"]}
+    响应 {"id": 1, "returncode": 0, "stdout": "...", "stderr": "..."}
+- 工作进程崩溃、超时或累计执行 max_jobs 次后自动重启
+- 每个请求前丢弃 conda 的进程级缓存（已安装包 PrefixData、包缓存 PackageCacheData）并重新加载配置，
+  环境被其他进程修改（删除后同名重建等）后不会读到旧数据
+- 工作进程入口：python conda_worker_pool.py --worker
+"""
+
+import io
+import os
+import sys
+import json
+import queue
+import shutil
+import threading
+import subprocess
+import contextlib
+from typing import List, Optional
+
+
+# ========================
+# 工作进程（运行在 conda base 环境中）
+# ========================
+def worker_main():
+    """读取请求 → 调用 conda → 写回响应，直到 stdin 关闭"""
+    # 协议专用输出：复制一份 fd 1，然后把 fd 1 指向 stderr，
+    # 防止 conda 或其子进程直接写 fd 1 破坏 JSON 帧
+    proto_out = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+    os.dup2(2, 1)
+    proto_in = sys.stdin
+
+    from conda.cli.main import main_subshell
+    from conda.exception_handler import conda_exception_handler
+
+    for line in proto_in:
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        out, err = io.StringIO(), io.StringIO()
+        try:
+            reset_conda_state()
+            # 屏蔽交互式确认（stdin 是协议管道，不能被 conda 读取）
+            with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+                sys.stdin = io.StringIO("")
+                returncode = conda_exception_handler(main_subshell, *request["args"])
+        except SystemExit as e:
+            returncode = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            err.write(str(e))
+            returncode = 1
+        finally:
+            sys.stdin = proto_in
+        proto_out.write(json.dumps({
+            "id": request["id"],
+            "returncode": returncode or 0,
+            "stdout": out.getvalue(),
+            "stderr": err.getvalue(),
+        }, ensure_ascii=False) + "\n")
+
+
+def reset_conda_state():
+    """丢弃上一个请求留下的 conda 进程级缓存，使本次请求与新启动的 conda 看到相同的状态"""
+    from conda.base.context import reset_context
+    from conda.core.prefix_data import PrefixData
+    from conda.core.package_cache_data import PackageCacheData
+    PrefixData._cache_.clear()
+    PackageCacheData._cache_.clear()
+    reset_context()
+
+
+# ========================
+# 进程池（运行在 API 服务中）
+# ========================
+def find_conda_python(conda_exe: str) -> Optional[str]:
+    """根据 conda 可执行文件推断 base 环境的 Python 路径"""
+    if not os.path.isabs(conda_exe):
+        conda_exe = shutil.which(conda_exe) or ""
+    if not conda_exe:
+        return None
+    # <root>/bin/conda、<root>/condabin/conda、<root>/Scripts/conda.exe
+    root = os.path.dirname(os.path.dirname(os.path.realpath(conda_exe)))
+    python_exe = os.path.join(root, "python.exe") if sys.platform == "win32" else os.path.join(root, "bin", "python")
+    return python_exe if os.path.exists(python_exe) else None
+
+
+def can_import_conda(python_exe: str) -> bool:
+    """该 Python 能否导入 conda（推断出的 Python 可能不是 conda 所在的环境）"""
+    try:
+        result = subprocess.run([python_exe, "-c", "import conda.cli.main"], capture_output=True,
+                                timeout=float(os.environ.get("CONDA_WORKER_PROBE_TIMEOUT", "60")))
+    except (OSError, subprocess.TimeoutExpired):
+        return False
+    return result.returncode == 0
+
+
+class _Worker:
+    """单个常驻工作进程"""
+
+    def __init__(self, python_exe: str):
+        self.jobs = 0
+        self.process = subprocess.Popen(
+            [python_exe, os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        # 响应由读线程放入队列，便于带超时等待
+        self.responses = queue.Queue()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        for line in self.process.stdout:
+            self.responses.put(line)
+        self.responses.put(None)  # EOF：进程已退出
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self):
+        if self.alive():
+            self.process.kill()
+        self.process.wait()
+
+
+class CondaWorkerPool:
+    """固定大小的 conda 工作进程池"""
+
+    def __init__(self, python_exe: str, size: int = 2, max_jobs: int = 50):
+        self.python_exe = python_exe
+        self.size = size
+        self.max_jobs = max_jobs
+        self._next_id = 0
+        self._id_lock = threading.Lock()
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(None)  # 占位：首次使用时再启动进程
+
+    def _acquire(self) -> _Worker:
+        worker = self._idle.get()
+        if worker is None or not worker.alive() or worker.jobs >= self.max_jobs:
+            if worker is not None:
+                worker.kill()
+            worker = _Worker(self.python_exe)
+        return worker
+
+    def run(self, args: List[str], timeout: int = 120) -> subprocess.CompletedProcess:
+        """在空闲工作进程中执行 conda 命令，返回 CompletedProcess"""
+        with self._id_lock:
+            self._next_id += 1
+            request_id = self._next_id
+
+        worker = self._acquire()
+        try:
+            worker.jobs += 1
+            worker.process.stdin.write(json.dumps({"id": request_id, "args": args}) + "\n")
+            worker.process.stdin.flush()
+            try:
+                line = worker.responses.get(timeout=timeout)
+            except queue.Empty:
+                worker.kill()
+                raise subprocess.TimeoutExpired(args, timeout)
+            if line is None:
+                raise Exception("conda 工作进程意外退出")
+            response = json.loads(line)
+            return subprocess.CompletedProcess(args, response["returncode"], response["stdout"], response["stderr"])
+        except (BrokenPipeError, OSError):
+            worker.kill()
+            raise Exception("conda 工作进程意外退出")
+        finally:
+            # 已退出的进程也放回池中，下次取用时会自动重启
+            self._idle.put(worker)
+
+    def close(self):
+        """关闭所有工作进程"""
+        for _ in range(self.size):
+            worker = self._idle.get()
+            if worker is not None:
+                worker.process.stdin.close()
+                worker.kill()
+
+
+def create_worker_pool(conda_exe: str) -> Optional[CondaWorkerPool]:
+    """
+    按环境变量 CONDA_WORKERS（默认 2，0 表示禁用）创建进程池；
+    找不到 conda 的 Python、或该 Python 无法导入 conda 时返回 None（命令改为逐个子进程执行）
+    """
+    size = int(os.environ.get("CONDA_WORKERS", "2"))
+    if size <= 0:
+        return None
+    python_exe = find_conda_python(conda_exe)
+    if not python_exe or not can_import_conda(python_exe):
+        return None
+    max_jobs = int(os.environ.get("CONDA_WORKER_MAX_JOBS", "50"))
+    return CondaWorkerPool(python_exe, size=size, max_jobs=max_jobs)
+
+
+if __name__ == "__main__" and "--worker" in sys.argv:
+    worker_main()
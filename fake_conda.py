@@ -0,0 +1,510 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+假 conda：离线、可复现的性能测试替身
+- 支持：env list --json / info --json / list --json / create / create --clone / install（包、
+  --file 显式列表、--revision）/ remove --force / env remove / env export / run（仅模拟 python -m pip），
+  输出格式与真实 conda 一致；安装过的包在 pkgs 缓存中留下 info/repodata_record.json
+- 环境是磁盘上的假前缀（conda-meta 记录 + 可执行的 bin/python 脚本）
+- 通过 CONDA_EXE 指向本文件即可替换真实 conda，例如：
+    export CONDA_EXE=$PWD/fake_conda.py FAKE_CONDA_ROOT=/tmp/fake_conda
+    export CONDA_BACKEND=subprocess CONDA_WORKERS=0
+- 环境变量：
+    FAKE_CONDA_ROOT      假 conda 的根目录（base 前缀），默认 /tmp/fake_conda
+    FAKE_CONDA_LATENCY   各操作耗时（秒），如 "list=0.05,create=2,clone=1,remove=0.5,export=0.1"
+    FAKE_CONDA_FAIL      各操作失败概率，如 "create=0.1,clone=0.05"
+    FAKE_CONDA_FAIL_ENVS 逗号分隔的环境名通配符，匹配的环境操作必定失败
+    FAKE_CONDA_SEED      随机数种子，保证失败注入可复现
+    FAKE_CONDA_CACHED    逗号分隔的 Python 版本通配符，表示本地包缓存中已有的版本（默认 "*"）；
+                         带 --offline 创建时请求的版本不在其中则报 PackagesNotFoundError
+- 批量生成假环境：python fake_conda.py fake-populate 1000 --python 3.11
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import fnmatch
+import argparse
+from typing import Dict, List
+
+DEFAULT_ROOT = "/tmp/fake_conda"
+DEFAULT_LATENCY = {"list": 0.05, "info": 0.05, "create": 1.0, "explicit": 0.1, "clone": 0.5, "remove": 0.3,
+                   "export": 0.1, "pip": 0.5, "install": 0.5}
+DEFAULT_PYTHON = "3.12.0"
+# 新建环境时写入的包（name, version, build）
+BASE_PACKAGES = [
+    ("ca-certificates", "2024.7.2", "h06a4308_0"),
+    ("openssl", "3.0.14", "h5eee18b_0"),
+    ("pip", "24.0", "py_0"),
+    ("setuptools", "69.5.1", "py_0"),
+    ("wheel", "0.43.0", "py_0"),
+]
+# 假 pip 的间接依赖（pip wheel 不带 --no-deps、pip install 时一并需要）
+PIP_DEPENDENCIES = {
+    "requests": [("urllib3", "2.2.2"), ("idna", "3.7"), ("certifi", "2024.7.4"), ("charset_normalizer", "3.3.2")],
+    "flask": [("werkzeug", "3.0.3"), ("jinja2", "3.1.4"), ("click", "8.1.7"), ("itsdangerous", "2.2.0")],
+    "jinja2": [("markupsafe", "2.1.5")],
+}
+
+
+def root_prefix() -> str:
+    return os.path.abspath(os.environ.get("FAKE_CONDA_ROOT", DEFAULT_ROOT))
+
+
+def envs_dir() -> str:
+    return os.path.join(root_prefix(), "envs")
+
+
+def parse_mapping(value: str) -> Dict[str, float]:
+    """解析 "a=1,b=2" 形式的配置"""
+    result = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, val = item.split("=", 1)
+            result[key.strip()] = float(val)
+    return result
+
+
+def fake_conda_env(root: str, conda_exe: str = None) -> Dict[str, str]:
+    """
+    返回让服务使用假 conda 所需的环境变量（供基准/压测脚本使用）
+    服务的各个持久存储（状态、任务历史、日志归档、本地 channel、解析缓存、wheel 缓存）都放在 root/service 下，
+    假数据不会写进用户真实的 ~/.conda_env_manager
+    """
+    service = os.path.join(os.path.abspath(root), "service")
+    return {
+        "CONDA_EXE": conda_exe or os.path.abspath(__file__),
+        "FAKE_CONDA_ROOT": os.path.abspath(root),
+        "CONDA_BACKEND": "subprocess",
+        "CONDA_WORKERS": "0",
+        "STATE_DB": os.path.join(service, "state.db"),
+        "TASK_HISTORY_DB": os.path.join(service, "task_history.db"),
+        "LOG_ARCHIVE_DIR": os.path.join(service, "log_archive"),
+        "LOCAL_CHANNEL_DIR": os.path.join(service, "local_channel"),
+        "SOLVE_CACHE_DB": os.path.join(service, "solve_cache.db"),
+        "PIP_WHEEL_DIR": os.path.join(service, "wheels"),
+    }
+
+
+# ========================
+# 假前缀
+# ========================
+def write_prefix(prefix: str, python_version: str = DEFAULT_PYTHON, packages: List[tuple] = None):
+    """在磁盘上生成一个假 conda 前缀"""
+    meta_dir = os.path.join(prefix, "conda-meta")
+    bin_dir = os.path.join(prefix, "bin")
+    os.makedirs(meta_dir, exist_ok=True)
+    os.makedirs(bin_dir, exist_ok=True)
+
+    packages = list(packages or BASE_PACKAGES) + [("python", python_version, "h955ad1f_0")]
+    for name, version, build in packages:
+        record = {
+            "name": name, "version": version, "build": build, "build_number": 0,
+            "channel": "https://repo.anaconda.com/pkgs/main", "subdir": "linux-64",
+            "fn": f"{name}-{version}-{build}.conda", "files": [],
+            "paths_data": {"paths": [], "paths_version": 1},
+        }
+        with open(os.path.join(meta_dir, f"{name}-{version}-{build}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f)
+
+    python_exe = os.path.join(bin_dir, "python")
+    with open(python_exe, "w", encoding="utf-8") as f:
+        f.write(f'#!/bin/sh\necho "Python {python_version}"\n')
+    os.chmod(python_exe, 0o755)
+
+    with open(os.path.join(meta_dir, "history"), "a", encoding="utf-8") as f:
+        f.write(f"==> {time.strftime('%Y-%m-%d %H:%M:%S')} <==\n# cmd: fake_conda create\n")
+        for name, version, build in packages:
+            f.write(f"+pkgs/main::{name}-{version}-{build}\n")
+    for package in packages:
+        cache_package(*package)
+
+
+def cache_package(name: str, version: str, build: str):
+    """在 pkgs 缓存中登记包（只写 info/repodata_record.json）"""
+    stem = f"{name}-{version}-{build}"
+    info_dir = os.path.join(root_prefix(), "pkgs", stem, "info")
+    if os.path.exists(os.path.join(info_dir, "repodata_record.json")):
+        return
+    os.makedirs(info_dir, exist_ok=True)
+    with open(os.path.join(info_dir, "repodata_record.json"), "w", encoding="utf-8") as f:
+        json.dump({"name": name, "version": version, "build": build, "md5": "0" * 32,
+                   "url": f"https://repo.anaconda.com/pkgs/main/linux-64/{stem}.conda"}, f)
+
+
+def set_packages(prefix: str, packages: List[tuple], cmd: str):
+    """把前缀中的包改为 packages（(name, version, build) 列表），并像 conda 一样在 history 中追加一个修订"""
+    meta_dir = os.path.join(prefix, "conda-meta")
+    current = {(r["name"], r["version"], r["build"]) for r in read_records(prefix)}
+    wanted = set(packages)
+    for name, version, build in sorted(current - wanted):
+        os.remove(os.path.join(meta_dir, f"{name}-{version}-{build}.json"))
+    for name, version, build in sorted(wanted - current):
+        record = {
+            "name": name, "version": version, "build": build, "build_number": 0,
+            "channel": "https://repo.anaconda.com/pkgs/main", "subdir": "linux-64",
+            "fn": f"{name}-{version}-{build}.conda", "files": [],
+            "paths_data": {"paths": [], "paths_version": 1},
+        }
+        with open(os.path.join(meta_dir, f"{name}-{version}-{build}.json"), "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        cache_package(name, version, build)
+    with open(os.path.join(meta_dir, "history"), "a", encoding="utf-8") as f:
+        f.write(f"==> {time.strftime('%Y-%m-%d %H:%M:%S')} <==\n# cmd: {cmd}\n")
+        for name, version, build in sorted(current - wanted):
+            f.write(f"-pkgs/main::{name}-{version}-{build}\n")
+        for name, version, build in sorted(wanted - current):
+            f.write(f"+pkgs/main::{name}-{version}-{build}\n")
+
+
+def read_records(prefix: str) -> List[dict]:
+    meta_dir = os.path.join(prefix, "conda-meta")
+    records = []
+    for fn in sorted(os.listdir(meta_dir)):
+        if fn.endswith(".json"):
+            with open(os.path.join(meta_dir, fn), "r", encoding="utf-8") as f:
+                records.append(json.load(f))
+    return records
+
+
+def populate(count: int, python_version: str = DEFAULT_PYTHON, start: int = 0):
+    """批量生成 count 个假环境：env_00000, env_00001, ..."""
+    os.makedirs(os.path.join(root_prefix(), "conda-meta"), exist_ok=True)
+    for i in range(start, start + count):
+        prefix = os.path.join(envs_dir(), f"env_{i:05d}")
+        if not os.path.exists(prefix):
+            write_prefix(prefix, python_version)
+
+
+# ========================
+# 命令实现
+# ========================
+def simulate(op: str, env_name: str = None):
+    """按配置休眠并注入失败"""
+    latency = {**DEFAULT_LATENCY, **parse_mapping(os.environ.get("FAKE_CONDA_LATENCY"))}
+    time.sleep(latency.get(op, 0))
+    fail_rate = parse_mapping(os.environ.get("FAKE_CONDA_FAIL")).get(op, 0)
+    patterns = [p for p in os.environ.get("FAKE_CONDA_FAIL_ENVS", "").split(",") if p]
+    if random.random() < fail_rate or (env_name and any(fnmatch.fnmatch(env_name, p) for p in patterns)):
+        fail(f"CondaHTTPError: HTTP 000 CONNECTION FAILED (injected failure for '{op}')")
+
+
+def fail(message: str, code: int = 1):
+    sys.stderr.write(f"\n{message}\n\n")
+    sys.exit(code)
+
+
+def staged_output(lines: List[str], total: float):
+    """把 total 秒平均分摊到每一行输出上，模拟 conda 的阶段性输出"""
+    delay = total / max(1, len(lines))
+    for line in lines:
+        time.sleep(delay)
+        print(line, flush=True)
+
+
+def resolve_prefix(name: str = None, prefix: str = None) -> str:
+    if prefix:
+        return os.path.abspath(prefix)
+    if name in (None, "base"):
+        return root_prefix()
+    return os.path.join(envs_dir(), name)
+
+
+def cmd_env_list(args):
+    simulate("list")
+    envs = [root_prefix()]
+    if os.path.isdir(envs_dir()):
+        envs += [os.path.join(envs_dir(), n) for n in sorted(os.listdir(envs_dir()))
+                 if os.path.isdir(os.path.join(envs_dir(), n, "conda-meta"))]
+    print(json.dumps({"envs": envs}, indent=2))
+
+
+def cmd_info(args):
+    simulate("info")
+    print(json.dumps({
+        "root_prefix": root_prefix(),
+        "envs_dirs": [envs_dir()],
+        "pkgs_dirs": [os.path.join(root_prefix(), "pkgs")],
+        "platform": "linux-64",
+        "conda_version": "24.5.0",
+        "solver": {"name": "libmamba", "user_agent": "solver/libmamba conda/24.5.0"},
+    }, indent=2))
+
+
+def cmd_list(args):
+    prefix = resolve_prefix(args.name, args.prefix)
+    if not os.path.isdir(os.path.join(prefix, "conda-meta")):
+        fail(f"EnvironmentLocationNotFound: Not a conda environment: {prefix}")
+    simulate("list")
+    if args.explicit:
+        print(f"# This file may be used to create an environment using:\n# $ conda create --name <env> --file <this file>"
+              f"\n# platform: linux-64\n@EXPLICIT")
+        for r in read_records(prefix):
+            print(f"{r['channel']}/{r['subdir']}/{r['fn']}")
+        return
+    print(json.dumps([
+        {"name": r["name"], "version": r["version"], "build_string": r["build"],
+         "build_number": r["build_number"], "channel": "pkgs/main", "platform": r["subdir"]}
+        for r in read_records(prefix)
+    ], indent=2))
+
+
+def cmd_create(args, specs: List[str]):
+    prefix = resolve_prefix(args.name, args.prefix)
+    env_name = os.path.basename(prefix)
+    if os.path.exists(prefix):
+        fail(f"CondaValueError: prefix already exists: {prefix}")
+    latency = {**DEFAULT_LATENCY, **parse_mapping(os.environ.get("FAKE_CONDA_LATENCY"))}
+
+    if args.clone:
+        source = resolve_prefix(args.clone) if os.sep not in args.clone else args.clone
+        if not os.path.isdir(os.path.join(source, "conda-meta")):
+            fail(f"DirectoryNotACondaEnvironmentError: The target directory exists, but it is not a conda environment.")
+        print(f"Source:      {source}\nDestination: {prefix}\nPackages: {len(read_records(source))}", flush=True)
+        simulate("clone", env_name)
+        shutil.copytree(source, prefix, symlinks=True)
+        staged_output([f"Linking {r['name']}-{r['version']}-{r['build']}" for r in read_records(prefix)], 0)
+        print("Preparing transaction: done\nVerifying transaction: done\nExecuting transaction: done", flush=True)
+        return
+
+    if args.file:
+        # 显式包列表（@EXPLICIT）：不求解，直接下载 / 链接
+        with open(args.file[0], "r", encoding="utf-8") as f:
+            urls = [line.strip() for line in f if line.strip() and not line.startswith(("#", "@"))]
+        if not urls:
+            fail("CondaValueError: no package URLs in explicit file")
+        python_version = next((os.path.basename(u).split("-")[1] for u in urls
+                               if os.path.basename(u).startswith("python-")), DEFAULT_PYTHON)
+        staged_output(["Downloading and Extracting Packages:", "Preparing transaction: done",
+                       "Verifying transaction: done"], latency["create"] * 0.2)
+        simulate("explicit", env_name)
+        write_prefix(prefix, python_version)
+        print("Executing transaction: done", flush=True)
+        return
+
+    python_version = DEFAULT_PYTHON
+    for spec in specs:
+        if spec.startswith("python="):
+            python_version = spec.split("=", 1)[1]
+    cached = [p for p in os.environ.get("FAKE_CONDA_CACHED", "*").split(",") if p]
+    if args.offline and not any(fnmatch.fnmatch(python_version, p) for p in cached):
+        print("Channels:\n - defaults\nPlatform: linux-64", flush=True)
+        print("Collecting package metadata (repodata.json): done\nSolving environment: failed", flush=True)
+        fail("PackagesNotFoundError: The following packages are not available from current channels:\n\n"
+             f"  - python={python_version}\n\nCurrent channels:\n\n  - defaults (offline)")
+    staged_output([
+        "Channels:\n - defaults\nPlatform: linux-64",
+        "Collecting package metadata (repodata.json): done",
+        "Solving environment: done",
+        f"\n## Package Plan ##\n\n  environment location: {prefix}\n\n  added / updated specs:\n"
+        + "".join(f"    - {s}\n" for s in specs),
+        "Downloading and Extracting Packages:",
+        "Preparing transaction: done",
+        "Verifying transaction: done",
+    ], latency["create"] * 0.8)
+    simulate("create", env_name)
+    write_prefix(prefix, python_version)
+    print("Executing transaction: done\n#\n# To activate this environment, use\n#\n"
+          f"#     $ conda activate {env_name}\n#", flush=True)
+
+
+def cmd_install(args, specs: List[str], argv: List[str]):
+    """conda install：按包（name=version）、显式列表（--file）或修订（--revision N）改变环境中的包"""
+    prefix = resolve_prefix(args.name, args.prefix)
+    if not os.path.isdir(os.path.join(prefix, "conda-meta")):
+        fail(f"EnvironmentLocationNotFound: Not a conda environment: {prefix}")
+    packages = {r["name"]: (r["name"], r["version"], r["build"]) for r in read_records(prefix)}
+    if args.revision is not None:
+        dists = set()
+        with open(os.path.join(prefix, "conda-meta", "history"), "r", encoding="utf-8") as f:
+            revisions = f.read().split("==> ")[1:]
+        if args.revision >= len(revisions):
+            fail(f"CondaValueError: no such revision: {args.revision}")
+        for revision in revisions[:args.revision + 1]:
+            for line in revision.splitlines():
+                if line[:1] in "+-" and line[1:]:
+                    dist = line[1:].split("::", 1)[-1]
+                    if line[0] == "+":
+                        dists.add(dist)
+                    else:
+                        dists.discard(dist)
+        packages = {d.rsplit("-", 2)[0]: tuple(d.rsplit("-", 2)) for d in dists}
+        staged_output(["Collecting package metadata (repodata.json): done", "Solving environment: done"],
+                      parse_mapping(os.environ.get("FAKE_CONDA_LATENCY")).get("create", DEFAULT_LATENCY["create"]))
+    elif args.file:
+        with open(args.file[0], "r", encoding="utf-8") as f:
+            urls = [line.strip().split("#")[0] for line in f if line.strip() and not line.startswith(("#", "@"))]
+        for url in urls:
+            stem = os.path.basename(url)
+            for suffix in (".conda", ".tar.bz2"):
+                stem = stem[:-len(suffix)] if stem.endswith(suffix) else stem
+            name, version, build = stem.rsplit("-", 2)
+            packages[name] = (name, version, build)
+        print("Downloading and Extracting Packages:", flush=True)
+    else:
+        for spec in specs:
+            name, _, version = spec.partition("=")
+            packages[name] = (name, version.split("=")[0] or "1.0", "py_0")
+        staged_output(["Collecting package metadata (repodata.json): done", "Solving environment: done"],
+                      parse_mapping(os.environ.get("FAKE_CONDA_LATENCY")).get("create", DEFAULT_LATENCY["create"]))
+    simulate("install", os.path.basename(prefix))
+    set_packages(prefix, list(packages.values()), "conda install " + " ".join(argv[1:]))
+    print("Preparing transaction: done\nVerifying transaction: done\nExecuting transaction: done", flush=True)
+
+
+def cmd_remove_packages(args, names: List[str], argv: List[str]):
+    """conda remove --force 包...：只移除指定的包，不检查依赖"""
+    prefix = resolve_prefix(args.name, args.prefix)
+    if not os.path.isdir(os.path.join(prefix, "conda-meta")):
+        fail(f"EnvironmentLocationNotFound: Not a conda environment: {prefix}")
+    records = read_records(prefix)
+    missing = [n for n in names if n not in {r["name"] for r in records}]
+    if missing:
+        fail(f"PackagesNotFoundError: The following packages are missing from the target environment:\n"
+             + "".join(f"  - {n}\n" for n in missing))
+    simulate("remove", os.path.basename(prefix))
+    set_packages(prefix, [(r["name"], r["version"], r["build"]) for r in records if r["name"] not in names],
+                 "conda remove " + " ".join(argv[1:]))
+    print("Executing transaction: done", flush=True)
+
+
+def cmd_env_remove(args):
+    prefix = resolve_prefix(args.name, args.prefix)
+    if not os.path.isdir(os.path.join(prefix, "conda-meta")):
+        fail(f"EnvironmentLocationNotFound: Not a conda environment: {prefix}")
+    simulate("remove", os.path.basename(prefix))
+    print(f"\nRemove all packages in environment {prefix}:\n", flush=True)
+    shutil.rmtree(prefix)
+
+
+def cmd_env_export(args):
+    prefix = resolve_prefix(args.name, args.prefix)
+    if not os.path.isdir(os.path.join(prefix, "conda-meta")):
+        fail(f"EnvironmentLocationNotFound: Not a conda environment: {prefix}")
+    simulate("export", os.path.basename(prefix))
+    lines = [f"name: {os.path.basename(prefix)}", "channels:", "  - defaults", "dependencies:"]
+    for r in read_records(prefix):
+        build = "" if args.no_builds else f"={r['build']}"
+        lines.append(f"  - {r['name']}={r['version']}{build}")
+    lines.append(f"prefix: {prefix}")
+    print("\n".join(lines))
+
+
+def cmd_run(args, argv: List[str]):
+    """
+    conda run -n 环境 python -m pip install / wheel ...：只模拟 pip，不真正安装
+    pip wheel --wheel-dir 目录 在目录中生成空的 <包>-<版本>-py3-none-any.whl（不带 --no-deps 时连同
+    PIP_DEPENDENCIES 中的间接依赖）；pip install --no-index --find-links 目录 在目录中缺少所需 wheel
+    （含间接依赖）时失败
+    """
+    prefix = resolve_prefix(args.name, args.prefix)
+    if not os.path.isdir(os.path.join(prefix, "conda-meta")):
+        fail(f"EnvironmentLocationNotFound: Not a conda environment: {prefix}")
+    if "pip" not in argv or argv[argv.index("pip") + 1:argv.index("pip") + 2] not in (["install"], ["wheel"]):
+        fail(f"fake_conda: unsupported run command: {' '.join(argv)}", code=2)
+    rest = argv[argv.index("pip") + 1:]
+    command = rest.pop(0)
+    requirements, options = [], {}
+    while rest:
+        item = rest.pop(0)
+        if item in ("-r", "--find-links", "--wheel-dir") and rest:
+            value = rest.pop(0)
+            if item == "-r":
+                with open(value, "r", encoding="utf-8") as f:
+                    requirements += [line.strip() for line in f if line.strip() and not line.startswith(("#", "-"))]
+            else:
+                options[item] = value
+        elif item.startswith("-"):
+            options[item] = True
+        else:
+            requirements.append(item)
+
+    pinned = [(re.split(r"[=<>!~;\[ ]", req)[0].lower().replace("-", "_"),
+               req.split("==", 1)[1].strip() if "==" in req else None) for req in requirements]
+    if not options.get("--no-deps"):
+        for name, _ in list(pinned):
+            for dep in PIP_DEPENDENCIES.get(name, []):
+                if dep not in pinned and all(n != dep[0] for n, _ in pinned):
+                    pinned.append(dep)
+                    pinned.extend(d for d in PIP_DEPENDENCIES.get(dep[0], []) if d not in pinned)
+    wheel_dir = options.get("--wheel-dir") or options.get("--find-links")
+    cached = set()
+    if wheel_dir and os.path.isdir(wheel_dir):
+        cached = {tuple(fn.split("-")[:2]) for fn in os.listdir(wheel_dir) if fn.endswith(".whl")}
+    latency = {**DEFAULT_LATENCY, **parse_mapping(os.environ.get("FAKE_CONDA_LATENCY"))}
+
+    if command == "install" and options.get("--no-index"):
+        for name, version in pinned:
+            if not any(n == name and (version is None or v == version) for n, v in cached):
+                fail(f"ERROR: Could not find a version that satisfies the requirement {name}"
+                     f"{'==' + version if version else ''} (from versions: none)")
+    missing = [(name, version) for name, version in pinned
+               if not any(n == name and (version is None or v == version) for n, v in cached)]
+    staged_output([f"Collecting {name}" + (f"=={version}" if version else "") for name, version in pinned]
+                  + [f"  Downloading {name}-{version or '1.0'}-py3-none-any.whl" for name, version in missing],
+                  latency["pip"] * 0.8 * len(missing) / max(1, len(pinned)))
+    simulate("pip", os.path.basename(prefix))
+    if command == "wheel":
+        os.makedirs(wheel_dir, exist_ok=True)
+        for name, version in missing:
+            open(os.path.join(wheel_dir, f"{name}-{version or '1.0'}-py3-none-any.whl"), "w").close()
+        print(f"Saved wheels to {wheel_dir}", flush=True)
+        return
+    names = " ".join(name for name, _ in pinned)
+    print(f"Installing collected packages: {names}\nSuccessfully installed {names}", flush=True)
+
+
+def main(argv: List[str] = None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if "FAKE_CONDA_SEED" in os.environ:
+        random.seed(os.environ["FAKE_CONDA_SEED"])
+
+    parser = argparse.ArgumentParser(prog="conda")
+    parser.add_argument("words", nargs="*")
+    parser.add_argument("--name", "-n")
+    parser.add_argument("--prefix", "-p")
+    parser.add_argument("--clone")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--yes", "-y", action="store_true")
+    parser.add_argument("--no-builds", action="store_true")
+    parser.add_argument("--python", default=DEFAULT_PYTHON)
+    parser.add_argument("--channel", "-c", action="append")
+    parser.add_argument("--file", action="append")
+    parser.add_argument("--offline", action="store_true")
+    parser.add_argument("--explicit", action="store_true")
+    parser.add_argument("--revision", type=int)
+    parser.add_argument("--force", "--force-remove", action="store_true")
+    # 其余真实 conda 参数（--override-channels 等）一律接受并忽略
+    args, _ = parser.parse_known_intermixed_args(argv)
+    words = args.words
+
+    if words[:2] == ["env", "list"]:
+        cmd_env_list(args)
+    elif words[:1] == ["info"]:
+        cmd_info(args)
+    elif words[:1] == ["list"]:
+        cmd_list(args)
+    elif words[:1] == ["create"]:
+        cmd_create(args, words[1:])
+    elif words[:2] == ["env", "remove"] or (words[:1] == ["remove"] and "--all" in argv):
+        cmd_env_remove(args)
+    elif words[:1] == ["remove"]:
+        cmd_remove_packages(args, words[1:], argv)
+    elif words[:1] == ["install"]:
+        cmd_install(args, words[1:], argv)
+    elif words[:2] == ["env", "export"]:
+        cmd_env_export(args)
+    elif words[:1] == ["run"]:
+        cmd_run(args, argv)
+    elif words[:1] == ["fake-populate"]:
+        populate(int(words[1]), args.python)
+    else:
+        fail(f"fake_conda: unsupported command: {' '.join(argv)}", code=2)
+
+
+if __name__ == "__main__":
+    main()
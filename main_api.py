@@ -1,812 +1,176 @@
-# # main_api.py
-# import os
-# import sys
-# import webbrowser
-# import threading
-# import re
-# from pathlib import Path
-# from fastapi import FastAPI, HTTPException, BackgroundTasks
-# from fastapi.staticfiles import StaticFiles
-# from fastapi.responses import FileResponse
-# from pydantic import BaseModel
-# import subprocess
-# import json
-# from typing import List, Dict
-#
-# # ========================
-# # 全局配置
-# # ========================
-# app = FastAPI(title="Conda 环境管理 API", version="1.0")
-# log_messages = []
-#
-#
-# # 自动定位 conda 路径
-# def get_conda_exe_path():
-#     python_exe = Path(sys.executable)
-#     # Windows
-#     if sys.platform == "win32":
-#         if "envs" not in str(python_exe.parent):
-#             conda_exe = python_exe.parent / "Scripts" / "conda.exe"
-#         else:
-#             conda_root = python_exe.parent.parent.parent
-#             conda_exe = conda_root / "Scripts" / "conda.exe"
-#         if conda_exe.exists():
-#             return str(conda_exe)
-#     # macOS/Linux
-#     else:
-#         if "envs" not in str(python_exe.parent):
-#             conda_exe = python_exe.parent / "bin" / "conda"
-#         else:
-#             conda_root = python_exe.parent.parent.parent
-#             conda_exe = conda_root / "bin" / "conda"
-#         if conda_exe.exists():
-#             return str(conda_exe)
-#     return "conda"
-#
-#
-# CONDA_EXE = get_conda_exe_path()
-#
-#
-# # ========================
-# # 通用工具函数
-# # ========================
-# def log(msg: str, error: bool = False):
-#     level = "ERROR" if error else "INFO"
-#     entry = f"[{level}] {msg}"
-#     log_messages.append(entry)
-#     print(entry)
-#
-#
-# def run_conda_cmd(args: List[str]) -> str:
-#     """统一执行 conda 命令"""
-#     try:
-#         result = subprocess.run(
-#             [CONDA_EXE] + args,
-#             capture_output=True,
-#             text=True,
-#             encoding='utf-8',
-#             errors='replace',
-#             check=True,
-#             timeout=120
-#         )
-#         return result.stdout
-#     except subprocess.TimeoutExpired:
-#         raise Exception("命令执行超时（超过 120 秒）")
-#     except subprocess.CalledProcessError as e:
-#         stderr = e.stderr.strip() if e.stderr else ""
-#         stdout = e.stdout.strip() if e.stdout else ""
-#         raise Exception(f"Conda 命令失败: {stderr or stdout}")
-#     except FileNotFoundError:
-#         raise Exception("未找到 conda 命令，请确保 Anaconda 已正确安装并加入 PATH")
-#
-#
-# def get_python_version_from_env(path: str) -> str:
-#     """获取环境的 Python 版本"""
-#     python_exe = os.path.join(path, "python.exe") if os.name == 'nt' else os.path.join(path, "bin", "python")
-#     if not os.path.exists(python_exe):
-#         return "无 Python"
-#     try:
-#         result = subprocess.run([python_exe, "--version"], capture_output=True, text=True, timeout=5)
-#         if result.returncode == 0 and result.stdout.startswith("Python "):
-#             return result.stdout.strip()[7:].split()[0]
-#     except:
-#         pass
-#     return "未知"
-#
-#
-# def is_valid_env_name(name: str) -> bool:
-#     """验证环境名合法性"""
-#     if not name or name.startswith('.'):
-#         return False
-#     return re.fullmatch(r'[a-zA-Z0-9._-]+', name) is not None
-#
-#
-# def list_all_envs() -> List[Dict[str, str]]:
-#     """获取所有非 base 环境"""
-#     output = run_conda_cmd(["env", "list", "--json"])
-#     output = output.strip()
-#     if output.startswith('\ufeff'):
-#         output = output[1:]
-#     if '}' in output:
-#         last_brace = output.rfind('}')
-#         output = output[:last_brace + 1]
-#     data = json.loads(output)
-#     env_paths = data.get("envs", [])
-#
-#     base_path = None
-#     for path in env_paths:
-#         if "/envs/" not in path.replace("\\", "/"):
-#             base_path = path
-#             break
-#     if not base_path and env_paths:
-#         base_path = env_paths[0]
-#
-#     envs = []
-#     for path in env_paths:
-#         if path == base_path:
-#             continue
-#         name = path.split("\\")[-1] if "\\" in path else path.split("/")[-1]
-#         version = get_python_version_from_env(path)
-#         envs.append({"name": name, "path": path, "python_version": version})
-#     return envs
-#
-#
-# # ========================
-# # API 接口定义
-# # ========================
-# @app.get("/envs", response_model=List[Dict[str, str]])
-# async def list_envs():
-#     """列出所有非 base 环境及其 Python 版本"""
-#     try:
-#         envs = list_all_envs()
-#         return envs
-#     except Exception as e:
-#         log(str(e), error=True)
-#         raise HTTPException(status_code=500, detail=str(e))
-#
-#
-# # 1. 创建环境
-# class CreateEnvRequest(BaseModel):
-#     name: str
-#     python_version: str = "3.12"
-#
-#
-# def create_env_background(name: str, python_version: str):
-#     try:
-#         log(f"开始创建环境: {name} (Python {python_version})")
-#         run_conda_cmd(["create", "--name", name, f"python={python_version}", "--yes"])
-#         log(f"✅ 环境 '{name}' 创建成功")
-#     except Exception as e:
-#         log(f"❌ 创建失败: {str(e)}", error=True)
-#
-#
-# @app.post("/envs")
-# async def create_env(req: CreateEnvRequest, background_tasks: BackgroundTasks):
-#     try:
-#         # 验证环境名
-#         if not is_valid_env_name(req.name):
-#             raise HTTPException(status_code=400, detail="环境名只能包含字母、数字、下划线、连字符或点（不能以点开头）")
-#
-#         # 检查环境是否已存在
-#         envs = list_all_envs()
-#         if any(env["name"] == req.name for env in envs):
-#             raise HTTPException(status_code=400, detail=f"环境 '{req.name}' 已存在")
-#
-#         background_tasks.add_task(create_env_background, req.name, req.python_version)
-#         return {"message": f"正在后台创建环境: {req.name}"}
-#     except HTTPException:
-#         raise
-#     except Exception as e:
-#         log(str(e), error=True)
-#         raise HTTPException(status_code=500, detail=str(e))
-#
-#
-# # 2. 删除环境
-# @app.delete("/envs/{name}")
-# async def delete_env(name: str):
-#     try:
-#         # 验证环境存在
-#         envs = list_all_envs()
-#         if not any(env["name"] == name for env in envs):
-#             raise HTTPException(status_code=400, detail=f"环境 '{name}' 不存在")
-#
-#         log(f"正在删除环境: {name}")
-#         run_conda_cmd(["env", "remove", "--name", name, "--yes"])
-#         log(f"✅ 环境 '{name}' 删除成功")
-#         return {"message": f"环境 '{name}' 已删除"}
-#     except HTTPException:
-#         raise
-#     except Exception as e:
-#         log(str(e), error=True)
-#         raise HTTPException(status_code=500, detail=str(e))
-#
-#
-# # 3. 克隆环境
-# class CloneEnvRequest(BaseModel):
-#     source_env: str
-#     new_env: str
-#
-#
-# def clone_env_background(source_env: str, new_env: str):
-#     try:
-#         log(f"开始克隆环境: {source_env} → {new_env}")
-#         run_conda_cmd(["create", "--name", new_env, "--clone", source_env, "--yes"])
-#         log(f"✅ 环境克隆成功: {source_env} → {new_env}")
-#     except Exception as e:
-#         log(f"❌ 克隆失败: {str(e)}", error=True)
-#
-#
-# @app.post("/envs/clone")
-# async def clone_env(req: CloneEnvRequest, background_tasks: BackgroundTasks):
-#     try:
-#         # 验证源环境存在
-#         envs = list_all_envs()
-#         env_names = [env["name"] for env in envs]
-#         if req.source_env not in env_names:
-#             raise HTTPException(status_code=400, detail=f"源环境 '{req.source_env}' 不存在")
-#
-#         # 验证新环境名
-#         if not is_valid_env_name(req.new_env):
-#             raise HTTPException(status_code=400, detail="新环境名只能包含字母、数字、下划线、连字符或点（不能以点开头）")
-#
-#         # 验证新环境未存在
-#         if req.new_env in env_names:
-#             raise HTTPException(status_code=400, detail=f"新环境 '{req.new_env}' 已存在")
-#
-#         background_tasks.add_task(clone_env_background, req.source_env, req.new_env)
-#         return {"message": f"正在后台克隆环境: {req.source_env} → {req.new_env}"}
-#     except HTTPException:
-#         raise
-#     except Exception as e:
-#         log(str(e), error=True)
-#         raise HTTPException(status_code=500, detail=str(e))
-#
-#
-# @app.get("/logs")
-# async def get_logs():
-#     """获取最新 100 条日志"""
-#     return {"logs": log_messages[-100:]}
-#
-#
-# # ========================
-# # 静态文件与首页
-# # ========================
-# STATIC_DIR = "static"
-# INDEX_FILE = os.path.join(STATIC_DIR, "index.html")
-#
-# os.makedirs(STATIC_DIR, exist_ok=True)
-#
-# # 自动生成默认 index.html（如果不存在）
-# if not os.path.exists(INDEX_FILE):
-#     with open(INDEX_FILE, "w", encoding="utf-8") as f:
-#         f.write("""
-# <!DOCTYPE html>
-# <html lang="zh-CN">
-# <head>
-#   <meta charset="UTF-8" />
-#   <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
-#   <title>Conda 环境管理</title>
-#   <style>
-#     :root {
-#       --primary: #4e73df; --success: #28a745; --danger: #dc3545; --light: #f8f9fa; --dark: #343a40; --gray: #6c757d;
-#     }
-#     * { margin: 0; padding: 0; box-sizing: border-box; }
-#     body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; background: #f5f7fb; color: #333; padding: 20px; line-height: 1.6; }
-#     .page-header { text-align: center; margin-bottom: 24px; }
-#     .page-header h1 { color: var(--primary); margin-bottom: 8px; }
-#     .container { max-width: 1200px; margin: 0 auto; display: flex; gap: 24px; }
-#     .main-content { flex: 2; display: flex; flex-direction: column; gap: 24px; }
-#     .log-sidebar { flex: 1; min-width: 300px; align-self: flex-start; }
-#     .card { background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.08); padding: 20px; }
-#     .form-group { margin-bottom: 15px; }
-#     label { display: block; margin-bottom: 6px; font-weight: 600; }
-#     input, select, button { padding: 10px 12px; border: 1px solid #ddd; border-radius: 4px; font-size: 14px; width: 100%; }
-#     .btn { background: var(--primary); color: white; border: none; cursor: pointer; font-weight: 600; transition: opacity 0.2s; width: auto; }
-#     .btn:hover { opacity: 0.9; }
-#     .btn-danger { background: var(--danger); }
-#     .env-list { list-style: none; }
-#     .env-item { display: flex; justify-content: space-between; align-items: center; padding: 12px 0; border-bottom: 1px solid #eee; }
-#     .env-item:last-child { border-bottom: none; }
-#     .env-name { font-weight: 600; font-size: 16px; }
-#     .env-version { color: var(--gray); font-size: 14px; }
-#     .actions { display: flex; gap: 8px; }
-#     .log-container { height: 420px; overflow-y: auto; background: #2d2d2d; color: #f8f8f2; padding: 12px; border-radius: 6px; font-family: monospace; font-size: 13px; }
-#     .log-entry { margin-bottom: 6px; word-break: break-word; }
-#     .log-error { color: #ff5555; }
-#     .log-header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 12px; }
-#     @media (max-width: 900px) {
-#       .container { flex-direction: column; }
-#       .log-sidebar { min-width: auto; align-self: stretch; }
-#       .log-container { height: 180px; }
-#     }
-#   </style>
-# </head>
-# <body>
-#   <div class="page-header">
-#     <h1>📦 Conda 环境管理</h1>
-#     <p>创建、克隆、查看和删除你的 Python 虚拟环境</p>
-#   </div>
-#
-#   <div class="container">
-#     <div class="main-content">
-#       <!-- 创建环境 -->
-#       <div class="card">
-#         <h2>✨ 创建新环境</h2>
-#         <div class="form-group">
-#           <label for="envName">环境名称</label>
-#           <input type="text" id="envName" placeholder="例如：my_project" />
-#         </div>
-#         <div class="form-group">
-#           <label for="pythonVersion">Python 版本</label>
-#           <select id="pythonVersion">
-#             <option value="3.8">3.8</option><option value="3.9">3.9</option><option value="3.10">3.10</option>
-#             <option value="3.11">3.11</option><option value="3.12" selected>3.12</option><option value="3.13">3.13</option>
-#           </select>
-#         </div>
-#         <button class="btn" onclick="createEnv()">🚀 创建环境</button>
-#       </div>
-#
-#       <!-- 克隆环境 -->
-#       <div class="card">
-#         <h2>🔄 克隆环境</h2>
-#         <div class="form-group">
-#           <label for="sourceEnv">源环境</label>
-#           <select id="sourceEnv">
-#             <option value="">加载中...</option>
-#           </select>
-#         </div>
-#         <div class="form-group">
-#           <label for="newEnvName">新环境名称</label>
-#           <input type="text" id="newEnvName" placeholder="例如：my_project_copy" />
-#         </div>
-#         <button class="btn" onclick="cloneEnv()">📋 克隆环境</button>
-#       </div>
-#
-#       <!-- 环境列表 -->
-#       <div class="card">
-#         <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 15px;">
-#           <h2>📋 已有环境</h2>
-#           <button class="btn" style="padding: 6px 12px; font-size: 14px;" onclick="loadEnvs()">🔄 刷新</button>
-#         </div>
-#         <ul id="envList" class="env-list">
-#           <li>加载中...</li>
-#         </ul>
-#       </div>
-#     </div>
-#
-#     <!-- 日志侧边栏 -->
-#     <div class="log-sidebar">
-#       <div class="card">
-#         <div class="log-header">
-#           <h2>📜 操作日志</h2>
-#           <button class="btn" style="padding: 4px 10px; font-size: 12px;" onclick="clearLogs()">🗑️ 清空</button>
-#         </div>
-#         <div id="logContainer" class="log-container"></div>
-#       </div>
-#     </div>
-#   </div>
-#
-#   <script>
-#     const API_BASE = window.location.origin;
-#
-#     // 加载环境列表（同时更新克隆的源环境下拉框）
-#     async function loadEnvs() {
-#       try {
-#         const res = await fetch(`${API_BASE}/envs`);
-#         if (!res.ok) throw new Error(`HTTP ${res.status}`);
-#         const envs = await res.json();
-#         const list = document.getElementById('envList');
-#         const sourceEnvSelect = document.getElementById('sourceEnv');
-#
-#         // 更新环境列表
-#         if (envs.length === 0) {
-#           list.innerHTML = '<li>暂无环境</li>';
-#           sourceEnvSelect.innerHTML = '<option value="">暂无环境</option>';
-#           return;
-#         }
-#         list.innerHTML = envs.map(env => `
-#           <li class="env-item">
-#             <div>
-#               <div class="env-name">${escapeHtml(env.name)}</div>
-#               <div class="env-version">Python ${escapeHtml(env.python_version)}</div>
-#             </div>
-#             <div class="actions">
-#               <button class="btn btn-danger" onclick="deleteEnv('${escapeHtml(env.name)}')">🗑️ 删除</button>
-#             </div>
-#           </li>
-#         `).join('');
-#
-#         // 更新克隆的源环境下拉框
-#         sourceEnvSelect.innerHTML = envs.map(env => `
-#           <option value="${escapeHtml(env.name)}">${escapeHtml(env.name)}</option>
-#         `).join('');
-#       } catch (err) {
-#         document.getElementById('envList').innerHTML = `<li style="color:red">❌ 加载失败: ${err.message}</li>`;
-#         document.getElementById('sourceEnv').innerHTML = '<option value="">加载失败</option>';
-#       }
-#     }
-#
-#     // 创建环境
-#     async function createEnv() {
-#       const name = document.getElementById('envName').value.trim();
-#       const version = document.getElementById('pythonVersion').value;
-#       if (!name) {
-#         alert('请输入环境名称');
-#         return;
-#       }
-#       if (!/^[a-zA-Z0-9._-]+$/.test(name)) {
-#         alert('环境名称只能包含字母、数字、点、下划线或连字符');
-#         return;
-#       }
-#
-#       try {
-#         const res = await fetch(`${API_BASE}/envs`, {
-#           method: 'POST',
-#           headers: { 'Content-Type': 'application/json' },
-#           body: JSON.stringify({ name, python_version: version })
-#         });
-#         if (!res.ok) {
-#           const err = await res.json().catch(() => ({}));
-#           throw new Error(err.detail || `HTTP ${res.status}`);
-#         }
-#         const data = await res.json();
-#         addLog(data.message);
-#         document.getElementById('envName').value = '';
-#         loadEnvs(); // 刷新列表
-#       } catch (err) {
-#         addLog(`❌ 创建失败: ${err.message}`, true);
-#       }
-#     }
-#
-#     // 克隆环境
-#     async function cloneEnv() {
-#       const sourceEnv = document.getElementById('sourceEnv').value;
-#       const newEnvName = document.getElementById('newEnvName').value.trim();
-#
-#       if (!sourceEnv) {
-#         alert('请选择源环境');
-#         return;
-#       }
-#       if (!newEnvName) {
-#         alert('请输入新环境名称');
-#         return;
-#       }
-#       if (!/^[a-zA-Z0-9._-]+$/.test(newEnvName)) {
-#         alert('新环境名称只能包含字母、数字、点、下划线或连字符');
-#         return;
-#       }
-#
-#       try {
-#         const res = await fetch(`${API_BASE}/envs/clone`, {
-#           method: 'POST',
-#           headers: { 'Content-Type': 'application/json' },
-#           body: JSON.stringify({ source_env: sourceEnv, new_env: newEnvName })
-#         });
-#         if (!res.ok) {
-#           const err = await res.json().catch(() => ({}));
-#           throw new Error(err.detail || `HTTP ${res.status}`);
-#         }
-#         const data = await res.json();
-#         addLog(data.message);
-#         document.getElementById('newEnvName').value = '';
-#         loadEnvs(); // 刷新列表
-#       } catch (err) {
-#         addLog(`❌ 克隆失败: ${err.message}`, true);
-#       }
-#     }
-#
-#     // 删除环境
-#     async function deleteEnv(name) {
-#       if (!confirm(`确定要删除环境 "${name}" 吗？此操作不可逆！`)) return;
-#       try {
-#         const res = await fetch(`${API_BASE}/envs/${encodeURIComponent(name)}`, {
-#           method: 'DELETE'
-#         });
-#         if (!res.ok) {
-#           const err = await res.json().catch(() => ({}));
-#           throw new Error(err.detail || `HTTP ${res.status}`);
-#         }
-#         const data = await res.json();
-#         addLog(data.message);
-#         loadEnvs(); // 刷新列表
-#       } catch (err) {
-#         addLog(`❌ 删除失败: ${err.message}`, true);
-#       }
-#     }
-#
-#     // 日志相关
-#     function addLog(message, isError = false) {
-#       const container = document.getElementById('logContainer');
-#       const div = document.createElement('div');
-#       div.className = `log-entry${isError ? ' log-error' : ''}`;
-#       div.textContent = `[${new Date().toLocaleTimeString()}] ${message}`;
-#       container.appendChild(div);
-#       container.scrollTop = container.scrollHeight;
-#     }
-#
-#     function clearLogs() {
-#       document.getElementById('logContainer').innerHTML = '';
-#     }
-#
-#     function escapeHtml(text) {
-#       const map = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#039;' };
-#       return text.replace(/[&<>"']/g, m => map[m]);
-#     }
-#
-#     // 初始化
-#     loadEnvs();
-#
-#     // 轮询日志
-#     setInterval(async () => {
-#       try {
-#         const res = await fetch(`${API_BASE}/logs`);
-#         if (res.ok) {
-#           const data = await res.json();
-#           const container = document.getElementById('logContainer');
-#           const existingText = container.innerText;
-#           data.logs.forEach(msg => {
-#             if (!existingText.includes(msg)) {
-#               addLog(msg, msg.includes('[ERROR]'));
-#             }
-#           });
-#         }
-#       } catch (e) {}
-#     }, 5000);
-#   </script>
-# </body>
-# </html>
-#         """)
-#
-# app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
-#
-#
-# @app.get("/")
-# async def index():
-#     return FileResponse(INDEX_FILE)
-#
-#
-# # ========================
-# # 启动服务
-# # ========================
-# if __name__ == "__main__":
-#     try:
-#         import uvicorn
-#     except ImportError:
-#         print("❌ 未安装 uvicorn 或 fastapi")
-#         print("请运行：pip install fastapi uvicorn")
-#         input("\n按回车键退出...")
-#         sys.exit(1)
-#
-#     HOST = "127.0.0.1"
-#     PORT = 8000
-#     URL = f"http://{HOST}:{PORT}"
-#
-#
-#     def open_browser():
-#         webbrowser.open(URL)
-#
-#
-#     print(f"🚀 启动 Conda 环境管理 Web 服务...")
-#     print(f"🌐 访问地址: {URL}")
-#     print(f"📄 Swagger 文档: {URL}/docs")
-#     threading.Timer(1.0, open_browser).start()
-#
-#     uvicorn.run(app, host=HOST, port=PORT, log_level="info")
-
-
 # main_api.py
 import os
 import sys
-import webbrowser
-import threading
+from typing import List, Dict, Optional, Sequence
+from conda_export_env import (
+    deduplicate_channels, get_conda_exe_path, export_conda_env, cli_export, parse_env_yaml,
+)
+
+
+def is_cli_export_mode(argv: List[str]) -> bool:
+    """命令行导出模式：第一个参数为 --env/-e/--output/-o"""
+    return len(argv) > 1 and argv[1].startswith(("--env", "-e", "--output", "-o"))
+
+
+# 命令行导出模式（兼容原 conda_export_env.py）：在导入 Web 组件之前分流，保证启动速度
+if __name__ == "__main__" and is_cli_export_mode(sys.argv):
+    cli_export(sys.argv[1:])
+
 import re
-from pathlib import Path
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+import base64
+import fnmatch
+import hashlib
+import json
+import time
+import shutil
+import uuid
+import asyncio
+import logging
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import datetime
+from contextlib import asynccontextmanager
+from urllib.parse import urlencode
+from fastapi import FastAPI, HTTPException, BackgroundTasks, Request, Header
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from pydantic import BaseModel
-import subprocess
-import json
-from typing import List, Dict, Optional
-import yaml  # 新增依赖
-
-
-# ========================
-# 新增：集成 conda_export_env.py 的核心功能
-# ========================
-def remove_ansi(text: str) -> str:
-    """移除 ANSI 转义序列（如 \x1b[32m）"""
-    ansi_escape = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]')
-    return ansi_escape.sub('', text)
-
-
-def normalize_channel(channel: str) -> str:
-    """标准化conda channel路径"""
-    return channel.rstrip('/')
-
-
-def deduplicate_channels(channels):
-    """去重conda channels（保留顺序）"""
-    seen = set()
-    unique = []
-    for ch in channels:
-        norm = normalize_channel(ch)
-        if norm not in seen:
-            seen.add(norm)
-            unique.append(ch)
-    return unique
-
-
-def generate_md_file(output_md="使用yml之前先看.md"):
-    """生成导出环境的使用指南MD文件"""
-    md_content = """# Conda环境YAML使用指南    
-## 注意：使用生成的yml文件创建的环境，可以写一个测试代码来验证环境是否安装正确
-## 使用方法
-1. 确保已安装Anaconda/Miniconda
-2. 执行创建命令：`conda env create -f {yml_file}`（替换{yml_file}为实际文件名）
-3. 激活环境：`conda activate {env_name}`（替换{env_name}为环境名）    
-
-
-## 常见创建失败原因
-
-| 原因 | 典型表现 | 解决方法 |
-|------|----------|----------|
-| 包版本冲突 | UnsatisfiableError | 降低/升级冲突包版本，或更换Python版本 |
-| Python版本不兼容 | requires a different python version | 调整YAML中的python版本，或选择兼容的包版本 |
-| 特殊包源错误 | No matching distribution | 确保PyTorch/Paddle等包使用官方源 |
-| 网络问题 | 卡在Solving environment | 切换国内镜像源（如清华源） |
-| YAML语法错误 | Invalid YAML | 检查缩进、格式是否正确 |
-| 平台不兼容 | No matching distribution | 确认包支持当前操作系统/架构（如ARM/M1） |
-"""
-    with open(output_md, 'w', encoding='utf-8') as f:
-        f.write(md_content)
-    return output_md
-
-
-def export_conda_env(env_name=None, output_file="environment.yml", output_md="env_guide.md"):
-    """
-    核心导出函数（供外部调用）
-    :param env_name: 要导出的环境名，None则导出当前环境
-    :param output_file: YAML输出文件名
-    :param output_md: MD指南输出文件名
-    :return: 字典格式的执行结果
-    """
-    try:
-        # 获取conda执行路径
-        conda_exe = get_conda_exe_path()
-        cmd = [conda_exe, "env", "export", "--no-builds"]
-        if env_name:
-            cmd.extend(["--name", env_name])
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True,
-            encoding='utf-8',
-            errors='replace'
-        )
-
-        # 清理ANSI转义序列
-        clean_stdout = remove_ansi(result.stdout)
-
-        # 解析YAML
-        try:
-            env_data = yaml.safe_load(clean_stdout)
-        except yaml.YAMLError as e:
-            debug_file = "debug_raw_output.txt"
-            with open(debug_file, "w", encoding="utf-8") as f:
-                f.write(result.stdout)
-            return {
-                "status": "failed",
-                "msg": f"YAML解析失败（已保存调试文件）: {str(e)}",
-                "debug_file": debug_file
-            }
-
-        # 处理channels去重、移除prefix
-        if env_data and 'channels' in env_data:
-            env_data['channels'] = deduplicate_channels(env_data['channels'])
-        if env_data:
-            env_data.pop('prefix', None)
-
-        # 生成MD指南
-        generate_md_file(output_md)
-
-        # 写入YAML文件
-        with open(output_file, 'w', encoding='utf-8') as f:
-            yaml.dump(
-                env_data,
-                f,
-                default_flow_style=False,
-                indent=2,
-                sort_keys=False,
-                allow_unicode=True
-            )
-
-        return {
-            "status": "success",
-            "msg": f"环境导出成功：{output_file} | 指南文件：{output_md}",
-            "yml_file": output_file,
-            "md_file": output_md
-        }
-
-    except subprocess.CalledProcessError as e:
-        # 捕获conda命令执行失败
-        return {
-            "status": "failed",
-            "msg": f"Conda命令执行失败: {e.stderr.strip()}",
-            "return_code": e.returncode
-        }
-    except Exception as e:
-        # 捕获其他异常
-        return {
-            "status": "failed",
-            "msg": f"未知错误: {str(e)}"
-        }
+from conda_pack_env import pack_env, unpack_env
+from conda_backend import get_conda_backend
+from conda_dedup import DEDUP_MIN_SIZE, deduplicate
+from conda_worker_pool import create_worker_pool
+from conda_local_channel import LocalChannel
+from conda_logging import setup_logging
+from conda_pip_stage import PipStage
+from conda_revisions import SnapshotStore, explicit_urls, installed_packages, package_delta, packages_at, parse_history
+from conda_runner import CondaTimeout, kill_process_group, run_streaming
+from conda_singleflight import SingleFlight
+from conda_solve_cache import SolveCache, explicit_from_prefix, missing_specs, solve_key
+from conda_state_store import MemoryStateStore, get_state_store
+from conda_task_history import TaskHistory, estimate_progress, prefix_stats
+from conda_metrics import (
+    REGISTRY, CONTENT_TYPE, CondaCommandTimer, TASKS_QUEUED, TASKS_RUNNING, TASK_OUTCOMES, TASK_SECONDS,
+    TASK_PHASE_SECONDS, CREATE_RESOLUTION, SOLVE_CACHE_REQUESTS, PIP_WHEEL_CACHE, INVENTORY_CACHE, EVENT_LOOP_LAG, EVENT_LOOP_LAG_SECONDS,
+)
 
 
 # ========================
 # 全局配置
 # ========================
-app = FastAPI(title="Conda 环境管理 API", version="1.0")
-log_messages = []
-
-# 任务进度管理
-task_progress = {}  # {task_id: {"progress": 0-100, "stage": "阶段描述", "status": "running/completed/failed"}}
-
-
-# 自动定位 conda 路径
-def get_conda_exe_path():
-    python_exe = Path(sys.executable)
-    # Windows
-    if sys.platform == "win32":
-        if "envs" not in str(python_exe.parent):
-            conda_exe = python_exe.parent / "Scripts" / "conda.exe"
-        else:
-            conda_root = python_exe.parent.parent.parent
-            conda_exe = conda_root / "Scripts" / "conda.exe"
-        if conda_exe.exists():
-            return str(conda_exe)
-    # macOS/Linux
-    else:
-        if "envs" not in str(python_exe.parent):
-            conda_exe = python_exe.parent / "bin" / "conda"
-        else:
-            conda_root = python_exe.parent.parent.parent
-            conda_exe = conda_root / "bin" / "conda"
-        if conda_exe.exists():
-            return str(conda_exe)
-    return "conda"
+async def monitor_event_loop_lag(interval: float = 0.5):
+    """定期测量事件循环延迟：sleep 实际耗时超出 interval 的部分"""
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        EVENT_LOOP_LAG.set(lag)
+        EVENT_LOOP_LAG_SECONDS.observe(lag)
+
+
+async def refresh_local_channel_periodically():
+    """定期增量更新本地 channel（启动时先更新一次）"""
+    while True:
+        try:
+            await asyncio.to_thread(refresh_local_channel)
+        except Exception as e:
+            log(f"更新本地 channel 失败: {e}", error=True)
+        await asyncio.sleep(LOCAL_CHANNEL_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    background = [asyncio.create_task(monitor_event_loop_lag())]
+    if local_channel is not None:
+        background.append(asyncio.create_task(refresh_local_channel_periodically()))
+    yield
+    for task in background:
+        task.cancel()
+    yaml_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(title="Conda 环境管理 API", version="1.0", lifespan=lifespan)
+# 共享状态（任务记录、进行中任务、幂等键、清单缓存、最近日志），多个 worker 之间共享
+state = get_state_store()
+# 日志：调用方只入队，格式化与写入在后台线程完成
+logger, recent_logs, log_store = setup_logging(recent_store=state)
+
+# 任务进度管理：本 worker 正在执行的任务记录，每次修改后写入共享状态，任务结束后移除
+task_progress = {}  # {task_id: {"progress": 0-100, "stage": "阶段描述", "status": "queued/running/completed/failed"}}
+# 另含 "operation"、阶段时间线 "phases"（[{"phase", "at"}]）、结束后的 "phase_durations"/"elapsed"，
+# 以及 conda 子进程的 "conda_wall_time"/"conda_cpu_time"（秒，同一任务的各个子进程累计）、运行中子进程的 "pids"；有历史可参考时另含预测用的 "features"/"expected"
+
+# 已完成任务的耗时历史，用于预测剩余时间
+task_history = TaskHistory()
+
+# 环境清单缓存（共享状态中的 INVENTORY_KEY，按 conda 安装区分，共用数据库的不同服务互不干扰）：
+# 短时间内的重复查询直接复用，环境变更类任务结束时递增同名计数器使其失效
+INVENTORY_TTL = float(os.environ.get("INVENTORY_TTL", "5"))
+# 环境附加字段缓存：{path: {"mtime": conda-meta 修改时间, "python_version": ..., "size": ...}}
+_env_details = {}
+# 请求去重（记录在共享状态中）：环境名 → 进行中的任务；Idempotency-Key → 任务（保留 IDEMPOTENCY_TTL 秒）
+IDEMPOTENCY_TTL = float(os.environ.get("IDEMPOTENCY_TTL", "86400"))
+
+# 合并并发的相同查询（清单刷新、Python 版本与大小探测）
+inflight = SingleFlight()
+
+# 由本地包缓存生成的 file:// channel，创建 / 克隆时排在最前；LOCAL_CHANNEL=0 关闭
+local_channel = LocalChannel() if os.environ.get("LOCAL_CHANNEL", "1") != "0" else None
+LOCAL_CHANNEL_INTERVAL = float(os.environ.get("LOCAL_CHANNEL_INTERVAL", "600"))
+# 创建 / 克隆额外使用的 channel（逗号分隔，排在本地 channel 之后）
+EXTRA_CHANNELS = [ch.strip() for ch in os.environ.get("CONDA_CHANNELS", "").split(",") if ch.strip()]
+
+# 依赖解析结果缓存：相同 (specs, channels, platform, solver) 的创建直接按显式包列表安装；SOLVE_CACHE=0 关闭
+solve_cache = SolveCache() if os.environ.get("SOLVE_CACHE", "1") != "0" else None
+
+# 从 YAML 创建环境的任务在独立线程池中按两个阶段流水执行（本 worker 内，跨批次共用）：
+# conda 阶段同时最多 FROM_YAML_CONCURRENCY 个，pip 阶段同时最多 PIP_STAGE_CONCURRENCY 个，
+# 一个环境进入 pip 阶段后即让出 conda 阶段的名额
+FROM_YAML_CONCURRENCY = max(1, int(os.environ.get("FROM_YAML_CONCURRENCY", "3")))
+PIP_STAGE_CONCURRENCY = max(1, int(os.environ.get("PIP_STAGE_CONCURRENCY", "2")))
+yaml_executor = ThreadPoolExecutor(max_workers=FROM_YAML_CONCURRENCY + PIP_STAGE_CONCURRENCY,
+                                   thread_name_prefix="from-yaml")
+conda_stage_slots = threading.BoundedSemaphore(FROM_YAML_CONCURRENCY)
+pip_stage_slots = threading.BoundedSemaphore(PIP_STAGE_CONCURRENCY)
+# pip 阶段：服务器端持久 wheel 缓存 + 并行获取 wheel（见 conda_pip_stage）
+pip_stage = PipStage()
+# 这些任务中需要联网下载的创建逐个进行：后一个环境开始时，前一个已下载的包都在 pkgs 缓存中，
+# 多个环境共有的包只下载一次；本地缓存即可满足的创建与 pip 阶段不受限制
+online_create_lock = threading.Lock()
 
 
 CONDA_EXE = get_conda_exe_path()
+INVENTORY_KEY = f"inventory:{CONDA_EXE}"
+# conda 后端：conda 可导入时进程内查询，否则走子进程；命令优先交给常驻工作进程池执行
+conda_backend = get_conda_backend(CONDA_EXE, pool=create_worker_pool(CONDA_EXE))
 
 
 # ========================
 # 原有通用工具函数
 # ========================
-def log(msg: str, error: bool = False):
-    level = "ERROR" if error else "INFO"
-    entry = f"[{level}] {msg}"
-    log_messages.append(entry)
-    print(entry)
+def task_log_fields(task_id: str = None, env: str = None) -> Dict:
+    """日志的结构化字段；指定 task_id 时附带任务的环境名、操作类型与已耗时（秒）"""
+    fields = {"task_id": task_id, "env": env}
+    record = task_progress.get(task_id) if task_id else None
+    if record:
+        fields["env"] = env or record.get("env")
+        fields["operation"] = record.get("operation")
+        if record.get("phases"):
+            fields["duration"] = round(time.time() - record["phases"][0]["at"], 3)
+    return fields
 
 
-def run_conda_cmd(args: List[str]) -> str:
-    """统一执行 conda 命令"""
-    try:
-        result = subprocess.run(
-            [CONDA_EXE] + args,
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='replace',
-            check=True,
-            timeout=120
-        )
-        return result.stdout
-    except subprocess.TimeoutExpired:
-        raise Exception("命令执行超时（超过 120 秒）")
-    except subprocess.CalledProcessError as e:
-        stderr = e.stderr.strip() if e.stderr else ""
-        stdout = e.stdout.strip() if e.stdout else ""
-        raise Exception(f"Conda 命令失败: {stderr or stdout}")
-    except FileNotFoundError:
-        raise Exception("未找到 conda 命令，请确保 Anaconda 已正确安装并加入 PATH")
+def log(msg: str, error: bool = False, task_id: str = None, env: str = None):
+    """记录日志（非阻塞）"""
+    logger.log(logging.ERROR if error else logging.INFO, msg, extra=task_log_fields(task_id, env))
 
 
 def get_python_version_from_env(path: str) -> str:
     """获取环境的 Python 版本"""
-    python_exe = os.path.join(path, "python.exe") if os.name == 'nt' else os.path.join(path, "bin", "python")
-    if not os.path.exists(python_exe):
-        return "无 Python"
-    try:
-        result = subprocess.run([python_exe, "--version"], capture_output=True, text=True, timeout=5)
-        if result.returncode == 0 and result.stdout.startswith("Python "):
-            return result.stdout.strip()[7:].split()[0]
-    except:
-        pass
-    return "未知"
+    return conda_backend.get_python_version(path)
 
 
 def is_valid_env_name(name: str) -> bool:
@@ -816,17 +180,68 @@ def is_valid_env_name(name: str) -> bool:
     return re.fullmatch(r'[a-zA-Z0-9._-]+', name) is not None
 
 
-def list_all_envs() -> List[Dict[str, str]]:
-    """获取所有非 base 环境"""
-    output = run_conda_cmd(["env", "list", "--json"])
-    output = output.strip()
-    if output.startswith('\ufeff'):
-        output = output[1:]
-    if '}' in output:
-        last_brace = output.rfind('}')
-        output = output[:last_brace + 1]
-    data = json.loads(output)
-    env_paths = data.get("envs", [])
+def list_all_envs(fields: Sequence[str] = ()) -> List[Dict[str, str]]:
+    """
+    获取所有非 base 环境的名称与路径（优先使用清单缓存）
+    fields 指定需要额外附带的字段（python_version / size），只在需要时计算
+    """
+    generation = state.get_counter(INVENTORY_KEY)
+    cached = state.get_cache(INVENTORY_KEY)
+    if cached is not None and cached["generation"] == generation:
+        INVENTORY_CACHE.inc(result="hit")
+        envs = cached["envs"]
+    else:
+        INVENTORY_CACHE.inc(result="miss")
+        # 并发的刷新合并为一次；清单失效后（generation 变化）发起的刷新不与之前的合并
+        envs = inflight.do(("inventory", generation), lambda: refresh_inventory(generation), kind="inventory")
+    if not fields:
+        return envs
+    return [dict(env, **env_details(env["path"], fields)) for env in envs]
+
+
+def refresh_inventory(generation: int) -> List[Dict[str, str]]:
+    """重新扫描环境清单；扫描期间清单被判定失效时，结果只返回给本次调用方，不写入缓存"""
+    envs = scan_all_envs()
+    if state.get_counter(INVENTORY_KEY) == generation:
+        state.set_cache(INVENTORY_KEY, {"generation": generation, "envs": envs}, INVENTORY_TTL)
+    # 丢弃已不存在的环境的附加字段缓存
+    paths = set(env["path"] for env in envs)
+    for path in [path for path in _env_details if path not in paths]:
+        _env_details.pop(path, None)
+    return envs
+
+
+def env_details(path: str, fields: Sequence[str]) -> Dict:
+    """
+    环境的附加字段（Python 版本、目录大小），按 conda-meta 的修改时间缓存：
+    安装或卸载包会改变 conda-meta，缓存随之失效
+    """
+    try:
+        mtime = os.stat(os.path.join(path, "conda-meta")).st_mtime_ns
+    except OSError:
+        mtime = None
+    cached = _env_details.get(path)
+    if cached is None or cached["mtime"] != mtime:
+        cached = _env_details[path] = {"mtime": mtime}
+    for field in fields:
+        if field in cached:
+            continue
+        if field == "python_version":
+            cached[field] = inflight.do(("python_version", path), lambda: get_python_version_from_env(path),
+                                        kind="python_version")
+        elif field == "size":
+            cached[field] = inflight.do(("size", path), lambda: prefix_stats(path)[0], kind="size")
+    return {field: cached[field] for field in fields if field in cached}
+
+
+def invalidate_inventory():
+    """环境发生变化后丢弃清单缓存"""
+    state.incr(INVENTORY_KEY)
+
+
+def scan_all_envs() -> List[Dict[str, str]]:
+    """实际查询所有非 base 环境（名称与路径）"""
+    env_paths = conda_backend.list_env_paths()
 
     base_path = None
     for path in env_paths:
@@ -841,20 +256,517 @@ def list_all_envs() -> List[Dict[str, str]]:
         if path == base_path:
             continue
         name = path.split("\\")[-1] if "\\" in path else path.split("/")[-1]
-        version = get_python_version_from_env(path)
-        envs.append({"name": name, "path": path, "python_version": version})
+        if name.startswith("."):
+            # 快照恢复时在环境旁临时建立的目录（.<环境名>.restore-*），不是可用的环境
+            continue
+        envs.append({"name": name, "path": path})
     return envs
 
 
+# ========================
+# 任务记录：进度 + 阶段时间线
+# ========================
+def update_task(task_id: str, progress: int, stage: str, status: str, **extra):
+    """更新任务进度（保留阶段时间线、耗时等已有字段）"""
+    set_task_fields(task_id, progress=progress, stage=stage, status=status, **extra)
+
+
+# 每个任务记录的锁：同一任务可能在多个线程中更新（pip 阶段并行获取 wheel），修改与写入共享状态
+# （序列化整个记录）需互斥，否则序列化时字典 / 阶段列表可能正被修改
+_task_locks: Dict[str, threading.RLock] = {}
+
+
+def task_lock(task_id: str) -> threading.RLock:
+    return _task_locks.setdefault(task_id, threading.RLock())
+
+
+def set_task_fields(task_id: str, **fields):
+    """修改本 worker 执行中的任务记录，并写入共享状态"""
+    with task_lock(task_id):
+        record = task_progress.setdefault(task_id, {})
+        record.update(fields)
+        state.put_task(task_id, record)
+
+
+def get_task(task_id: str) -> Optional[Dict]:
+    """读取任务记录（可能由其他 worker 执行）"""
+    return state.get_task(task_id)
+
+
+def mark_phase(task_id: str, phase: str):
+    """
+    记录阶段切换及其时间戳
+    阶段：queued / solve / download / extract / link / post-link / done（删除为 unlink，导出为 export 等；
+    从 YAML 创建另有 pip-fetch / pip-install，以及等待流水线名额的 wait）
+    """
+    with task_lock(task_id):
+        phases = task_progress[task_id].setdefault("phases", [])
+        if phases and phases[-1]["phase"] == phase:
+            return
+        phases.append({"phase": phase, "at": round(time.time(), 3)})
+        state.put_task(task_id, task_progress[task_id])
+
+
+def finish_phases(task_id: str):
+    """任务结束：补上 done 阶段，计算各阶段耗时"""
+    record = task_progress.get(task_id)
+    if not record or "phases" not in record:
+        return
+    mark_phase(task_id, "done")
+    phases = record["phases"]
+    durations = {}
+    for current, following in zip(phases, phases[1:]):
+        seconds = following["at"] - current["at"]
+        durations[current["phase"]] = round(durations.get(current["phase"], 0.0) + seconds, 3)
+        TASK_PHASE_SECONDS.observe(seconds, operation=record.get("operation", ""), phase=current["phase"])
+    set_task_fields(task_id, phase_durations=durations, elapsed=round(phases[-1]["at"] - phases[0]["at"], 3))
+
+
+def set_task_features(task_id: str, **features):
+    """登记任务特征（Python 版本、源环境大小、包数量），并据历史给出预计耗时"""
+    expected = task_history.estimate(task_progress[task_id].get("operation", ""), features)
+    if expected:
+        set_task_fields(task_id, features=features, expected=expected)
+    else:
+        set_task_fields(task_id, features=features)
+
+
+def record_task_history(task_id: str):
+    """成功完成的任务写入耗时历史（不含排队与等待流水线名额的时间）"""
+    record = task_progress.get(task_id)
+    if not record or record.get("status") != "completed" or "features" not in record:
+        return
+    durations = {phase: seconds for phase, seconds in record["phase_durations"].items()
+                 if phase not in ("queued", "wait")}
+    task_history.record(record["operation"], record["features"], sum(durations.values()), durations)
+
+
+def env_prefix_features(name: str) -> Dict:
+    """环境的预测特征：Python 版本、目录大小与包数量"""
+    env = next((env for env in list_all_envs(["python_version"]) if env["name"] == name), None)
+    if env is None:
+        return {}
+    source_size, package_count = prefix_stats(env["path"])
+    return {"python_version": env["python_version"], "source_size": source_size, "package_count": package_count}
+
+
+def detect_phase(line: str) -> Optional[str]:
+    """根据 conda 输出判断所处阶段"""
+    if "Collecting package metadata" in line or "Solving environment" in line:
+        return "solve"
+    if "Downloading" in line:
+        return "download"
+    if "Extracting" in line:
+        return "extract"
+    if "Executing transaction: done" in line or "post-link" in line.lower() or "Installing pip dependencies" in line:
+        return "post-link"
+    if "transaction" in line or "Linking" in line or "Copying" in line:
+        return "link"
+    return None
+
+
+class TaskCancelled(Exception):
+    """任务已被 DELETE /tasks/{task_id} 取消"""
+
+
+# 取消标记保存在共享状态（缓存 "cancel:<task_id>"）中，任一 worker 收到的取消请求都能被执行任务的 worker 看到
+CANCEL_TTL = 24 * 3600
+# 发出 SIGTERM 后等待 conda 退出的时间，超时改发 SIGKILL
+CANCEL_GRACE = float(os.environ.get("CANCEL_GRACE", "5"))
+# 运行中可以取消的操作（取消后清理未建完的环境目录）；排队中的任务均可取消
+CANCELLABLE_OPERATIONS = ("create", "clone", "from-yaml")
+
+
+def is_cancel_requested(task_id: str) -> bool:
+    return bool(state.get_cache(f"cancel:{task_id}"))
+
+
+def discard_prefix(name: str) -> Optional[str]:
+    """删除新环境未建完的目录（仅用于提交前已确认不存在的环境），返回被删除的路径"""
+    prefix = os.path.join(get_envs_dir(), name)
+    if not os.path.isdir(prefix):
+        return None
+    shutil.rmtree(prefix, ignore_errors=True)
+    return prefix
+
+
+def remove_partial_env(name: str, task_id: str):
+    """清理被取消的创建 / 克隆留下的半成品环境目录"""
+    update_task(task_id, 0, "正在清理未完成的环境...", "cancelling")
+    prefix = discard_prefix(name)
+    if prefix:
+        log(f"已清理未完成的环境目录: {prefix}", task_id=task_id, env=name)
+
+
+def cancel_task_background(name: str, task_id: str, cleanup: bool):
+    """任务被取消后的收尾：清理半成品环境并标记为 cancelled"""
+    if cleanup:
+        remove_partial_env(name, task_id)
+    update_task(task_id, 0, "已取消", "cancelled")
+    log(f"⏹️ 任务已取消: {task_id}", task_id=task_id, env=name)
+
+
+# 同一任务可能并行执行多个 conda 子进程（pip 阶段并行获取 wheel）：进程号逐个登记在 "pids" 中，
+# 墙钟时间按“至少有一个子进程在运行”的时段累计，CPU 时间逐个累加
+_conda_children_lock = threading.Lock()
+_conda_busy = {}  # {task_id: [运行中的子进程数, 本段开始时间]}
+
+
+def register_conda_child(task_id: str, pid: int):
+    with _conda_children_lock:
+        busy = _conda_busy.setdefault(task_id, [0, time.perf_counter()])
+        busy[0] += 1
+        set_task_fields(task_id, pids=task_progress[task_id].get("pids", []) + [pid])
+
+
+def unregister_conda_child(task_id: str, pid: int, cpu_time: Optional[float]):
+    with _conda_children_lock:
+        record = task_progress[task_id]
+        fields = {"pids": [p for p in record.get("pids", []) if p != pid]}
+        busy = _conda_busy[task_id]
+        busy[0] -= 1
+        if busy[0] == 0:
+            del _conda_busy[task_id]
+            fields["conda_wall_time"] = round(record.get("conda_wall_time", 0) + time.perf_counter() - busy[1], 3)
+        if cpu_time is not None:
+            fields["conda_cpu_time"] = round(record.get("conda_cpu_time", 0) + cpu_time, 3)
+        set_task_fields(task_id, **fields)
+
+
+def run_conda_task(task_id: str, args: List[str], on_line=None, first_phase: str = "solve",
+                   detect_phases: bool = True) -> str:
+    """
+    在后台任务中执行 conda 命令：逐行读取输出、记录阶段（进程启动即进入 first_phase；
+    detect_phases=False 时不按输出切换阶段，用于 conda run 等输出不是 conda 事务的命令），
+    conda 子进程的墙钟时间与 CPU 时间累计到任务记录；失败或超时（见 conda_runner）时抛出异常
+    可在多个线程中为同一任务并行调用，取消时结束所有子进程
+    """
+    if is_cancel_requested(task_id):
+        raise TaskCancelled()
+    mark_phase(task_id, first_phase)
+    child = {}
+
+    def on_start(process: subprocess.Popen):
+        # 记录进程号供取消使用；登记前已到达的取消请求在这里补上
+        child["pid"] = process.pid
+        register_conda_child(task_id, process.pid)
+        if is_cancel_requested(task_id):
+            kill_process_group(process.pid)
+
+    def handle_line(line: str):
+        # conda 的逐行输出以 DEBUG 级别记录，默认只进入磁盘日志归档
+        logger.debug(line, extra=task_log_fields(task_id))
+        phase = detect_phase(line) if detect_phases else None
+        if phase:
+            mark_phase(task_id, phase)
+        if on_line:
+            on_line(line)
+
+    result = None
+    with CondaCommandTimer(args) as timer:
+        try:
+            result = run_streaming([CONDA_EXE] + args, handle_line, on_start=on_start)
+        except CondaTimeout as e:
+            raise Exception(f"Conda 命令超时: {e}")
+        finally:
+            if "pid" in child:
+                unregister_conda_child(task_id, child["pid"], result.cpu_time if result else None)
+        if result.returncode != 0:
+            timer.failed()
+
+    if is_cancel_requested(task_id):
+        raise TaskCancelled()
+    if result.returncode != 0:
+        detail = result.error_detail()
+        raise Exception(f"Conda 命令失败: {detail}" if detail else "Conda 命令执行失败")
+    return "\n".join(result.tail)
+
+
+# 创建环境时先只用本地包缓存解析（conda --offline），缓存无法满足时再联网；CONDA_OFFLINE_FIRST=0 关闭
+OFFLINE_FIRST = os.environ.get("CONDA_OFFLINE_FIRST", "1") != "0"
+# 这些错误说明本地缓存 / 已缓存的 repodata 满足不了请求，值得联网重试；其他失败（磁盘、权限等）直接报错
+OFFLINE_MISS = re.compile(r"PackagesNotFoundError|ResolvePackageNotFound|UnsatisfiableError|OfflineError"
+                          r"|not available from current channels|nothing provides")
+
+
+def run_create_offline_first(task_id: str, name: str, args: List[str], on_line=None, online_lock=None) -> str:
+    """
+    执行创建类 conda 命令：先加 --offline 只用本地包缓存，缓存满足不了依赖时清理残留目录后联网重试
+    所用途径记入任务记录 "resolution"（offline / online），联网回退的原因记入 "offline_miss"
+    给出 online_lock 时联网执行在该锁内进行（见 online_create_lock）
+    """
+    if OFFLINE_FIRST:
+        try:
+            output = run_conda_task(task_id, args + ["--offline"], on_line)
+            set_task_fields(task_id, resolution="offline")
+            CREATE_RESOLUTION.inc(path="offline")
+            return output
+        except TaskCancelled:
+            raise
+        except Exception as e:
+            match = OFFLINE_MISS.search(str(e))
+            if not match:
+                raise
+            discard_prefix(name)
+            set_task_fields(task_id, offline_miss=match.group(0))
+            update_task(task_id, 15, "本地缓存不满足依赖，正在联网解析...", "running")
+            log(f"本地包缓存无法满足依赖（{match.group(0)}），改为联网解析", task_id=task_id, env=name)
+    if online_lock is not None and not online_lock.acquire(blocking=False):
+        update_task(task_id, 15, "等待其他环境下载完成...", "running")
+        online_lock.acquire()
+    try:
+        output = run_conda_task(task_id, args, on_line)
+    finally:
+        if online_lock is not None:
+            online_lock.release()
+    set_task_fields(task_id, resolution="online")
+    CREATE_RESOLUTION.inc(path="online")
+    return output
+
+
+@lru_cache(maxsize=1)
+def conda_info() -> Dict:
+    """conda 基本配置（envs_dirs / pkgs_dirs / platform / solver），进程内只查询一次，修改 conda 配置后需重启服务"""
+    return conda_backend.get_info()
+
+
+def refresh_local_channel() -> Dict:
+    """把 pkgs 缓存与投放目录中的包增量索引进本地 channel"""
+    info = conda_info()
+    result = local_channel.refresh(info.get("pkgs_dirs") or [], info.get("platform") or "noarch")
+    if result["added"] or result["removed"]:
+        log(f"本地 channel 已更新: 共 {result['packages']} 个包，新增 {result['added']}，移除 {result['removed']}")
+    for item in result["failed"]:
+        logger.warning(f"本地 channel 跳过无法索引的包 {item['fn']}: {item['error']}")
+    return result
+
+
+def create_channels(channels: Sequence[str] = ()) -> List[str]:
+    """
+    创建 / 克隆使用的 channel：本地 channel（已生成 repodata 时）最优先，其后是请求给出的与
+    CONDA_CHANNELS 配置的 channel，经 deduplicate_channels() 去重并保持顺序
+    """
+    ordered = ([local_channel.url] if local_channel is not None and local_channel.ready() else []) \
+        + list(channels) + EXTRA_CHANNELS
+    return deduplicate_channels(ordered)
+
+
+def channel_args(channels: Sequence[str]) -> List[str]:
+    args = []
+    for channel in channels:
+        args += ["-c", channel]
+    return args
+
+
+def install_explicit(task_id: str, name: str, explicit: str, on_line=None, command: str = "create") -> str:
+    """按显式包列表（@EXPLICIT）创建环境（command="install" 时安装进已有环境），不调用求解器"""
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as f:
+        f.write(explicit)
+    try:
+        return run_conda_task(task_id, [command, "--name", name, "--file", f.name, "--yes"], on_line,
+                              first_phase="download")
+    finally:
+        os.remove(f.name)
+
+
+def create_from_specs(task_id: str, name: str, specs: List[str], channels: Sequence[str] = (), on_line=None,
+                      online_lock=None):
+    """
+    按 specs 创建环境：解析结果缓存命中时直接按显式包列表安装（跳过求解），显式安装失败则作废该条目并回退；
+    未命中时正常解析（先离线后联网），成功后把 conda list --explicit 的结果写入缓存
+    缓存使用情况记入任务记录 "solve_cache"（hit / miss / stale）
+    """
+    channels = create_channels(channels)
+    key = None
+    if solve_cache is not None:
+        info = conda_info()
+        key = solve_key(specs, channels, info.get("platform"), info.get("solver"))
+        explicit = solve_cache.get(key)
+        if explicit is not None:
+            SOLVE_CACHE_REQUESTS.inc(result="hit")
+            set_task_fields(task_id, solve_cache="hit")
+            update_task(task_id, 30, "命中解析缓存，正在按显式包列表安装...", "running")
+            try:
+                return install_explicit(task_id, name, explicit, on_line)
+            except TaskCancelled:
+                raise
+            except Exception as e:
+                solve_cache.invalidate(key)
+                discard_prefix(name)
+                SOLVE_CACHE_REQUESTS.inc(result="stale")
+                set_task_fields(task_id, solve_cache="stale")
+                log(f"解析缓存的显式包列表安装失败，已作废并重新解析: {e}", error=True, task_id=task_id, env=name)
+        else:
+            SOLVE_CACHE_REQUESTS.inc(result="miss")
+            set_task_fields(task_id, solve_cache="miss")
+
+    output = run_create_offline_first(task_id, name, ["create", "--name", name] + list(specs) + ["--yes"]
+                                      + channel_args(channels), on_line, online_lock)
+    if key is not None:
+        try:
+            # 直接读取新环境的 conda-meta，并确认请求的包都在其中，避免把其他环境的包列表存入缓存
+            explicit = explicit_from_prefix(os.path.join(get_envs_dir(), name), info.get("platform") or "")
+            missing = missing_specs(explicit, specs)
+            if missing:
+                logger.warning(f"新环境中缺少请求的包 {', '.join(missing)}，不缓存解析结果",
+                               extra=task_log_fields(task_id, name))
+            else:
+                solve_cache.put(key, explicit)
+        except Exception as e:
+            logger.warning(f"保存解析结果失败: {e}", extra=task_log_fields(task_id, name))
+    return output
+
+
+def find_duplicate_task(env: str, fingerprint: tuple, idempotency_key: Optional[str],
+                        task_id: Optional[str] = None) -> Optional[str]:
+    """
+    查找可复用的任务：同一 Idempotency-Key 的请求，或同一环境上进行中的相同请求，返回其 task_id
+    Idempotency-Key 已用于不同请求、或该环境正有其他任务进行时返回 409
+    给出 task_id 时，没有可复用任务则原子地把 task_id 登记为该环境的进行中任务并返回 None
+    """
+    entry = state.claim(env, fingerprint, idempotency_key, task_id, IDEMPOTENCY_TTL)
+    if entry is None:
+        return None
+    if entry["fingerprint"] != fingerprint:
+        if entry["source"] == "idempotency":
+            raise HTTPException(status_code=409, detail="Idempotency-Key 已用于另一个不同的请求")
+        raise HTTPException(status_code=409, detail=f"环境 '{env}' 正有其他任务进行中: {entry['task_id']}")
+    return entry["task_id"]
+
+
+def duplicate_response(task_id: str) -> Dict:
+    return {"message": "相同的请求已提交，沿用已有任务", "task_id": task_id, "deduplicated": True}
+
+
+def submit_task(background_tasks: Optional[BackgroundTasks], operation: str, func, *args, env: str = None,
+                task_id: str = None, executor: Optional[ThreadPoolExecutor] = None, claimed: Sequence[str] = ()) -> str:
+    """
+    登记并提交后台任务，返回 task_id
+    func 的最后一个参数必须是 task_id；任务结束后统计结果并使清单缓存失效
+    env 为任务涉及的环境名，随任务的日志一起记录；task_id 已通过 find_duplicate_task 登记时，任务结束后解除登记
+    claimed 为 task_id 另外登记了的多个环境（跨环境的任务），任务结束后同样解除
+    给出 executor 时提交到该线程池（background_tasks 可为 None），否则在响应返回后由 background_tasks 执行
+    """
+    task_id = task_id or str(uuid.uuid4())
+    update_task(task_id, 0, "排队中...", "queued", operation=operation, env=env)
+    mark_phase(task_id, "queued")
+    TASKS_QUEUED.inc()
+
+    def run():
+        TASKS_QUEUED.dec()
+        TASKS_RUNNING.inc(operation=operation)
+        start = time.perf_counter()
+        try:
+            if is_cancel_requested(task_id):
+                cancel_task_background(env, task_id, cleanup=False)
+            else:
+                func(*args, task_id)
+        finally:
+            TASKS_RUNNING.dec(operation=operation)
+            TASK_SECONDS.observe(time.perf_counter() - start, operation=operation)
+            TASK_OUTCOMES.inc(operation=operation, status=task_progress.get(task_id, {}).get("status", "unknown"))
+            finish_phases(task_id)
+            record_task_history(task_id)
+            for name in ([env] if env else []) + list(claimed):
+                state.release(name, task_id)
+            task_progress.pop(task_id, None)
+            _task_locks.pop(task_id, None)
+            invalidate_inventory()
+
+    if executor is not None:
+        executor.submit(run)
+    else:
+        background_tasks.add_task(run)
+    return task_id
+
+
 # ========================
 # 原有API接口 + 新增导出接口
 # ========================
-@app.get("/envs", response_model=List[Dict[str, str]])
-async def list_envs():
-    """列出所有非 base 环境及其 Python 版本"""
+ENV_FIELDS = ("name", "path", "python_version", "size")
+DEFAULT_ENV_FIELDS = ("name", "path", "python_version")
+
+
+def version_matches(version: str, wanted: str) -> bool:
+    """3.11 匹配 3.11 与 3.11.x"""
+    return version == wanted or version.startswith(wanted + ".")
+
+
+def encode_cursor(name: str) -> str:
+    return base64.urlsafe_b64encode(name.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
     try:
-        envs = list_all_envs()
-        return envs
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="无效的 cursor")
+
+
+def query_envs(selected: Sequence[str], name: Optional[str], prefix: Optional[str], python_version: Optional[str],
+               after: Optional[str], offset: int, limit: Optional[int]):
+    """过滤、分页并选取字段，返回 (当前页, 过滤后总数, 下一页游标对应的环境名或 None)"""
+    envs = sorted(list_all_envs(), key=lambda env: env["name"])
+    if name:
+        envs = [env for env in envs if fnmatch.fnmatchcase(env["name"], name)]
+    if prefix:
+        envs = [env for env in envs if env["path"].startswith(prefix)]
+    if python_version:
+        envs = [env for env in envs
+                if version_matches(env_details(env["path"], ["python_version"])["python_version"], python_version)]
+    total = len(envs)
+    if after is not None:
+        envs = [env for env in envs if env["name"] > after]
+    page = envs[offset:offset + limit] if limit is not None else envs[offset:]
+    has_more = limit is not None and offset + limit < len(envs)
+
+    # 只为当前页计算请求的附加字段
+    extra = [f for f in selected if f not in ("name", "path")]
+    items = []
+    for env in page:
+        details = env_details(env["path"], extra) if extra else {}
+        items.append({f: env[f] if f in env else details.get(f) for f in selected})
+    return items, total, page[-1]["name"] if has_more and page else None
+
+
+@app.get("/envs")
+async def list_envs(request: Request, limit: Optional[int] = None, offset: int = 0, cursor: Optional[str] = None,
+                    name: Optional[str] = None, prefix: Optional[str] = None, python_version: Optional[str] = None,
+                    fields: Optional[str] = None):
+    """
+    列出所有非 base 环境（按名称排序）
+    - 分页：limit/offset，或 cursor（上一页响应头 X-Next-Cursor 的值）；总数见 X-Total-Count，下一页见 Link
+    - 过滤：name（支持 * ? 通配）、prefix（环境路径前缀）、python_version（如 3.11 匹配 3.11.x）
+    - fields：逗号分隔，可选 name,path,python_version,size（默认不含 size）；未请求的字段不会计算
+    - 响应带强 ETag，If-None-Match 命中时返回 304
+    """
+    try:
+        selected = tuple(f.strip() for f in fields.split(",") if f.strip()) if fields else DEFAULT_ENV_FIELDS
+        unknown = [f for f in selected if f not in ENV_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"未知字段: {', '.join(unknown)}（可选 {', '.join(ENV_FIELDS)}）")
+        if limit is not None and limit < 1 or offset < 0:
+            raise HTTPException(status_code=400, detail="limit 必须大于 0，offset 不能为负数")
+
+        after = decode_cursor(cursor) if cursor else None
+        items, total, next_name = await asyncio.to_thread(
+            query_envs, selected, name, prefix, python_version, after, offset, limit)
+
+        body = json.dumps(items, ensure_ascii=False).encode("utf-8")
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache", "X-Total-Count": str(total)}
+        if next_name is not None:
+            next_cursor = encode_cursor(next_name)
+            params = [(k, v) for k, v in request.query_params.multi_items() if k not in ("cursor", "offset")]
+            headers["X-Next-Cursor"] = next_cursor
+            headers["Link"] = f'<{request.url.path}?{urlencode(params + [("cursor", next_cursor)])}>; rel="next"'
+
+        if_none_match = request.headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
         log(str(e), error=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -866,65 +778,64 @@ class CreateEnvRequest(BaseModel):
     python_version: str = "3.12"
 
 
+def create_progress(task_id: str, scale: float = 1.0):
+    """创建环境时根据 conda 的实时输出更新进度的回调；scale 用于后面还有其他阶段时压缩进度"""
+    def on_line(line: str):
+        if "Solving environment" in line:
+            update_task(task_id, int(20 * scale), "正在解析依赖...", "running")
+        elif "Verifying" in line:
+            update_task(task_id, int(50 * scale), "正在验证...", "running")
+        elif "Downloading" in line or "Extracting" in line:
+            update_task(task_id, int(70 * scale), "正在下载/解压包...", "running")
+        elif "Executing" in line:
+            update_task(task_id, int(85 * scale), "正在执行...", "running")
+    return on_line
+
+
 def create_env_background(name: str, python_version: str, task_id: str = None):
     try:
-        task_progress[task_id] = {"progress": 0, "stage": "正在准备创建环境...", "status": "running"}
-        log(f"开始创建环境: {name} (Python {python_version})")
-        
-        task_progress[task_id] = {"progress": 10, "stage": "正在解析依赖...", "status": "running"}
-        
-        # 使用 Popen 实时更新进度
-        import subprocess
-        process = subprocess.Popen(
-            [CONDA_EXE, "create", "--name", name, f"python={python_version}", "--yes"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            encoding='utf-8',
-            errors='replace'
-        )
-        
-        stage_progress = 20
-        for line in process.stdout:
-            if "Solving environment" in line:
-                task_progress[task_id] = {"progress": stage_progress, "stage": "正在解析依赖...", "status": "running"}
-            elif "Verifying" in line:
-                stage_progress = 50
-                task_progress[task_id] = {"progress": stage_progress, "stage": "正在验证...", "status": "running"}
-            elif "Downloading" in line or "Extracting" in line:
-                stage_progress = 70
-                task_progress[task_id] = {"progress": stage_progress, "stage": "正在下载/解压包...", "status": "running"}
-            elif "Executing" in line:
-                stage_progress = 85
-                task_progress[task_id] = {"progress": stage_progress, "stage": "正在执行...", "status": "running"}
-        
-        process.wait()
-        
-        if process.returncode != 0:
-            raise Exception("Conda 命令执行失败")
-        
-        task_progress[task_id] = {"progress": 100, "stage": "创建完成", "status": "completed"}
-        log(f"✅ 环境 '{name}' 创建成功")
+        update_task(task_id, 0, "正在准备创建环境...", "running")
+        log(f"开始创建环境: {name} (Python {python_version})", task_id=task_id, env=name)
+        set_task_features(task_id, python_version=python_version)
+
+        update_task(task_id, 10, "正在解析依赖...", "running")
+        create_from_specs(task_id, name, [f"python={python_version}"], on_line=create_progress(task_id))
+
+        update_task(task_id, 100, "创建完成", "completed")
+        log(f"✅ 环境 '{name}' 创建成功", task_id=task_id, env=name)
+    except TaskCancelled:
+        cancel_task_background(name, task_id, cleanup=True)
     except Exception as e:
-        task_progress[task_id] = {"progress": 0, "stage": f"创建失败: {str(e)}", "status": "failed"}
-        log(f"❌ 创建失败: {str(e)}", error=True)
+        update_task(task_id, 0, f"创建失败: {str(e)}", "failed")
+        log(f"❌ 创建失败: {str(e)}", error=True, task_id=task_id, env=name)
 
 
 @app.post("/envs")
-async def create_env(req: CreateEnvRequest, background_tasks: BackgroundTasks):
+async def create_env(req: CreateEnvRequest, background_tasks: BackgroundTasks,
+                     idempotency_key: Optional[str] = Header(None)):
     try:
         # 验证环境名
         if not is_valid_env_name(req.name):
             raise HTTPException(status_code=400, detail="环境名只能包含字母、数字、下划线、连字符或点（不能以点开头）")
 
+        # 重复提交（重试）沿用已有任务
+        fingerprint = ("create", req.name, req.python_version)
+        existing = find_duplicate_task(req.name, fingerprint, idempotency_key)
+        if existing:
+            return duplicate_response(existing)
+
         # 检查环境是否已存在
-        envs = list_all_envs()
+        envs = await asyncio.to_thread(list_all_envs)
         if any(env["name"] == req.name for env in envs):
             raise HTTPException(status_code=400, detail=f"环境 '{req.name}' 已存在")
 
-        import uuid
+        # 等待期间可能已有相同请求提交（包括其他 worker）；查找与登记在共享状态中原子完成
         task_id = str(uuid.uuid4())
-        background_tasks.add_task(create_env_background, req.name, req.python_version, task_id)
+        existing = find_duplicate_task(req.name, fingerprint, idempotency_key, task_id)
+        if existing:
+            return duplicate_response(existing)
+        submit_task(background_tasks, "create", create_env_background, req.name, req.python_version,
+                    env=req.name, task_id=task_id)
         return {"message": f"正在后台创建环境: {req.name}", "task_id": task_id}
     except HTTPException:
         raise
@@ -935,16 +846,23 @@ async def create_env(req: CreateEnvRequest, background_tasks: BackgroundTasks):
 
 # 2. 删除环境
 @app.delete("/envs/{name}")
-async def delete_env(name: str, background_tasks: BackgroundTasks):
+async def delete_env(name: str, background_tasks: BackgroundTasks, idempotency_key: Optional[str] = Header(None)):
     try:
+        fingerprint = ("remove", name)
+        existing = find_duplicate_task(name, fingerprint, idempotency_key)
+        if existing:
+            return duplicate_response(existing)
+
         # 验证环境存在
-        envs = list_all_envs()
+        envs = await asyncio.to_thread(list_all_envs)
         if not any(env["name"] == name for env in envs):
             raise HTTPException(status_code=400, detail=f"环境 '{name}' 不存在")
 
-        import uuid
         task_id = str(uuid.uuid4())
-        background_tasks.add_task(delete_env_background, name, task_id)
+        existing = find_duplicate_task(name, fingerprint, idempotency_key, task_id)
+        if existing:
+            return duplicate_response(existing)
+        submit_task(background_tasks, "remove", delete_env_background, name, env=name, task_id=task_id)
         return {"message": f"正在后台删除环境: {name}", "task_id": task_id}
     except HTTPException:
         raise
@@ -955,17 +873,18 @@ async def delete_env(name: str, background_tasks: BackgroundTasks):
 
 def delete_env_background(name: str, task_id: str):
     try:
-        task_progress[task_id] = {"progress": 0, "stage": "正在删除环境...", "status": "running"}
-        log(f"正在删除环境: {name}")
-        
-        task_progress[task_id] = {"progress": 30, "stage": "正在移除包...", "status": "running"}
-        run_conda_cmd(["env", "remove", "--name", name, "--yes"])
-        
-        task_progress[task_id] = {"progress": 100, "stage": "删除完成", "status": "completed"}
-        log(f"✅ 环境 '{name}' 删除成功")
+        update_task(task_id, 0, "正在删除环境...", "running")
+        log(f"正在删除环境: {name}", task_id=task_id, env=name)
+        set_task_features(task_id, **env_prefix_features(name))
+
+        update_task(task_id, 30, "正在移除包...", "running")
+        run_conda_task(task_id, ["env", "remove", "--name", name, "--yes"], first_phase="unlink")
+
+        update_task(task_id, 100, "删除完成", "completed")
+        log(f"✅ 环境 '{name}' 删除成功", task_id=task_id, env=name)
     except Exception as e:
-        task_progress[task_id] = {"progress": 0, "stage": f"删除失败: {str(e)}", "status": "failed"}
-        log(f"❌ 删除失败: {str(e)}", error=True)
+        update_task(task_id, 0, f"删除失败: {str(e)}", "failed")
+        log(f"❌ 删除失败: {str(e)}", error=True, task_id=task_id, env=name)
 
 
 # 3. 克隆环境
@@ -976,44 +895,43 @@ class CloneEnvRequest(BaseModel):
 
 def clone_env_background(source_env: str, new_env: str, task_id: str = None):
     try:
-        task_progress[task_id] = {"progress": 0, "stage": "正在准备克隆环境...", "status": "running"}
-        log(f"开始克隆环境: {source_env} → {new_env}")
-        
-        task_progress[task_id] = {"progress": 10, "stage": "正在复制文件...", "status": "running"}
-        
-        import subprocess
-        process = subprocess.Popen(
-            [CONDA_EXE, "create", "--name", new_env, "--clone", source_env, "--yes"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            encoding='utf-8',
-            errors='replace'
-        )
-        
-        stage_progress = 20
-        for line in process.stdout:
+        update_task(task_id, 0, "正在准备克隆环境...", "running")
+        log(f"开始克隆环境: {source_env} → {new_env}", task_id=task_id, env=new_env)
+        set_task_features(task_id, **env_prefix_features(source_env))
+
+        update_task(task_id, 10, "正在复制文件...", "running")
+
+        stage_progress = [20]
+
+        def on_line(line: str):
             if "Copying" in line or "Linking" in line:
-                stage_progress = min(80, stage_progress + 5)
-                task_progress[task_id] = {"progress": stage_progress, "stage": "正在复制/链接文件...", "status": "running"}
-        
-        process.wait()
-        
-        if process.returncode != 0:
-            raise Exception("Conda 命令执行失败")
-        
-        task_progress[task_id] = {"progress": 100, "stage": "克隆完成", "status": "completed"}
-        log(f"✅ 环境克隆成功: {source_env} → {new_env}")
+                stage_progress[0] = min(80, stage_progress[0] + 5)
+                update_task(task_id, stage_progress[0], "正在复制/链接文件...", "running")
+
+        run_conda_task(task_id, ["create", "--name", new_env, "--clone", source_env, "--yes"]
+                       + channel_args(create_channels()), on_line, first_phase="link")
+
+        update_task(task_id, 100, "克隆完成", "completed")
+        log(f"✅ 环境克隆成功: {source_env} → {new_env}", task_id=task_id, env=new_env)
+    except TaskCancelled:
+        cancel_task_background(new_env, task_id, cleanup=True)
     except Exception as e:
-        task_progress[task_id] = {"progress": 0, "stage": f"克隆失败: {str(e)}", "status": "failed"}
-        log(f"❌ 克隆失败: {str(e)}", error=True)
+        update_task(task_id, 0, f"克隆失败: {str(e)}", "failed")
+        log(f"❌ 克隆失败: {str(e)}", error=True, task_id=task_id, env=new_env)
 
 
 @app.post("/envs/clone")
-async def clone_env(req: CloneEnvRequest, background_tasks: BackgroundTasks):
+async def clone_env(req: CloneEnvRequest, background_tasks: BackgroundTasks,
+                    idempotency_key: Optional[str] = Header(None)):
     try:
+        # 重复提交（重试）沿用已有任务
+        fingerprint = ("clone", req.source_env, req.new_env)
+        existing = find_duplicate_task(req.new_env, fingerprint, idempotency_key)
+        if existing:
+            return duplicate_response(existing)
+
         # 验证源环境存在
-        envs = list_all_envs()
+        envs = await asyncio.to_thread(list_all_envs)
         env_names = [env["name"] for env in envs]
         if req.source_env not in env_names:
             raise HTTPException(status_code=400, detail=f"源环境 '{req.source_env}' 不存在")
@@ -1026,9 +944,12 @@ async def clone_env(req: CloneEnvRequest, background_tasks: BackgroundTasks):
         if req.new_env in env_names:
             raise HTTPException(status_code=400, detail=f"新环境 '{req.new_env}' 已存在")
 
-        import uuid
         task_id = str(uuid.uuid4())
-        background_tasks.add_task(clone_env_background, req.source_env, req.new_env, task_id)
+        existing = find_duplicate_task(req.new_env, fingerprint, idempotency_key, task_id)
+        if existing:
+            return duplicate_response(existing)
+        submit_task(background_tasks, "clone", clone_env_background, req.source_env, req.new_env,
+                    env=req.new_env, task_id=task_id)
         return {"message": f"正在后台克隆环境: {req.source_env} → {req.new_env}", "task_id": task_id}
     except HTTPException:
         raise
@@ -1037,6 +958,191 @@ async def clone_env(req: CloneEnvRequest, background_tasks: BackgroundTasks):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 4. 从 YAML 创建环境（单个或批量）
+class YamlEnvSource(BaseModel):
+    """YAML 内容（content）或服务器上的文件路径（file）二选一；name 覆盖 YAML 中的环境名"""
+    content: Optional[str] = None
+    file: Optional[str] = None
+    name: Optional[str] = None
+
+
+class FromYamlRequest(YamlEnvSource):
+    """items 非空时为批量导入（忽略顶层字段），否则按顶层字段创建单个环境"""
+    items: List[YamlEnvSource] = []
+
+
+def load_yaml_source(source: YamlEnvSource) -> Dict:
+    """读取并解析一个 YAML 来源，返回 parse_env_yaml() 的结果（name 已按请求覆盖）及原文摘要；无效时抛出 ValueError"""
+    if bool(source.content) == bool(source.file):
+        raise ValueError("content 与 file 必须且只能给出一个")
+    content = source.content
+    if source.file:
+        try:
+            with open(source.file, "r", encoding="utf-8") as f:
+                content = f.read()
+        except OSError as e:
+            raise ValueError(f"无法读取 YAML 文件: {e}")
+    spec = parse_env_yaml(content)
+    spec["name"] = source.name or spec["name"]
+    if not spec["name"]:
+        raise ValueError("YAML 中没有 name，请在请求中给出环境名")
+    if not is_valid_env_name(spec["name"]):
+        raise ValueError("环境名只能包含字母、数字、下划线、连字符或点（不能以点开头）")
+    if not spec["dependencies"]:
+        raise ValueError("YAML 中没有 conda 依赖")
+    spec["digest"] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+    return spec
+
+
+def acquire_stage_slot(task_id: str, slots: threading.BoundedSemaphore, stage: str, progress: int):
+    """占用流水线某一阶段的名额；需要等待时显示为等待，等待时间记为 wait 阶段"""
+    if not slots.acquire(blocking=False):
+        update_task(task_id, progress, f"等待{stage}名额...", "running")
+        mark_phase(task_id, "wait")
+        slots.acquire()
+
+
+def install_pip_stage(task_id: str, name: str, requirements: List[str]):
+    """pip 阶段：wheel 缓存优先安装，缓存不全时并行获取 wheel；各步骤耗时记入任务记录的 pip_timing"""
+    def run(args: List[str], phase: str) -> str:
+        return run_conda_task(task_id, args, first_phase=phase, detect_phases=False)
+
+    def on_fetch_error(e: Exception):
+        logger.warning(f"获取部分 wheel 失败，交给最终安装处理: {e}", extra=task_log_fields(task_id, name))
+
+    timing = pip_stage.install(name, requirements, run, on_fetch_error=on_fetch_error, fatal=(TaskCancelled,))
+    PIP_WHEEL_CACHE.inc(result=timing["cache"])
+    set_task_fields(task_id, pip_cache=timing["cache"], pip_timing=timing)
+    cache = {"hit": "命中", "miss": "未命中", "unpinned": "未使用（有未固定版本的依赖）"}[timing["cache"]]
+    log(f"pip 依赖安装完成: {timing['requirements']} 个，wheel 缓存{cache}，"
+        f"耗时 {timing['wall_time']:.1f} 秒", task_id=task_id, env=name)
+
+
+def create_from_yaml_background(name: str, spec: Dict, task_id: str = None):
+    try:
+        update_task(task_id, 0, "正在准备创建环境...", "running")
+        log(f"开始从 YAML 创建环境: {name}（conda 依赖 {len(spec['dependencies'])} 个，pip 依赖 {len(spec['pip'])} 个）",
+            task_id=task_id, env=name)
+        python_spec = next((dep for dep in spec["dependencies"] if re.match(r"python[=<>!~ ]", dep)), "")
+        set_task_features(task_id, python_version=re.sub(r"^python[=<>!~ ]+", "", python_spec).split("=")[0],
+                          package_count=len(spec["dependencies"]) + len(spec["pip"]))
+
+        acquire_stage_slot(task_id, conda_stage_slots, " conda 阶段", 5)
+        try:
+            update_task(task_id, 10, "正在解析依赖...", "running")
+            scale = 0.8 if spec["pip"] else 1.0
+            create_from_specs(task_id, name, spec["dependencies"], channels=spec["channels"],
+                              on_line=create_progress(task_id, scale), online_lock=online_create_lock)
+        finally:
+            conda_stage_slots.release()
+
+        if spec["pip"]:
+            acquire_stage_slot(task_id, pip_stage_slots, " pip 阶段", 80)
+            try:
+                update_task(task_id, 80, "正在安装 pip 依赖...", "running")
+                install_pip_stage(task_id, name, spec["pip"])
+            finally:
+                pip_stage_slots.release()
+
+        update_task(task_id, 100, "创建完成", "completed")
+        log(f"✅ 环境 '{name}' 已从 YAML 创建", task_id=task_id, env=name)
+    except TaskCancelled:
+        cancel_task_background(name, task_id, cleanup=True)
+    except Exception as e:
+        update_task(task_id, 0, f"创建失败: {str(e)}", "failed")
+        log(f"❌ 从 YAML 创建失败: {str(e)}", error=True, task_id=task_id, env=name)
+
+
+def submit_yaml_env(spec: Dict, existing_names: set, idempotency_key: Optional[str] = None) -> Dict:
+    """校验并提交一个从 YAML 创建环境的任务；返回 {"name", "task_id"}（沿用已有任务时另含 "deduplicated"）"""
+    name = spec["name"]
+    fingerprint = ("from-yaml", name, spec["digest"])
+    existing = find_duplicate_task(name, fingerprint, idempotency_key)
+    if existing:
+        return {"name": name, "task_id": existing, "deduplicated": True}
+    if name in existing_names:
+        raise HTTPException(status_code=400, detail=f"环境 '{name}' 已存在")
+    task_id = str(uuid.uuid4())
+    existing = find_duplicate_task(name, fingerprint, idempotency_key, task_id)
+    if existing:
+        return {"name": name, "task_id": existing, "deduplicated": True}
+    submit_task(None, "from-yaml", create_from_yaml_background, name, spec, env=name, task_id=task_id,
+                executor=yaml_executor)
+    return {"name": name, "task_id": task_id}
+
+
+@app.post("/envs/from-yaml")
+async def create_env_from_yaml(req: FromYamlRequest, idempotency_key: Optional[str] = Header(None)):
+    """
+    按 environment.yml 创建环境：conda 依赖经解析缓存 / 本地缓存优先的创建流程安装，pip 依赖随后安装
+    批量导入（items）时每个环境各自是一个任务（GET /tasks/{task_id} 查看进度），另返回汇总各环境进度的
+    batch_id；无效的条目在结果中给出 error，不影响其他条目
+    """
+    try:
+        envs = await asyncio.to_thread(list_all_envs)
+        existing_names = {env["name"] for env in envs}
+        if not req.items:
+            try:
+                spec = await asyncio.to_thread(load_yaml_source, req)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            result = submit_yaml_env(spec, existing_names, idempotency_key)
+            if result.get("deduplicated"):
+                return duplicate_response(result["task_id"])
+            return {"message": f"正在后台从 YAML 创建环境: {spec['name']}", "task_id": result["task_id"]}
+
+        items, seen = [], set()
+        for source in req.items:
+            spec = None
+            try:
+                spec = await asyncio.to_thread(load_yaml_source, source)
+                if spec["name"] in seen:
+                    raise ValueError(f"批次中环境名 '{spec['name']}' 重复")
+                seen.add(spec["name"])
+                items.append(submit_yaml_env(spec, existing_names))
+            except ValueError as e:
+                items.append({"name": spec["name"] if spec else source.name, "error": str(e)})
+            except HTTPException as e:
+                items.append({"name": spec["name"], "error": e.detail})
+        batch_id = str(uuid.uuid4())
+        state.put_task(batch_id, {"operation": "from-yaml-batch", "status": "running", "items": items,
+                                  "created_at": round(time.time(), 3)})
+        submitted = sum(1 for item in items if "task_id" in item)
+        log(f"批量从 YAML 创建环境: 提交 {submitted} 个，无效 {len(items) - submitted} 个（批次 {batch_id}）")
+        return {"message": f"已提交 {submitted} 个环境", "batch_id": batch_id, "tasks": items}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(str(e), error=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def batch_summary(record: Dict) -> Dict:
+    """汇总批量任务中各环境任务的状态：整体进度为已提交任务的平均值，全部结束前为 running（无效条目记为 invalid，不参与汇总）"""
+    items, counts = [], {}
+    for item in record["items"]:
+        task = get_task(item["task_id"]) if "task_id" in item else None
+        if "error" in item:
+            item = dict(item, status="invalid", progress=0)
+        elif task is None:
+            item = dict(item, status="unknown", progress=0)
+        else:
+            item = dict(item, status=task.get("status"), progress=task.get("progress", 0), stage=task.get("stage"))
+        counts[item["status"]] = counts.get(item["status"], 0) + 1
+        items.append(item)
+    submitted = [item for item in items if item["status"] != "invalid"]
+    if any(status in counts for status in ("queued", "running", "cancelling")):
+        status = "running"
+    elif counts.get("completed", 0) == len(submitted):
+        status = "completed"
+    elif "failed" in counts or "unknown" in counts:
+        status = "failed"
+    else:
+        status = "cancelled"
+    progress = int(sum(item["progress"] for item in submitted) / len(submitted)) if submitted else 100
+    return dict(record, items=items, counts=counts, status=status, progress=progress)
+
+
 # 新增：导出环境接口
 class ExportEnvRequest(BaseModel):
     env_name: Optional[str] = None
@@ -1050,30 +1156,336 @@ async def export_env(req: ExportEnvRequest):
     try:
         # 验证环境名（如果指定）
         if req.env_name:
-            envs = list_all_envs()
+            envs = await asyncio.to_thread(list_all_envs)
             env_names = [env["name"] for env in envs]
             if req.env_name not in env_names:
                 raise HTTPException(status_code=400, detail=f"环境 '{req.env_name}' 不存在")
 
-        # 执行导出
-        result = export_conda_env(
-            env_name=req.env_name,
-            output_file=req.output_file,
-            output_md=req.output_md
-        )
+        # 执行导出（同步完成，但同样记录为任务，便于统计各阶段耗时）
+        task_id = str(uuid.uuid4())
+        update_task(task_id, 0, "正在导出...", "running", operation="export", env=req.env_name)
+        mark_phase(task_id, "export")
+        start = time.perf_counter()
+        try:
+            with CondaCommandTimer(["env", "export"]) as timer:
+                result = export_conda_env(
+                    env_name=req.env_name,
+                    output_file=req.output_file,
+                    output_md=req.output_md
+                )
+                if result["status"] == "failed":
+                    timer.failed()
+            set_task_fields(task_id, conda_wall_time=round(time.perf_counter() - start, 3))
+            if result["status"] == "failed":
+                update_task(task_id, 0, f"导出失败: {result['msg']}", "failed")
+                log(result["msg"], error=True, task_id=task_id, env=req.env_name)
+            else:
+                update_task(task_id, 100, "导出完成", "completed")
+                log(result["msg"], task_id=task_id, env=req.env_name)
+        finally:
+            finish_phases(task_id)
+            task_progress.pop(task_id, None)
+            _task_locks.pop(task_id, None)
 
         if result["status"] == "failed":
-            log(result["msg"], error=True)
             raise HTTPException(status_code=500, detail=result["msg"])
 
-        log(result["msg"])
-
         # 读取YAML文件内容并返回
         with open(result["yml_file"], 'r', encoding='utf-8') as f:
             yml_content = f.read()
 
-        return {"yml_content": yml_content}
+        return {"yml_content": yml_content, "task_id": task_id}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(str(e), error=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# 新增：打包/解包环境接口（可重定位归档，跨主机迁移无需重新解析依赖）
+class PackEnvRequest(BaseModel):
+    env_name: str
+    output_file: Optional[str] = None
+    threads: int = -1
+
+
+class UnpackEnvRequest(BaseModel):
+    archive: str
+    new_env: str
+
+
+def get_envs_dir() -> str:
+    """获取新环境的默认存放目录（conda 配置的第一个 envs_dirs）"""
+    info = conda_info()
+    envs_dirs = info.get("envs_dirs") or [os.path.join(info["root_prefix"], "envs")]
+    return envs_dirs[0]
+
+
+def pack_env_background(env_name: str, prefix: str, output_file: str, threads: int, task_id: str):
+    update_task(task_id, 0, "正在扫描环境文件...", "running")
+    log(f"开始打包环境: {env_name} → {output_file}", task_id=task_id, env=env_name)
+
+    def on_progress(pct: int, stage: str):
+        update_task(task_id, min(pct, 99), stage, "running")
+
+    result = pack_env(prefix, output_file, threads=threads, progress_cb=on_progress)
+    if result["status"] == "failed":
+        update_task(task_id, 0, result["msg"], "failed")
+        log(f"❌ {result['msg']}", error=True, task_id=task_id, env=env_name)
+        return
+    update_task(task_id, 100, "打包完成", "completed", archive=output_file)
+    log(f"✅ {result['msg']}", task_id=task_id, env=env_name)
+
+
+def unpack_env_background(archive: str, new_env: str, task_id: str):
+    dest_prefix, created = None, False
+    try:
+        update_task(task_id, 0, "正在准备解压...", "running")
+        log(f"开始解压环境: {archive} → {new_env}", task_id=task_id, env=new_env)
+        dest_prefix = os.path.join(get_envs_dir(), new_env)
+        created = not os.path.exists(dest_prefix)
+
+        def on_progress(pct: int, stage: str):
+            update_task(task_id, min(pct, 99), stage, "running")
+
+        result = unpack_env(archive, dest_prefix, progress_cb=on_progress)
+        if result["status"] == "failed":
+            raise Exception(result["msg"])
+        update_task(task_id, 100, "解压完成", "completed")
+        log(f"✅ {result['msg']}", task_id=task_id, env=new_env)
+    except Exception as e:
+        # 清理本任务创建的半成品目录，避免残留为损坏的环境、阻止用同名重试
+        if created and os.path.exists(dest_prefix):
+            shutil.rmtree(dest_prefix, ignore_errors=True)
+        update_task(task_id, 0, f"解压失败: {str(e)}", "failed")
+        log(f"❌ 解压失败: {str(e)}", error=True, task_id=task_id, env=new_env)
+
+
+@app.post("/envs/pack")
+async def pack_env_api(req: PackEnvRequest, background_tasks: BackgroundTasks,
+                       idempotency_key: Optional[str] = Header(None)):
+    """将环境打包为可重定位的 .tar.zst 归档（后台任务；打包期间该环境上的其他任务返回 409）"""
+    try:
+        output_file = req.output_file or f"{req.env_name}.tar.zst"
+        fingerprint = ("pack", req.env_name, output_file)
+        existing = find_duplicate_task(req.env_name, fingerprint, idempotency_key)
+        if existing:
+            return duplicate_response(existing)
+
+        envs = await asyncio.to_thread(list_all_envs)
+        env = next((env for env in envs if env["name"] == req.env_name), None)
+        if env is None:
+            raise HTTPException(status_code=400, detail=f"环境 '{req.env_name}' 不存在")
+
+        task_id = str(uuid.uuid4())
+        existing = find_duplicate_task(req.env_name, fingerprint, idempotency_key, task_id)
+        if existing:
+            return duplicate_response(existing)
+        submit_task(background_tasks, "pack", pack_env_background, req.env_name, env["path"], output_file,
+                    req.threads, env=req.env_name, task_id=task_id)
+        return {"message": f"正在后台打包环境: {req.env_name} → {output_file}", "task_id": task_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(str(e), error=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/envs/unpack")
+async def unpack_env_api(req: UnpackEnvRequest, background_tasks: BackgroundTasks,
+                         idempotency_key: Optional[str] = Header(None)):
+    """将归档解压为新环境（后台任务；同名的新环境同一时间只有一个任务在写）"""
+    try:
+        if not is_valid_env_name(req.new_env):
+            raise HTTPException(status_code=400, detail="新环境名只能包含字母、数字、下划线、连字符或点（不能以点开头）")
+        fingerprint = ("unpack", os.path.abspath(req.archive), req.new_env)
+        existing = find_duplicate_task(req.new_env, fingerprint, idempotency_key)
+        if existing:
+            return duplicate_response(existing)
+        if not os.path.isfile(req.archive):
+            raise HTTPException(status_code=400, detail=f"归档文件 '{req.archive}' 不存在")
+
+        envs = await asyncio.to_thread(list_all_envs)
+        if any(env["name"] == req.new_env for env in envs):
+            raise HTTPException(status_code=400, detail=f"新环境 '{req.new_env}' 已存在")
+
+        task_id = str(uuid.uuid4())
+        existing = find_duplicate_task(req.new_env, fingerprint, idempotency_key, task_id)
+        if existing:
+            return duplicate_response(existing)
+        submit_task(background_tasks, "unpack", unpack_env_background, req.archive, req.new_env,
+                    env=req.new_env, task_id=task_id)
+        return {"message": f"正在后台解压环境: {req.archive} → {req.new_env}", "task_id": task_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(str(e), error=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# 新增：环境修订与回滚（conda-meta/history + 硬链接快照）
+class RollbackRequest(BaseModel):
+    revision: int
+    # 回滚前为当前状态建立硬链接快照：回滚失败时自动恢复，之后也可以快速回到回滚前的状态
+    snapshot: bool = True
+
+
+@lru_cache(maxsize=1)
+def snapshot_store() -> SnapshotStore:
+    """环境快照目录：ENV_SNAPSHOT_DIR，默认 <envs_dir>/.snapshots（与环境同一文件系统，才能硬链接）"""
+    return SnapshotStore(os.environ.get("ENV_SNAPSHOT_DIR") or os.path.join(get_envs_dir(), ".snapshots"))
+
+
+def find_env(name: str) -> Optional[Dict[str, str]]:
+    return next((env for env in list_all_envs() if env["name"] == name), None)
+
+
+def rollback_env_background(name: str, prefix: str, revision: int, snapshot: bool, task_id: str):
+    """
+    回滚到指定修订：有包集合完全相同的快照时直接换入快照；否则按最小变更强制移除 + 显式安装（不求解）；
+    所需的包不全在本地缓存中时才退回 conda install --revision（需要求解）
+    所用方式记入任务记录 "rollback_method"（noop / snapshot / delta / revision）
+    """
+    taken = None
+    try:
+        update_task(task_id, 0, "正在读取修订历史...", "running")
+        log(f"开始回滚环境: {name} → 修订 {revision}", task_id=task_id, env=name)
+        target = packages_at(parse_history(prefix), revision)
+        remove, install = package_delta(installed_packages(prefix), target)
+        set_task_fields(task_id, rollback_delta={"remove": remove, "install": install})
+        set_task_features(task_id, package_count=len(remove) + len(install))
+        if not remove and not install:
+            update_task(task_id, 100, "环境已处于该修订的状态", "completed", rollback_method="noop")
+            log(f"环境 '{name}' 已处于修订 {revision} 的状态，无需回滚", task_id=task_id, env=name)
+            return
+
+        store = snapshot_store()
+        if snapshot:
+            update_task(task_id, 10, "正在建立快照...", "running")
+            mark_phase(task_id, "snapshot")
+            taken = store.create(name, prefix)
+            set_task_fields(task_id, snapshot_id=taken["id"])
+            log(f"已建立快照 {taken['id']}（硬链接 {taken['linked']} 个文件，复制 {taken['copied']} 个，"
+                f"{taken['seconds']:.1f} 秒）", task_id=task_id, env=name)
+
+        match = store.find(name, target)
+        if match:
+            update_task(task_id, 30, "正在从快照恢复...", "running")
+            mark_phase(task_id, "restore")
+            store.restore(name, match["id"], prefix)
+            method = "snapshot"
+        else:
+            lines, missing = explicit_urls(install, conda_info().get("pkgs_dirs") or [])
+            if missing:
+                log(f"{len(missing)} 个包不在本地缓存中（如 {missing[0]}），改用 conda install --revision",
+                    task_id=task_id, env=name)
+                update_task(task_id, 30, "正在按修订重新求解...", "running")
+                run_conda_task(task_id, ["install", "--name", name, "--revision", str(revision), "--yes"])
+                method = "revision"
+            else:
+                if remove:
+                    update_task(task_id, 30, f"正在移除 {len(remove)} 个包...", "running")
+                    run_conda_task(task_id, ["remove", "--name", name, "--force", "--yes"] + remove,
+                                   first_phase="unlink")
+                if lines:
+                    update_task(task_id, 60, f"正在安装 {len(lines)} 个包...", "running")
+                    install_explicit(task_id, name, "@EXPLICIT\n" + "\n".join(lines) + "\n", command="install")
+                method = "delta"
+
+        update_task(task_id, 100, "回滚完成", "completed", rollback_method=method)
+        log(f"✅ 环境 '{name}' 已回滚到修订 {revision}（{method}）", task_id=task_id, env=name)
+    except Exception as e:
+        if taken is not None:
+            try:
+                snapshot_store().restore(name, taken["id"], prefix)
+                e = Exception(f"{e}（已从快照 {taken['id']} 恢复回滚前的状态）")
+            except Exception as restore_error:
+                log(f"从快照恢复失败: {restore_error}", error=True, task_id=task_id, env=name)
+        update_task(task_id, 0, f"回滚失败: {str(e)}", "failed")
+        log(f"❌ 回滚失败: {str(e)}", error=True, task_id=task_id, env=name)
+
+
+def snapshot_env_background(name: str, prefix: str, task_id: str):
+    try:
+        update_task(task_id, 10, "正在建立快照...", "running")
+        mark_phase(task_id, "snapshot")
+        meta = snapshot_store().create(name, prefix)
+        update_task(task_id, 100, "快照完成", "completed", snapshot_id=meta["id"])
+        log(f"✅ 已为环境 '{name}' 建立快照 {meta['id']}（修订 {meta['revision']}）", task_id=task_id, env=name)
+    except Exception as e:
+        update_task(task_id, 0, f"快照失败: {str(e)}", "failed")
+        log(f"❌ 快照失败: {str(e)}", error=True, task_id=task_id, env=name)
+
+
+@app.get("/envs/{name}/revisions")
+async def list_env_revisions(name: str):
+    """环境的修订历史（conda-meta/history）与已有快照；修订中的 snapshot 为该修订时建立的快照 id"""
+    env = await asyncio.to_thread(find_env, name)
+    if env is None:
+        raise HTTPException(status_code=404, detail=f"环境 '{name}' 不存在")
+    revisions = await asyncio.to_thread(parse_history, env["path"])
+    snapshots = await asyncio.to_thread(snapshot_store().list, name)
+    by_revision = {}
+    for item in snapshots:
+        by_revision.setdefault(item["revision"], item["id"])
+    return {
+        "env": name,
+        "current": len(revisions) - 1,
+        "revisions": [dict(revision, snapshot=by_revision.get(revision["rev"])) for revision in revisions],
+        "snapshots": [{key: value for key, value in item.items() if key != "packages"} for item in snapshots],
+    }
+
+
+@app.post("/envs/{name}/rollback")
+async def rollback_env(name: str, req: RollbackRequest, background_tasks: BackgroundTasks,
+                       idempotency_key: Optional[str] = Header(None)):
+    """回滚环境到指定修订（后台任务）"""
+    try:
+        fingerprint = ("rollback", name, req.revision)
+        existing = find_duplicate_task(name, fingerprint, idempotency_key)
+        if existing:
+            return duplicate_response(existing)
+
+        env = await asyncio.to_thread(find_env, name)
+        if env is None:
+            raise HTTPException(status_code=400, detail=f"环境 '{name}' 不存在")
+        revisions = await asyncio.to_thread(parse_history, env["path"])
+        if not 0 <= req.revision < len(revisions):
+            raise HTTPException(status_code=400, detail=f"修订号超出范围（0 ~ {len(revisions) - 1}）")
+
+        task_id = str(uuid.uuid4())
+        existing = find_duplicate_task(name, fingerprint, idempotency_key, task_id)
+        if existing:
+            return duplicate_response(existing)
+        submit_task(background_tasks, "rollback", rollback_env_background, name, env["path"], req.revision,
+                    req.snapshot, env=name, task_id=task_id)
+        return {"message": f"正在后台回滚环境: {name} → 修订 {req.revision}", "task_id": task_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(str(e), error=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
 
+@app.post("/envs/{name}/snapshots")
+async def snapshot_env(name: str, background_tasks: BackgroundTasks):
+    """为环境当前状态建立硬链接快照（在外部做有风险的修改之前调用），之后回滚到该状态时直接换入"""
+    try:
+        fingerprint = ("snapshot", name)
+        existing = find_duplicate_task(name, fingerprint, None)
+        if existing:
+            return duplicate_response(existing)
+        env = await asyncio.to_thread(find_env, name)
+        if env is None:
+            raise HTTPException(status_code=400, detail=f"环境 '{name}' 不存在")
+        task_id = str(uuid.uuid4())
+        existing = find_duplicate_task(name, fingerprint, None, task_id)
+        if existing:
+            return duplicate_response(existing)
+        submit_task(background_tasks, "snapshot", snapshot_env_background, name, env["path"], env=name,
+                    task_id=task_id)
+        return {"message": f"正在为环境建立快照: {name}", "task_id": task_id}
     except HTTPException:
         raise
     except Exception as e:
@@ -1081,454 +1493,248 @@ async def export_env(req: ExportEnvRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# 新增：跨环境文件去重（相同文件替换为硬链接 / reflink）
+class DedupRequest(BaseModel):
+    envs: Optional[List[str]] = None  # 默认所有环境
+    dry_run: bool = True
+    mode: str = "hardlink"  # hardlink / reflink
+    min_size: int = DEDUP_MIN_SIZE
+
+
+def dedup_background(prefixes: Dict[str, str], dry_run: bool, mode: str, min_size: int, task_id: str):
+    try:
+        update_task(task_id, 0, "正在扫描文件...", "running")
+        log(f"开始{'统计' if dry_run else '执行'}跨环境去重: {len(prefixes)} 个环境（{mode}）", task_id=task_id)
+
+        def on_progress(pct: int, stage: str):
+            update_task(task_id, min(pct, 99), stage, "running")
+
+        mark_phase(task_id, "scan")
+        report = deduplicate(prefixes, dry_run=dry_run, mode=mode, min_size=min_size, progress_cb=on_progress)
+        mib = (report["reclaimable_bytes"] if dry_run else report["reclaimed_bytes"]) / 1024 / 1024
+        update_task(task_id, 100, f"{'可回收' if dry_run else '已回收'} {mib:.1f} MiB", "completed",
+                    dedup_report=report)
+        log(f"✅ 去重{'统计' if dry_run else ''}完成: 重复文件 {report['duplicate_files']} 个，"
+            f"{'可回收' if dry_run else '已回收'} {mib:.1f} MiB，失败 {report['error_count']} 个", task_id=task_id)
+    except Exception as e:
+        update_task(task_id, 0, f"去重失败: {str(e)}", "failed")
+        log(f"❌ 去重失败: {str(e)}", error=True, task_id=task_id)
+
+
+@app.post("/envs/dedup")
+async def dedup_envs(req: DedupRequest, background_tasks: BackgroundTasks):
+    """
+    跨环境查找相同文件（先按大小分组，再并行计算哈希），dry_run=true（默认）只报告可回收的字节数，
+    否则把重复文件替换为硬链接 / reflink；报告在任务记录的 dedup_report 中
+    选中的环境在任务期间登记为本任务进行中（其他任务返回 409）；正有其他任务进行的环境被跳过（返回的 skipped）
+    """
+    try:
+        if req.mode not in ("hardlink", "reflink"):
+            raise HTTPException(status_code=400, detail="mode 只能是 hardlink 或 reflink")
+        envs = await asyncio.to_thread(list_all_envs)
+        selected = [env for env in envs if req.envs is None or env["name"] in req.envs]
+        unknown = sorted(set(req.envs or []) - {env["name"] for env in envs})
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"环境不存在: {', '.join(unknown)}")
+
+        # 逐个登记选中的环境，替换文件期间其他任务不能修改它们；已被占用的环境跳过
+        fingerprint = ("dedup", tuple(sorted(env["name"] for env in selected)), req.dry_run, req.mode)
+        task_id = str(uuid.uuid4())
+        busy, holders = [], set()
+        for env in selected:
+            entry = state.claim(env["name"], fingerprint, None, task_id, IDEMPOTENCY_TTL)
+            if entry is not None:
+                busy.append(env["name"])
+                holders.add(entry["task_id"] if entry["fingerprint"] == fingerprint else None)
+        prefixes = {env["name"]: env["path"] for env in selected if env["name"] not in busy}
+        if selected and not prefixes and len(holders) == 1 and None not in holders:
+            # 相同的去重请求正在进行（重试），沿用已有任务
+            return duplicate_response(holders.pop())
+        try:
+            submit_task(background_tasks, "dedup", dedup_background, prefixes, req.dry_run, req.mode, req.min_size,
+                        task_id=task_id, claimed=list(prefixes))
+        except Exception:
+            for name in prefixes:
+                state.release(name, task_id)
+            raise
+        return {"message": f"正在后台{'统计' if req.dry_run else '执行'}去重: {len(prefixes)} 个环境",
+                "task_id": task_id, "skipped": busy}
+    except HTTPException:
+        raise
+    except Exception as e:
+        log(str(e), error=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/tasks/stats")
+async def get_task_stats():
+    """
+    按操作汇总已结束任务的各阶段耗时、conda 子进程耗时与 pip 阶段耗时（平均值 / 最大值，单位秒），
+    以及创建的解析途径、解析缓存与 wheel 缓存的使用计数
+    """
+    stats = {}
+    for record in await asyncio.to_thread(state.list_tasks, ("completed", "failed", "cancelled")):
+        if "phase_durations" not in record:
+            continue
+        entry = stats.setdefault(record.get("operation", "unknown"), {"count": 0, "failed": 0, "_values": {}})
+        entry["count"] += 1
+        if record.get("status") == "failed":
+            entry["failed"] += 1
+        for field in ("resolution", "solve_cache", "pip_cache", "rollback_method"):
+            if field in record:
+                counts = entry.setdefault(field, {})
+                counts[record[field]] = counts.get(record[field], 0) + 1
+        values = dict(record["phase_durations"], elapsed=record.get("elapsed"),
+                      conda_wall_time=record.get("conda_wall_time"), conda_cpu_time=record.get("conda_cpu_time"),
+                      pip_wall_time=record.get("pip_timing", {}).get("wall_time"))
+        for key, value in values.items():
+            if value is not None:
+                entry["_values"].setdefault(key, []).append(value)
+
+    for entry in stats.values():
+        for key, values in entry.pop("_values").items():
+            entry[key] = {"mean": round(sum(values) / len(values), 3), "max": round(max(values), 3)}
+    return stats
+
+
 @app.get("/tasks/{task_id}")
 async def get_task_progress(task_id: str):
     """获取任务进度"""
-    if task_id in task_progress:
-        return task_progress[task_id]
+    record = get_task(task_id)
+    if record is not None and "items" in record:
+        return await asyncio.to_thread(batch_summary, record)
+    if record is not None:
+        # 有历史可参考时，按实际阶段与预计耗时给出进度与剩余时间（秒）
+        if record["status"] in ("queued", "running") and "expected" in record:
+            progress, eta = estimate_progress(record["expected"], record.get("phases", []))
+            return dict(record, progress=progress, eta_seconds=eta)
+        return record
     return {"progress": 0, "stage": "任务不存在或已完成", "status": "unknown"}
 
 
-@app.get("/logs")
-async def get_logs():
-    """获取最新 100 条日志"""
-    return {"logs": log_messages[-100:]}
+@app.delete("/tasks/{task_id}")
+async def cancel_task(task_id: str):
+    """
+    取消任务：排队中的任务不再执行；运行中的创建 / 克隆结束其 conda 进程组（先 SIGTERM，
+    CANCEL_GRACE 秒后仍未退出则 SIGKILL），并由执行任务的 worker 清理未建完的环境目录
+    """
+    record = get_task(task_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    if "items" in record:
+        # 批量任务：取消其中尚未结束的各个任务
+        cancelled = []
+        for item in record["items"]:
+            try:
+                if "task_id" in item:
+                    await cancel_task(item["task_id"])
+                    cancelled.append(item["task_id"])
+            except HTTPException:
+                pass
+        return {"message": f"正在取消批次中的 {len(cancelled)} 个任务", "task_id": task_id, "cancelled": cancelled}
+    status = record.get("status")
+    if status in ("cancelling", "cancelled"):
+        return {"message": "任务已取消", "task_id": task_id, "status": status}
+    if status not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"任务已结束（{status}），无法取消")
+    if status == "running" and record.get("operation") not in CANCELLABLE_OPERATIONS:
+        raise HTTPException(status_code=409, detail=f"运行中的 {record.get('operation')} 任务不支持取消")
+
+    state.set_cache(f"cancel:{task_id}", True, CANCEL_TTL)
+    log(f"收到取消请求: {task_id}", task_id=task_id, env=record.get("env"))
+    # 结束任务的所有 conda 子进程，宽限期后仍在登记中的强制结束
+    pids = [pid for pid in record.get("pids", []) if kill_process_group(pid)]
+    for _ in range(int(CANCEL_GRACE * 10) if pids else 0):
+        await asyncio.sleep(0.1)
+        pids = [pid for pid in pids if pid in (get_task(task_id) or {}).get("pids", [])]
+        if not pids:
+            break
+    for pid in pids:
+        kill_process_group(pid, force=True)
+    return {"message": "正在取消任务", "task_id": task_id, "status": "cancelling"}
 
 
-# ========================
-# 静态文件与首页（新增导出功能UI）
-# ========================
-STATIC_DIR = "static"
-INDEX_FILE = os.path.join(STATIC_DIR, "index.html")
+@app.get("/channel/local")
+async def local_channel_status():
+    """本地 file:// channel 的状态（地址、包数量、投放目录）"""
+    if local_channel is None:
+        raise HTTPException(status_code=404, detail="本地 channel 未启用（LOCAL_CHANNEL=0）")
+    return await asyncio.to_thread(local_channel.status)
 
-os.makedirs(STATIC_DIR, exist_ok=True)
-
-# 自动生成默认 index.html（包含导出功能）
-if not os.path.exists(INDEX_FILE):
-    with open(INDEX_FILE, "w", encoding="utf-8") as f:
-        f.write("""
-<!DOCTYPE html>
-<html lang="zh-CN">
-<head>
-  <meta charset="UTF-8" />
-  <meta name="viewport" content="width=device-width, initial-scale=1.0"/>
-  <title>Conda 环境管理</title>
-  <style>
-    :root {
-      --primary: #4e73df; --success: #28a745; --danger: #dc3545; --light: #f8f9fa; --dark: #343a40; --gray: #6c757d;
-    }
-    * { margin: 0; padding: 0; box-sizing: border-box; }
-    body { font-family: -apple-system, BlinkMacSystemFont, "Segoe UI", Roboto, sans-serif; background: #f5f7fb; color: #333; padding: 20px; line-height: 1.6; }
-    .page-header { text-align: center; margin-bottom: 24px; }
-    .page-header h1 { color: var(--primary); margin-bottom: 8px; }
-    .container { max-width: 1200px; margin: 0 auto; display: flex; gap: 24px; }
-    .main-content { flex: 2; display: flex; flex-direction: column; gap: 24px; }
-    .log-sidebar { flex: 1; min-width: 300px; align-self: flex-start; }
-    .card { background: white; border-radius: 8px; box-shadow: 0 2px 10px rgba(0,0,0,0.08); padding: 20px; }
-    .form-group { margin-bottom: 15px; }
-    label { display: block; margin-bottom: 6px; font-weight: 600; }
-    input, select, button { padding: 10px 12px; border: 1px solid #ddd; border-radius: 4px; font-size: 14px; width: 100%; }
-    .btn { background: var(--primary); color: white; border: none; cursor: pointer; font-weight: 600; transition: opacity 0.2s; width: auto; }
-    .btn:hover { opacity: 0.9; }
-    .btn-danger { background: var(--danger); }
-    .btn-success { background: var(--success); }
-    .env-list { list-style: none; }
-    .env-item { display: flex; justify-content: space-between; align-items: center; padding: 12px 0; border-bottom: 1px solid #eee; }
-    .env-item:last-child { border-bottom: none; }
-    .env-name { font-weight: 600; font-size: 16px; }
-    .env-version { color: var(--gray); font-size: 14px; }
-    .actions { display: flex; gap: 8px; }
-    .log-container { height: 420px; overflow-y: auto; background: #2d2d2d; color: #f8f8f2; padding: 12px; border-radius: 6px; font-family: monospace; font-size: 13px; }
-    .log-entry { margin-bottom: 6px; word-break: break-word; }
-    .log-error { color: #ff5555; }
-    .log-header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 12px; }
-    .progress-container { margin-bottom: 12px; display: none; }
-    .progress-container.active { display: block; }
-    .progress-bar-wrapper { background: #e9ecef; border-radius: 4px; height: 20px; overflow: hidden; position: relative; }
-    .progress-bar { height: 100%; background: linear-gradient(90deg, #4e73df, #6f8feb); transition: width 0.3s ease; border-radius: 4px; }
-    .progress-text { position: absolute; top: 50%; left: 50%; transform: translate(-50%, -50%); font-size: 12px; font-weight: 600; color: #333; }
-    .progress-stage { font-size: 12px; color: #666; margin-top: 4px; }
-    @media (max-width: 900px) {
-      .container { flex-direction: column; }
-      .log-sidebar { min-width: auto; align-self: stretch; }
-      .log-container { height: 180px; }
-    }
-  </style>
-</head>
-<body>
-  <div class="page-header">
-    <h1>📦 Conda 环境管理</h1>
-    <p>创建、克隆、导出、查看和删除你的 Python 虚拟环境</p>
-  </div>
-
-  <div class="container">
-    <div class="main-content">
-      <!-- 创建环境 -->
-      <div class="card">
-        <h2>✨ 创建新环境</h2>
-        <div class="form-group">
-          <label for="envName">环境名称</label>
-          <input type="text" id="envName" placeholder="例如：my_project" />
-        </div>
-        <div class="form-group">
-          <label for="pythonVersion">Python 版本</label>
-          <select id="pythonVersion">
-            <option value="3.8">3.8</option><option value="3.9">3.9</option><option value="3.10">3.10</option>
-            <option value="3.11">3.11</option><option value="3.12" selected>3.12</option><option value="3.13">3.13</option>
-          </select>
-        </div>
-        <button class="btn" onclick="createEnv()">🚀 创建环境</button>
-      </div>
-
-      <!-- 克隆环境 -->
-      <div class="card">
-        <h2>🔄 克隆环境</h2>
-        <div class="form-group">
-          <label for="sourceEnv">源环境</label>
-          <select id="sourceEnv">
-            <option value="">加载中...</option>
-          </select>
-        </div>
-        <div class="form-group">
-          <label for="newEnvName">新环境名称</label>
-          <input type="text" id="newEnvName" placeholder="例如：my_project_copy" />
-        </div>
-        <button class="btn" onclick="cloneEnv()">📋 克隆环境</button>
-      </div>
-
-      <!-- 导出环境 -->
-      <div class="card">
-        <h2>📤 导出环境</h2>
-        <div class="form-group">
-          <label for="exportEnv">要导出的环境（留空则导出当前环境）</label>
-          <select id="exportEnv">
-            <option value="">当前环境</option>
-            <option value="">加载中...</option>
-          </select>
-        </div>
-        <div class="form-group">
-          <label for="outputYml">YAML 输出文件名</label>
-          <input type="text" id="outputYml" value="environment.yml" placeholder="例如：my_env.yml" />
-        </div>
-        <div class="form-group">
-          <label for="outputMd">MD 指南输出文件名</label>
-          <input type="text" id="outputMd" value="使用yml之前先看.md" placeholder="例如：env_guide.md" />
-        </div>
-        <button class="btn btn-success" onclick="exportEnv()">📥 导出环境</button>
-      </div>
-
-      <!-- 环境列表 -->
-      <div class="card">
-        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 15px;">
-          <h2>📋 已有环境</h2>
-          <button class="btn" style="padding: 6px 12px; font-size: 14px;" onclick="loadEnvs()">🔄 刷新</button>
-        </div>
-        <ul id="envList" class="env-list">
-          <li>加载中...</li>
-        </ul>
-      </div>
-    </div>
-
-    <!-- 日志侧边栏 -->
-    <div class="log-sidebar">
-      <div class="card">
-        <div class="log-header">
-          <h2>📜 操作日志</h2>
-          <button class="btn" style="padding: 4px 10px; font-size: 12px;" onclick="clearLogs()">🗑️ 清空</button>
-        </div>
-        <div id="progressContainer" class="progress-container">
-          <div class="progress-bar-wrapper">
-            <div id="progressBar" class="progress-bar" style="width: 0%;"></div>
-            <span id="progressText" class="progress-text">0%</span>
-          </div>
-          <div id="progressStage" class="progress-stage">准备中...</div>
-        </div>
-        <div id="logContainer" class="log-container"></div>
-      </div>
-    </div>
-  </div>
-
-  <script>
-    const API_BASE = window.location.origin;
-
-    // 加载环境列表（同时更新克隆/导出的源环境下拉框）
-    async function loadEnvs() {
-      try {
-        const res = await fetch(`${API_BASE}/envs`);
-        if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const envs = await res.json();
-        const list = document.getElementById('envList');
-        const sourceEnvSelect = document.getElementById('sourceEnv');
-        const exportEnvSelect = document.getElementById('exportEnv');
-
-        // 更新环境列表
-        if (envs.length === 0) {
-          list.innerHTML = '<li>暂无环境</li>';
-          sourceEnvSelect.innerHTML = '<option value="">暂无环境</option>';
-          exportEnvSelect.innerHTML = '<option value="">当前环境</option>';
-          return;
-        }
-        list.innerHTML = envs.map(env => `
-          <li class="env-item">
-            <div>
-              <div class="env-name">${escapeHtml(env.name)}</div>
-              <div class="env-version">Python ${escapeHtml(env.python_version)}</div>
-            </div>
-            <div class="actions">
-              <button class="btn btn-danger" onclick="deleteEnv('${escapeHtml(env.name)}')">🗑️ 删除</button>
-            </div>
-          </li>
-        `).join('');
-
-        // 更新克隆的源环境下拉框
-        sourceEnvSelect.innerHTML = envs.map(env => `
-          <option value="${escapeHtml(env.name)}">${escapeHtml(env.name)}</option>
-        `).join('');
-
-        // 更新导出的环境下拉框
-        exportEnvSelect.innerHTML = '<option value="">当前环境</option>' + envs.map(env => `
-          <option value="${escapeHtml(env.name)}">${escapeHtml(env.name)}</option>
-        `).join('');
-      } catch (err) {
-        document.getElementById('envList').innerHTML = `<li style="color:red">❌ 加载失败: ${err.message}</li>`;
-        document.getElementById('sourceEnv').innerHTML = '<option value="">加载失败</option>';
-        document.getElementById('exportEnv').innerHTML = '<option value="">当前环境</option><option value="">加载失败</option>';
-      }
-    }
 
-    // 创建环境
-    async function createEnv() {
-      const name = document.getElementById('envName').value.trim();
-      const version = document.getElementById('pythonVersion').value;
-      if (!name) {
-        alert('请输入环境名称');
-        return;
-      }
-      if (!/^[a-zA-Z0-9._-]+$/.test(name)) {
-        alert('环境名称只能包含字母、数字、点、下划线或连字符');
-        return;
-      }
-
-      try {
-        const res = await fetch(`${API_BASE}/envs`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ name, python_version: version })
-        });
-        if (!res.ok) {
-          const err = await res.json().catch(() => ({}));
-          throw new Error(err.detail || `HTTP ${res.status}`);
-        }
-        const data = await res.json();
-        addLog(data.message);
-        
-        // 启动进度跟踪
-        if (data.task_id) {
-          startProgressTracking(data.task_id, '创建环境');
-        }
-        
-        document.getElementById('envName').value = '';
-      } catch (err) {
-        addLog(`❌ 创建失败: ${err.message}`, true);
-      }
-    }
+@app.post("/channel/local/refresh")
+async def refresh_local_channel_api():
+    """立即增量更新本地 channel（例如向投放目录放入新包之后）"""
+    if local_channel is None:
+        raise HTTPException(status_code=404, detail="本地 channel 未启用（LOCAL_CHANNEL=0）")
+    try:
+        return await asyncio.to_thread(refresh_local_channel)
+    except Exception as e:
+        log(f"更新本地 channel 失败: {e}", error=True)
+        raise HTTPException(status_code=500, detail=str(e))
 
-    // 克隆环境
-    async function cloneEnv() {
-      const sourceEnv = document.getElementById('sourceEnv').value;
-      const newEnvName = document.getElementById('newEnvName').value.trim();
-
-      if (!sourceEnv) {
-        alert('请选择源环境');
-        return;
-      }
-      if (!newEnvName) {
-        alert('请输入新环境名称');
-        return;
-      }
-      if (!/^[a-zA-Z0-9._-]+$/.test(newEnvName)) {
-        alert('新环境名称只能包含字母、数字、点、下划线或连字符');
-        return;
-      }
-
-      try {
-        const res = await fetch(`${API_BASE}/envs/clone`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ source_env: sourceEnv, new_env: newEnvName })
-        });
-        if (!res.ok) {
-          const err = await res.json().catch(() => ({}));
-          throw new Error(err.detail || `HTTP ${res.status}`);
-        }
-        const data = await res.json();
-        addLog(data.message);
-        
-        // 启动进度跟踪
-        if (data.task_id) {
-          startProgressTracking(data.task_id, '克隆环境');
-        }
-        
-        document.getElementById('newEnvName').value = '';
-      } catch (err) {
-        addLog(`❌ 克隆失败: ${err.message}`, true);
-      }
-    }
 
-    // 导出环境
-    async function exportEnv() {
-      const envName = document.getElementById('exportEnv').value.trim() || null;
-      const outputYml = document.getElementById('outputYml').value.trim();
-      const outputMd = document.getElementById('outputMd').value.trim();
-
-      if (!outputYml) {
-        alert('请输入YAML输出文件名');
-        return;
-      }
-      if (!outputMd) {
-        alert('请输入MD指南输出文件名');
-        return;
-      }
-
-      try {
-        const res = await fetch(`${API_BASE}/envs/export`, {
-          method: 'POST',
-          headers: { 'Content-Type': 'application/json' },
-          body: JSON.stringify({ 
-            env_name: envName,
-            output_file: outputYml,
-            output_md: outputMd
-          })
-        });
-        if (!res.ok) {
-          const err = await res.json().catch(() => ({}));
-          throw new Error(err.detail || `HTTP ${res.status}`);
-        }
-        const data = await res.json();
-        addLog(data.message);
-        alert(`✅ 导出成功！\nYAML文件: ${data.files.yml}\nMD指南: ${data.files.md}`);
-      } catch (err) {
-        addLog(`❌ 导出失败: ${err.message}`, true);
-      }
-    }
+@app.get("/pip/wheels")
+async def pip_wheel_cache_status():
+    """pip 阶段共用的 wheel 缓存状态（目录、wheel 数量与总字节数、并行获取份数）"""
+    return await asyncio.to_thread(pip_stage.status)
 
-    // 删除环境
-    async function deleteEnv(name) {
-      if (!confirm(`确定要删除环境 "${name}" 吗？此操作不可逆！`)) return;
-      try {
-        const res = await fetch(`${API_BASE}/envs/${encodeURIComponent(name)}`, {
-          method: 'DELETE'
-        });
-        if (!res.ok) {
-          const err = await res.json().catch(() => ({}));
-          throw new Error(err.detail || `HTTP ${res.status}`);
-        }
-        const data = await res.json();
-        addLog(data.message);
-        
-        // 启动进度跟踪
-        if (data.task_id) {
-          startProgressTracking(data.task_id, '删除环境');
-        }
-      } catch (err) {
-        addLog(`❌ 删除失败: ${err.message}`, true);
-      }
-    }
 
-    // 进度条相关
-    let currentProgressTaskId = null;
-    let progressPollingInterval = null;
-
-    function startProgressTracking(taskId, taskType) {
-      currentProgressTaskId = taskId;
-      const progressContainer = document.getElementById('progressContainer');
-      const progressBar = document.getElementById('progressBar');
-      const progressText = document.getElementById('progressText');
-      const progressStage = document.getElementById('progressStage');
-      
-      progressContainer.classList.add('active');
-      progressBar.style.width = '0%';
-      progressText.textContent = '0%';
-      progressStage.textContent = `正在${taskType}...`;
-      
-      // 停止之前的轮询
-      if (progressPollingInterval) {
-        clearInterval(progressPollingInterval);
-      }
-      
-      // 开始轮询进度
-      progressPollingInterval = setInterval(async () => {
-        try {
-          const res = await fetch(`${API_BASE}/tasks/${taskId}`);
-          if (!res.ok) return;
-          const data = await res.json();
-          
-          progressBar.style.width = data.progress + '%';
-          progressText.textContent = data.progress + '%';
-          progressStage.textContent = data.stage || '处理中...';
-          
-          // 任务完成或失败
-          if (data.status === 'completed') {
-            clearInterval(progressPollingInterval);
-            progressBar.style.background = 'linear-gradient(90deg, #28a745, #48c764)';
-            setTimeout(() => {
-              progressContainer.classList.remove('active');
-              progressBar.style.background = 'linear-gradient(90deg, #4e73df, #6f8feb)';
-              loadEnvs();
-            }, 2000);
-          } else if (data.status === 'failed') {
-            clearInterval(progressPollingInterval);
-            progressBar.style.background = 'linear-gradient(90deg, #dc3545, #e4606d)';
-            progressStage.textContent = data.stage;
-          }
-        } catch (e) {
-          // 忽略轮询错误
-        }
-      }, 1000);
-    }
+@app.get("/logs")
+async def get_logs():
+    """获取最新 100 条日志"""
+    return {"logs": recent_logs.recent(100)}
 
-    // 日志相关
-    function addLog(message, isError = false) {
-      const container = document.getElementById('logContainer');
-      const div = document.createElement('div');
-      div.className = `log-entry${isError ? ' log-error' : ''}`;
-      div.textContent = `[${new Date().toLocaleTimeString()}] ${message}`;
-      container.appendChild(div);
-      container.scrollTop = container.scrollHeight;
-    }
 
-    function clearLogs() {
-      document.getElementById('logContainer').innerHTML = '';
-    }
+def parse_time(value: Optional[str]) -> Optional[float]:
+    """时间参数：时间戳（秒）、ISO 8601 时间，或相对时间如 30m / 12h / 7d（表示距今）"""
+    if not value:
+        return None
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    try:
+        if value[-1] in units and value[:-1].replace(".", "", 1).isdigit():
+            return time.time() - float(value[:-1]) * units[value[-1]]
+        if value.replace(".", "", 1).isdigit():
+            return float(value)
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"无法解析的时间: {value}")
+
+
+@app.get("/logs/search")
+async def search_logs(task_id: Optional[str] = None, env: Optional[str] = None, level: Optional[str] = None,
+                      failed: bool = False, since: Optional[str] = None, until: Optional[str] = None,
+                      q: Optional[str] = None, limit: int = 500):
+    """
+    检索磁盘日志归档，按时间倒序返回最多 limit 条
+    例：?task_id=X（任务 X 的全部输出）、?env=Y&failed=true&since=7d（环境 Y 最近一周的失败）
+    """
+    if log_store is None:
+        raise HTTPException(status_code=404, detail="磁盘日志归档未启用（LOG_ARCHIVE=0）")
+    results = await asyncio.to_thread(
+        log_store.search,
+        task_id=task_id,
+        env=env,
+        level="ERROR" if failed else (level.upper() if level else None),
+        since=parse_time(since),
+        until=parse_time(until),
+        text=q,
+        limit=max(1, min(limit, 5000)),
+    )
+    return {"count": len(results), "logs": results}
 
-    function escapeHtml(text) {
-      const map = { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#039;' };
-      return text.replace(/[&<>"']/g, m => map[m]);
-    }
 
-    // 初始化
-    loadEnvs();
-
-    // 轮询日志
-    setInterval(async () => {
-      try {
-        const res = await fetch(`${API_BASE}/logs`);
-        if (res.ok) {
-          const data = await res.json();
-          const container = document.getElementById('logContainer');
-          const existingText = container.innerText;
-          data.logs.forEach(msg => {
-            if (!existingText.includes(msg)) {
-              addLog(msg, msg.includes('[ERROR]'));
-            }
-          });
-        }
-      } catch (e) {}
-    }, 5000);
-  </script>
-</body>
-</html>
-        """)
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 格式的运行指标"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+# ========================
+# 静态文件与首页
+# ========================
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+INDEX_FILE = os.path.join(STATIC_DIR, "index.html")
 
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
@@ -1538,62 +1744,43 @@ async def index():
     return FileResponse(INDEX_FILE)
 
 
-# ========================
-# 新增：命令行调用导出功能（兼容原有 conda_export_env.py 的使用方式）
-# ========================
-def cli_export():
-    """命令行导出环境（兼容原脚本的参数）"""
-    import argparse
-    parser = argparse.ArgumentParser()
-    parser.add_argument("--env", "-e")
-    parser.add_argument("--output", "-o", default="environment.yml")
-    parser.add_argument("--md-output", "-m", default="使用yml之前先看.md")
-    args = parser.parse_args()
-
-    result = export_conda_env(
-        env_name=args.env,
-        output_file=args.output,
-        output_md=args.md_output
-    )
-
-    print(result["msg"])
-    if result["status"] == "failed":
-        sys.exit(1)
-    sys.exit(0)
-
-
 # ========================
 # 启动服务
 # ========================
 if __name__ == "__main__":
-    # 支持两种运行模式：API服务 / 命令行导出
-    if len(sys.argv) > 1 and (sys.argv[1].startswith("--env") or sys.argv[1].startswith("-e") or
-                              sys.argv[1].startswith("--output") or sys.argv[1].startswith("-o")):
-        # 命令行导出模式（兼容原 conda_export_env.py）
-        cli_export()
-    else:
-        # API服务模式
-        try:
-            import uvicorn
-        except ImportError:
-            print("❌ 未安装 uvicorn 或 fastapi")
-            print("请运行：pip install fastapi uvicorn pyyaml")
-            input("\n按回车键退出...")
-            sys.exit(1)
+    # API服务模式（命令行导出模式已在文件开头分流）
+    try:
+        import uvicorn
+    except ImportError:
+        print("❌ 未安装 uvicorn 或 fastapi")
+        print("请运行：pip install fastapi uvicorn pyyaml")
+        input("\n按回车键退出...")
+        sys.exit(1)
+    import threading
+    import webbrowser
 
-        HOST = "127.0.0.1"
-        PORT = 8000
-        URL = f"http://{HOST}:{PORT}"
+    HOST = "127.0.0.1"
+    PORT = 8000
+    URL = f"http://{HOST}:{PORT}"
 
 
-        def open_browser():
-            webbrowser.open(URL)
+    def open_browser():
+        webbrowser.open(URL)
 
 
-        print(f"🚀 启动 Conda 环境管理 Web 服务...")
-        print(f"🌐 访问地址: {URL}")
-        print(f"📄 Swagger 文档: {URL}/docs")
-        print(f"💡 命令行导出用法: python {sys.argv[0]} --env 环境名 --output 输出.yml")
-        threading.Timer(1.0, open_browser).start()
+    print(f"🚀 启动 Conda 环境管理 Web 服务...")
+    print(f"🌐 访问地址: {URL}")
+    print(f"📄 Swagger 文档: {URL}/docs")
+    print(f"💡 命令行导出用法: python conda_export_env.py --env 环境名 --output 输出.yml")
+    threading.Timer(1.0, open_browser).start()
 
+    # 多 worker：任务、去重、清单缓存与最近日志经共享状态（STATE_STORE=sqlite）在 worker 间可见；
+    # /metrics 仍是各 worker 自己的计数
+    WORKERS = int(os.environ.get("API_WORKERS", "1"))
+    if WORKERS > 1:
+        if isinstance(state, MemoryStateStore):
+            print("⚠️ STATE_STORE=memory 时各 worker 状态互不可见，多 worker 请使用 sqlite")
+        uvicorn.run("main_api:app", host=HOST, port=PORT, log_level="info", workers=WORKERS,
+                    app_dir=os.path.dirname(os.path.abspath(__file__)))
+    else:
         uvicorn.run(app, host=HOST, port=PORT, log_level="info")
\ No newline at end of file